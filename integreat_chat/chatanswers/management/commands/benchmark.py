@@ -0,0 +1,72 @@
+"""
+Benchmark the endpoints offline against fake LiteLLM, OpenSearch and CMS services
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from integreat_chat.core.utils.benchmark import SCENARIOS, Benchmark
+from integreat_chat.core.utils.fake_services import LatencyDistribution
+
+
+class Command(BaseCommand):
+    """
+    Send requests to extract_answer, search_documents and translate_message
+    at a controlled concurrency and report throughput and latency percentiles.
+    Backing services are replaced by local fakes, latencies are given as
+    "median" or "median:sigma" of a log-normal distribution in seconds.
+    """
+    help = "Benchmark endpoints against local fake services"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenarios", type=str, nargs="*",
+            help=f"scenarios to run, default all of {', '.join(SCENARIOS)}"
+        )
+        parser.add_argument("--requests", type=int, default=100)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--llm-latency", type=LatencyDistribution.parse, default="0.8:0.5")
+        parser.add_argument(
+            "--opensearch-latency", type=LatencyDistribution.parse, default="0.05:0.3"
+        )
+        parser.add_argument("--cms-latency", type=LatencyDistribution.parse, default="0.05:0.3")
+        parser.add_argument(
+            "--inference-latency", type=LatencyDistribution.parse, default="0.2:0.3"
+        )
+        parser.add_argument(
+            "--with-caches", action="store_true",
+            help="keep response caches and single-flight enabled and repeat messages"
+        )
+        parser.add_argument("--output", type=str, help="write results as JSON to this file")
+
+    def handle(self, *args, **options):
+        scenarios = options["scenarios"] or list(SCENARIOS)
+        if unknown := set(scenarios) - set(SCENARIOS):
+            raise CommandError(f"Unknown scenarios {', '.join(unknown)}")
+        benchmark = Benchmark(
+            latencies={
+                "llm": options["llm_latency"],
+                "opensearch": options["opensearch_latency"],
+                "cms": options["cms_latency"],
+                "inference": options["inference_latency"],
+            },
+            concurrency=options["concurrency"],
+            requests=options["requests"],
+            with_caches=options["with_caches"],
+        )
+        results = benchmark.run(scenarios)
+        for scenario, result in results.items():
+            self.stdout.write(
+                f"{scenario}: {result['requests']} requests, {result['errors']} errors, "
+                f"concurrency {options['concurrency']}\n"
+                f"  throughput: {result['throughput']:.2f} req/s\n"
+                f"  latency mean: {result['mean']:.3f}s, p50: {result['p50']:.3f}s, "
+                f"p95: {result['p95']:.3f}s, p99: {result['p99']:.3f}s\n"
+                f"  backend requests: " + ", ".join(
+                    f"{name} {count}" for name, count in result["backend_requests"].items()
+                )
+            )
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                json.dump(results, output, indent=2)
@@ -0,0 +1,131 @@
+"""
+Compare answers of the model tiers for routed prompts
+"""
+
+import json
+import time
+from collections import defaultdict
+
+import asyncio
+import aiohttp
+import numpy
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from integreat_chat.chatanswers.services.llmapi import (
+    LlmApiClient, LlmMessage, LlmPrompt, LlmResponse
+)
+from integreat_chat.chatanswers.services.model_router import ModelRouter
+from integreat_chat.chatanswers.static.prompts import Prompts
+from integreat_chat.translate.static.prompts import Prompts as TranslatePrompts
+
+
+def build_prompt(model: str, prompt_type: str, inputs: list[str]) -> LlmPrompt:
+    """
+    Build the prompt like the services do
+
+    param model: LLM model
+    param prompt_type: name of the prompt in Prompts
+    param inputs: values that are filled into the prompt template
+    """
+    if prompt_type == "LANGUAGE_CLASSIFICATION":
+        return LlmPrompt(
+            model,
+            [
+                LlmMessage(TranslatePrompts.LANGUAGE_CLASSIFICATION, role="system"),
+                LlmMessage(inputs[0], role="user"),
+            ],
+            json_schema=TranslatePrompts.LANGUAGE_CLASSIFICATION_SCHEMA,
+            prompt_type=prompt_type,
+        )
+    if prompt_type not in Prompts.TASKS:
+        raise CommandError(f"Unknown prompt type {prompt_type}")
+    messages = [LlmMessage(getattr(Prompts, prompt_type).format(*inputs))]
+    if prompt_type in ("RELEVANCE_CHECK", "OPTIMIZE_MESSAGE"):
+        messages.insert(0, LlmMessage(Prompts.CHECK_SYSTEM_PROMPT, role="system"))
+    return LlmPrompt(model, messages, prompt_type=prompt_type)
+
+
+class Command(BaseCommand):
+    """
+    Run a labeled or unlabeled set of prompts against the small and the large
+    model tier and report agreement, escalation rate and latency per prompt type.
+    """
+    help = "Benchmark agreement of model tiers for routed prompts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "dataset", type=str,
+            help='JSONL file with {"prompt_type": "CHECK_QUESTION", "inputs": ["..."]} per line'
+        )
+        parser.add_argument("--small", type=str, default=settings.LLM_MODEL_TIERS["small"])
+        parser.add_argument("--large", type=str, default=settings.LLM_MODEL_TIERS["large"])
+        parser.add_argument("--concurrency", type=int, default=4)
+
+    def handle(self, *args, **options):
+        with open(options["dataset"], encoding="utf-8") as dataset:
+            records = [json.loads(line) for line in dataset if line.strip()]
+        if not records:
+            raise CommandError("Empty dataset")
+        results = asyncio.run(self.run_benchmark(
+            records, options["small"], options["large"], options["concurrency"]
+        ))
+        self.report(results)
+
+    async def run_benchmark(
+            self, records: list[dict], small: str, large: str, concurrency: int
+        ) -> list[dict]:
+        """
+        Prompt both models for every record, bypassing cache and escalation
+        """
+        llm_api = LlmApiClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(session, prompt):
+            start = time.monotonic()
+            response = await llm_api.request_completion(session, prompt)
+            return str(LlmResponse(response)), time.monotonic() - start
+
+        async def compare(session, record):
+            async with semaphore:
+                prompt_type = record["prompt_type"]
+                small_answer, small_latency = await timed(
+                    session, build_prompt(small, prompt_type, record["inputs"])
+                )
+                large_answer, large_latency = await timed(
+                    session, build_prompt(large, prompt_type, record["inputs"])
+                )
+            return {
+                "prompt_type": prompt_type,
+                "small": ModelRouter.parse_answer(prompt_type, small_answer),
+                "large": ModelRouter.parse_answer(prompt_type, large_answer),
+                "small_latency": small_latency,
+                "large_latency": large_latency,
+            }
+
+        async with aiohttp.ClientSession() as session:
+            return await asyncio.gather(*[compare(session, record) for record in records])
+
+    def report(self, results: list[dict]) -> None:
+        """
+        Print agreement per prompt type. Unclear small model answers are
+        escalated, so the routed agreement counts them as agreeing.
+        """
+        grouped = defaultdict(list)
+        for result in results:
+            grouped[result["prompt_type"]].append(result)
+        for prompt_type, group in grouped.items():
+            unclear = [result for result in group if result["small"] is None]
+            agreeing = [
+                result for result in group
+                if result["small"] is not None and result["small"] == result["large"]
+            ]
+            self.stdout.write(
+                f"{prompt_type} ({ModelRouter.get_task(prompt_type)}), {len(group)} samples\n"
+                f"  agreement small/large: {len(agreeing) / len(group):.1%}\n"
+                f"  escalation rate: {len(unclear) / len(group):.1%}\n"
+                f"  routed agreement: {(len(agreeing) + len(unclear)) / len(group):.1%}\n"
+                f"  median latency small: "
+                f"{numpy.median([result['small_latency'] for result in group]):.2f}s, "
+                f"large: {numpy.median([result['large_latency'] for result in group]):.2f}s"
+            )
@@ -0,0 +1,26 @@
+"""
+Run the local inference worker
+"""
+
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from integreat_chat.core.utils.inference_worker import serve
+
+
+class Command(BaseCommand):
+    """
+    Serve translations and embeddings for all web workers of this host. Set
+    INFERENCE_WORKER_URL in the web workers to use it.
+    """
+    help = "Run the inference worker for translations and embeddings"
+
+    def add_arguments(self, parser):
+        url = urlparse(settings.INFERENCE_WORKER_URL or "http://127.0.0.1:8765")
+        parser.add_argument("--host", type=str, default=url.hostname)
+        parser.add_argument("--port", type=int, default=url.port)
+
+    def handle(self, *args, **options):
+        serve(options["host"], options["port"])
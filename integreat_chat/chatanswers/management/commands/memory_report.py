@@ -0,0 +1,129 @@
+"""
+Report unique and shared memory of the server processes
+"""
+
+import os
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from integreat_chat.core.utils.model_registry import ModelRegistry
+
+SMAPS_FIELDS = ["Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"]
+
+
+def read_smaps_rollup(pid: int) -> dict[str, int]:
+    """
+    Read memory counters of a process in KiB
+
+    param pid: process ID
+    """
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as smaps:
+        for line in smaps:
+            name, _, value = line.partition(":")
+            if name in SMAPS_FIELDS:
+                values[name] = int(value.split()[0])
+    return values
+
+
+def find_processes(pattern: str) -> list[tuple[int, int, str]]:
+    """
+    Find processes whose command line contains a pattern
+
+    param pattern: substring of the command line
+    return: list of PID, parent PID and command line
+    """
+    processes = []
+    for proc in Path("/proc").iterdir():
+        if not proc.name.isdigit() or int(proc.name) == os.getpid():
+            continue
+        try:
+            cmdline = (proc / "cmdline").read_bytes().replace(b"\0", b" ").decode().strip()
+            ppid = int((proc / "stat").read_text(encoding="utf-8").rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if pattern in cmdline:
+            processes.append((int(proc.name), ppid, cmdline))
+    return sorted(processes)
+
+
+def measure_models(names: list[str]) -> dict[str, int]:
+    """
+    Load models in this process and measure the resident memory each one adds
+
+    param names: names of models in the ModelRegistry
+    return: KiB of resident memory per model
+    """
+    sizes = {}
+    for name in names:
+        before = read_smaps_rollup(os.getpid())["Rss"]
+        ModelRegistry.get(name)
+        sizes[name] = max(read_smaps_rollup(os.getpid())["Rss"] - before, 0)
+    return sizes
+
+
+class Command(BaseCommand):
+    """
+    Show per process unique memory (private pages) and shared memory (pages
+    shared copy-on-write with the master or other workers). With MODEL_PRELOAD
+    the models should show up as shared memory of the workers. With --models,
+    the models are loaded in this process to show the memory of each model.
+    """
+    help = "Report unique vs. shared memory of server processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pattern", type=str, default="integreat_chat",
+            help="substring of the command line of the server processes"
+        )
+        parser.add_argument("--pid", type=int, action="append", help="process IDs to report")
+        parser.add_argument(
+            "--models", action="store_true",
+            help="load the models in this process and report the memory per model"
+        )
+
+    def handle(self, *args, **options):
+        if options["models"]:
+            self.report_models()
+            return
+        if options["pid"]:
+            processes = [(pid, 0, "") for pid in options["pid"]]
+        else:
+            processes = find_processes(options["pattern"])
+        if not processes:
+            raise CommandError("No matching processes found")
+        pids = {pid for pid, _, _ in processes}
+        total_unique = total_pss = 0
+        self.stdout.write(
+            f"{'PID':>8} {'PPID':>8} {'RSS MiB':>9} {'PSS MiB':>9} "
+            f"{'unique MiB':>11} {'shared MiB':>11}  role"
+        )
+        for pid, ppid, _ in processes:
+            try:
+                memory = read_smaps_rollup(pid)
+            except OSError as exc:
+                self.stderr.write(f"Skipping {pid}: {exc}")
+                continue
+            unique = memory["Private_Clean"] + memory["Private_Dirty"]
+            shared = memory["Shared_Clean"] + memory["Shared_Dirty"]
+            total_unique += unique
+            total_pss += memory["Pss"]
+            self.stdout.write(
+                f"{pid:>8} {ppid:>8} {memory['Rss'] / 1024:>9.1f} {memory['Pss'] / 1024:>9.1f} "
+                f"{unique / 1024:>11.1f} {shared / 1024:>11.1f}  "
+                f"{'worker' if ppid in pids else 'master'}"
+            )
+        self.stdout.write(
+            f"Total PSS: {total_pss / 1024:.1f} MiB, total unique: {total_unique / 1024:.1f} MiB"
+        )
+
+    def report_models(self) -> None:
+        """
+        Print the resident memory of every model of the ModelRegistry
+        """
+        sizes = measure_models(list(ModelRegistry.loaders))
+        self.stdout.write(f"{'model':<20} {'RSS MiB':>9}")
+        for name, size in sizes.items():
+            self.stdout.write(f"{name:<20} {size / 1024:>9.1f}")
+        self.stdout.write(f"Total models: {sum(sizes.values()) / 1024:.1f} MiB")
@@ -0,0 +1,137 @@
+"""
+Replay a captured traffic trace against a running instance
+"""
+
+import json
+import time
+from collections import Counter, defaultdict
+
+import asyncio
+import aiohttp
+import numpy
+from django.core.management.base import BaseCommand, CommandError
+
+from integreat_chat.core.utils.benchmark import SCENARIOS, Benchmark
+from integreat_chat.core.utils.traffic_capture import build_replay_payload
+
+
+class Command(BaseCommand):
+    """
+    Re-issue the requests of a trace captured with TRAFFIC_CAPTURE at their
+    original pace or scaled by --speed. Requests are sent open-loop, i.e. on
+    schedule regardless of pending responses, so overload shows up as growing
+    latencies and errors. Messages are replaced by synthetic messages with the
+    captured length, repeated messages stay repeated.
+    """
+    help = "Replay captured traffic and report latency and error distributions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("trace", type=str, help="JSONL file written by TRAFFIC_CAPTURE")
+        parser.add_argument("--url", type=str, default="http://127.0.0.1:8000")
+        parser.add_argument(
+            "--speed", type=float, default=1.0,
+            help="rate factor, 2 replays the trace twice as fast"
+        )
+        parser.add_argument("--endpoints", type=str, nargs="+", choices=list(SCENARIOS))
+        parser.add_argument("--limit", type=int, help="replay only the first N requests")
+        parser.add_argument("--timeout", type=float, default=120)
+        parser.add_argument("--output", type=str, help="write results as JSON to this file")
+
+    def handle(self, *args, **options):
+        if options["speed"] <= 0:
+            raise CommandError("--speed has to be positive")
+        with open(options["trace"], encoding="utf-8") as trace:
+            records = [json.loads(line) for line in trace if line.strip()]
+        records = sorted(
+            (
+                record for record in records
+                if record["endpoint"] in (options["endpoints"] or SCENARIOS)
+            ),
+            key=lambda record: record["timestamp"],
+        )[:options["limit"]]
+        if not records:
+            raise CommandError("No requests to replay")
+        results = asyncio.run(self.replay(
+            records, options["url"].rstrip("/"), options["speed"], options["timeout"]
+        ))
+        report = self.report(records, results)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                json.dump(report, output, indent=2)
+
+    async def replay(
+            self, records: list[dict], url: str, speed: float, timeout: float
+        ) -> list[dict]:
+        """
+        Send every record at its scheduled time
+        """
+        first_timestamp = records[0]["timestamp"]
+        start = time.monotonic()
+
+        async def send(session: aiohttp.ClientSession, record: dict) -> dict:
+            delay = (record["timestamp"] - first_timestamp) / speed - (time.monotonic() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sent = time.monotonic()
+            try:
+                async with session.post(
+                    f"{url}{SCENARIOS[record['endpoint']]}",
+                    json=build_replay_payload(record),
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                ) as response:
+                    body = await response.json(content_type=None)
+                    status = (
+                        "error" if response.status == 200 and body.get("status") == "error"
+                        else str(response.status)
+                    )
+            except asyncio.TimeoutError:
+                status = "timeout"
+            except (aiohttp.ClientError, ValueError):
+                status = "connection_error"
+            return {
+                "endpoint": record["endpoint"],
+                "status": status,
+                "latency": time.monotonic() - sent,
+                "sent": sent - start,
+                "finished": time.monotonic() - start,
+            }
+
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+            return await asyncio.gather(*[send(session, record) for record in records])
+
+    def report(self, records: list[dict], results: list[dict]) -> dict:
+        """
+        Print and return latency percentiles and status distribution per endpoint,
+        compared to the latencies captured in production
+        """
+        captured = defaultdict(list)
+        for record in records:
+            captured[record["endpoint"]].append(record["duration"])
+        grouped = defaultdict(list)
+        for result in results:
+            grouped[result["endpoint"]].append(result)
+        report = {}
+        for endpoint, group in grouped.items():
+            summary = Benchmark.summarize(
+                [(result["latency"], result["status"] == "200") for result in group],
+                max(result["finished"] for result in group)
+                - min(result["sent"] for result in group),
+            )
+            summary["statuses"] = dict(Counter(result["status"] for result in group))
+            summary["captured_p50"], summary["captured_p95"] = (
+                float(value) for value in numpy.percentile(captured[endpoint], [50, 95])
+            )
+            report[endpoint] = summary
+            self.stdout.write(
+                f"{endpoint}: {summary['requests']} requests, {summary['errors']} errors "
+                f"({summary['errors'] / summary['requests']:.1%})\n"
+                f"  throughput: {summary['throughput']:.2f} req/s\n"
+                f"  latency mean: {summary['mean']:.3f}s, p50: {summary['p50']:.3f}s, "
+                f"p95: {summary['p95']:.3f}s, p99: {summary['p99']:.3f}s\n"
+                f"  captured p50: {summary['captured_p50']:.3f}s, "
+                f"p95: {summary['captured_p95']:.3f}s\n"
+                f"  statuses: " + ", ".join(
+                    f"{status} {count}" for status, count in sorted(summary["statuses"].items())
+                )
+            )
+        return report
@@ -6,8 +6,12 @@ import logging
 import asyncio
 import aiohttp
 
+from asgiref.sync import async_to_sync, sync_to_async
 from django.conf import settings
 
+from integreat_chat.core.utils.inference_client import InferenceUnavailableError
+from integreat_chat.core.utils.metrics import stage
+from integreat_chat.core.utils.single_flight import SingleFlight
 from integreat_chat.search.services.search import SearchService
 from integreat_chat.search.utils.search_request import SearchRequest
 from integreat_chat.translate.services.language import LanguageService
@@ -15,8 +19,12 @@ from integreat_chat.translate.services.language import LanguageService
 from ..static.prompts import Prompts
 from ..static.messages import Messages
 from ..utils.rag_response import RagResponse
+from ..utils.context_builder import ContextBuilder
 from ..utils.rag_request import RagRequest
+from .answer_cache import AnswerCache
+from .llm_resilience import LlmUnavailableError
 from .llmapi import LlmApiClient, LlmMessage, LlmPrompt, LlmResponse
+from .model_router import ModelRouter
 
 LOGGER = logging.getLogger("django")
 
@@ -32,23 +40,36 @@ class AnswerService:
         param language: Integreat CMS language slug
         """
         self.rag_request = rag_request
-        self.language = rag_request.use_language
         self.region = rag_request.region
-        self.llm_model_name = settings.RAG_MODEL
+        self.llm_model_name = ModelRouter.get_model("RAG")
         self.llm_api = LlmApiClient()
 
-    def skip_rag_answer(self, message: str, language_service: LanguageService) -> bool:
+    @property
+    def language(self) -> str:
         """
-        Check if a chat message is a question
+        RAG language, detection is delayed until it is needed
+        """
+        return self.rag_request.use_language
+
+    async def skip_rag_answer(
+            self, message: str, language_service: LanguageService
+        ) -> RagResponse | None:
+        """
+        Check if a chat message is a question. Both checks run concurrently.
 
         param message: a user message
         return: indication if the message needs an answer
         """
-        if self.detect_request_human():
+        requests_human, answer = await asyncio.gather(
+            self.detect_request_human(),
+            self.llm_api.asimple_prompt(
+                Prompts.CHECK_QUESTION.format(message), prompt_type="CHECK_QUESTION"
+            ),
+        )
+        if requests_human:
             message = Messages.TALK_TO_HUMAN
         else:
-            answer = self.llm_api.simple_prompt(Prompts.CHECK_QUESTION.format(message))
-            if answer.startswith("Yes"):
+            if answer.lower().startswith("yes"):
                 LOGGER.debug("Message requires response.")
                 return None
             message = Messages.NOT_QUESTION
@@ -56,13 +77,13 @@ class AnswerService:
         return RagResponse(
             [],
             self.rag_request,
-            language_service.translate_message(
+            await language_service.atranslate_message(
                 "en", self.language, message
             ),
             False,
         )
 
-    def get_documents(self) -> list:
+    async def get_documents(self) -> list:
         """
         Retrieve documents for RAG
         """
@@ -74,59 +95,146 @@ class AnswerService:
             },
             True
         )
-        search = SearchService(search_request, deduplicate_results=True)
-        search_results = search.search_documents(
-            settings.RAG_MAX_PAGES * 2,
-            include_text=True,
-            min_score=settings.RAG_SCORE_THRESHOLD,
-        ).documents
+        search = SearchService(
+            search_request, deduplicate_results=True, query_variants=[str(self.rag_request)]
+        )
+        with stage("retrieval"):
+            search_results = (await search.asearch_documents(
+                settings.RAG_MAX_PAGES * 2,
+                include_text=True,
+                min_score=settings.RAG_SCORE_THRESHOLD,
+            )).documents
         LOGGER.debug("Number of retrieved documents: %i", len(search_results))
         if settings.RAG_RELEVANCE_CHECK:
-            search_results = asyncio.run(self.check_documents_relevance(
-                str(self.rag_request), search_results)
-            )
+            with stage("relevance_check"):
+                search_results = await self.check_documents_relevance(
+                    str(self.rag_request), search_results
+                )
             LOGGER.debug("Number of documents after relevance check: %i", len(search_results))
         return search_results[:settings.RAG_MAX_PAGES]
 
     def extract_answer(self) -> RagResponse:
         """
-        Create summary answer for question
+        Create summary answer for question. Sync wrapper for aextract_answer().
 
         return: a dict containing a response and sources
         """
+        return async_to_sync(self.aextract_answer)()
+
+    async def aextract_answer(self) -> RagResponse:
+        """
+        Create summary answer for question. Identical concurrent requests
+        are answered only once. Followers take the language detection,
+        translation and optimization of the message from the leader.
+
+        return: a dict containing a response and sources
+        """
+        single_flight = SingleFlight("answer", [
+            self.region, self.rag_request.gui_language, self.rag_request.original_message
+        ])
+
+        async def answer():
+            payload = (await self.generate_answer()).as_payload()
+            return {**payload, "request": self.rag_request.get_prepared()}
+
+        payload = await single_flight.run(answer)
+        self.rag_request.restore_prepared(payload["request"])
+        await self.rag_request.prepare()
+        return RagResponse.from_payload(payload, self.rag_request)
+
+    async def generate_answer(self) -> RagResponse:
+        """
+        Run the RAG pipeline for the question. Answer with a canned message
+        if the LLM backend or the inference worker is unavailable.
+
+        return: a dict containing a response and sources
+        """
+        try:
+            return await self.run_pipeline()
+        except (LlmUnavailableError, InferenceUnavailableError) as exc:
+            LOGGER.warning("Answering with canned message: %s", exc)
+            # keep the message as it is if the inference worker could not translate it
+            self.rag_request.restore_prepared({
+                "likely_message_language": self.rag_request.gui_language,
+                "translated_message": self.rag_request.original_message,
+                "optimized_message": self.rag_request.original_message,
+                **self.rag_request.get_prepared(),
+            })
+            try:
+                message = await LanguageService().atranslate_message(
+                    "en", self.language, Messages.SERVICE_UNAVAILABLE
+                )
+            except InferenceUnavailableError:
+                message = Messages.SERVICE_UNAVAILABLE
+            return RagResponse([], self.rag_request, message)
+
+    async def run_pipeline(self) -> RagResponse:
+        """
+        Retrieve documents and generate the answer. CPU-bound steps run in
+        executors to keep the event loop responsive.
+
+        return: a dict containing a response and sources
+        """
+        # look up the original message, so hits skip the LLM calls of the preparation and checks
+        answer_cache = AnswerCache(
+            self.region, self.rag_request.gui_language, self.rag_request.original_message
+        )
+        if settings.RAG_ANSWER_CACHE:
+            with stage("answer_cache_lookup"):
+                cached_answer = await sync_to_async(
+                    answer_cache.lookup, thread_sensitive=False
+                )()
+            if cached_answer:
+                answer, documents, prepared = cached_answer
+                self.rag_request.restore_prepared(prepared)
+                return RagResponse(documents, self.rag_request, answer)
+
+        with stage("prepare_request"):
+            await self.rag_request.prepare()
         question = str(self.rag_request)
         language_service = LanguageService()
 
-        if response := self.skip_rag_answer(question, language_service):
+        with stage("question_checks"):
+            response = await self.skip_rag_answer(question, language_service)
+        if response:
             return response
 
         LOGGER.debug("Retrieving documents.")
-        documents = self.get_documents()
+        documents = await self.get_documents()
         LOGGER.debug("Retrieved %s documents.", len(documents))
 
-        context = "\n".join([result.content for result in documents])[
-            : settings.RAG_CONTEXT_MAX_LENGTH
-        ]
         if not documents:
             return RagResponse(
                 documents,
                 self.rag_request,
-                language_service.translate_message(
+                await language_service.atranslate_message(
                     "en", self.language, Messages.NO_ANSWER
                 ),
             )
+        with stage("context"):
+            # loading the tokenizer must not block the event loop
+            context_builder = await sync_to_async(ContextBuilder, thread_sensitive=False)()
+            context = await sync_to_async(context_builder.build, thread_sensitive=False)(documents)
         LOGGER.debug("Generating answer.")
-        answer = self.llm_api.simple_prompt(
-            Prompts.RAG.format(self.language, question, context)
-        )
+        with stage("generation"):
+            answer = await self.llm_api.asimple_prompt(
+                Prompts.RAG.format(self.language, question, context), prompt_type="RAG"
+            )
         LOGGER.debug(
             "Finished generating answer. Question: %s\nAnswer: %s", question, answer
         )
-        return RagResponse(documents, self.rag_request, answer)
+        if settings.RAG_ANSWER_CACHE:
+            await sync_to_async(answer_cache.store, thread_sensitive=False)(
+                answer, documents, self.rag_request.get_prepared()
+            )
+        return RagResponse(
+            documents, self.rag_request, answer, context_tokens=context_builder.tokens_used
+        )
 
     async def check_documents_relevance(self, question: str, search_results: list) -> bool:
         """
-        Check if the retrieved documents are relevant for answering the question
+        Check if the retrieved documents are relevant for answering the question.
+        Documents are kept if their check failed because the LLM is unavailable or overloaded.
 
         param question: a message/question from a user
         param content: a page content that could be relevant for answering the question
@@ -140,24 +248,35 @@ class AnswerService:
                 tasks.append(
                     asyncio.create_task(self.llm_api.chat_prompt(
                         session,
-                        LlmPrompt(settings.RAG_RELEVANCE_CHECK_MODEL, [sys_message, message])
+                        LlmPrompt(
+                            ModelRouter.get_model("RELEVANCE_CHECK"),
+                            [sys_message, message],
+                            prompt_type="RELEVANCE_CHECK",
+                        )
                     )
                 ))
-            llmresponses = await asyncio.gather(*tasks)
+            llmresponses = await asyncio.gather(*tasks, return_exceptions=True)
         kept_documents = []
         for i, response in enumerate(llmresponses):
+            if isinstance(response, LlmUnavailableError):
+                kept_documents.append(search_results[i])
+                continue
+            if isinstance(response, BaseException):
+                raise response
             llm_response = LlmResponse(response)
             if str(llm_response).lower().startswith("yes"):
                 kept_documents.append(search_results[i])
         return kept_documents
 
-    def detect_request_human(self) -> bool:
+    async def detect_request_human(self) -> bool:
         """
         Check if the user requests to talk to a human counselor or is asking a question
         return: bool that indicates if the user requests a human or not
         """
         query = str(self.rag_request)
         LOGGER.debug("Checking if user requests human intervention")
-        response = self.llm_api.simple_prompt(Prompts.HUMAN_REQUEST_CHECK.format(query))
+        response = await self.llm_api.asimple_prompt(
+            Prompts.HUMAN_REQUEST_CHECK.format(query), prompt_type="HUMAN_REQUEST_CHECK"
+        )
         LOGGER.debug("Finished checking if user requests human. Response: %s", response)
         return response.lower().startswith("yes")
@@ -0,0 +1,168 @@
+"""
+Semantic cache for RAG answers
+"""
+
+import logging
+import time
+import uuid
+
+import numpy
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+
+from integreat_chat.core.utils.metrics import CACHE_REQUESTS
+from integreat_chat.search.services.embedding import EmbeddingService
+from integreat_chat.search.utils.index_generation import get_index_generation
+from integreat_chat.search.utils.search_response import Document
+
+LOGGER = logging.getLogger("django")
+
+
+class AnswerCache:
+    """
+    Cache for answers per region and GUI language. Previously answered questions
+    are found by comparing the embedding of the original message with the
+    embeddings of cached messages, so hits skip all LLM calls of the request.
+    Rebuilding a region index of a RAG language invalidates the cache, as the
+    index generations are part of the cache key.
+
+    An index holds the embeddings of all questions, answers and documents are
+    stored in a cache entry per question. Lookups therefore only load the index
+    and the best entry. The index is locked while answers are added.
+    """
+
+    def __init__(self, region: str, language: str, question: str) -> None:
+        """
+        param region: Integreat CMS region slug
+        param language: GUI language slug
+        param question: original user message
+        """
+        self.region = region
+        self.language = language
+        self.question = question
+
+    @cached_property
+    def cache_key(self) -> str:
+        """
+        Cache key of the index for the current generations of the region indices
+        that can be used for answering
+        """
+        generations = "_".join(
+            str(get_index_generation(self.region, language))
+            for language in settings.RAG_SUPPORTED_LANGUAGES
+        )
+        return f"answer_cache_{self.region}_{self.language}_{generations}"
+
+    @cached_property
+    def embedding(self) -> numpy.ndarray:
+        """
+        Normalized embedding of the question
+        """
+        embedding = numpy.array(
+            EmbeddingService().embed_query(self.question), dtype=numpy.float32
+        )
+        norm = numpy.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def get_entries(self) -> list[dict]:
+        """
+        Get the index entries that have not expired yet. Index entries contain
+        the cache key of the answer, the expiry time and the question embedding
+        as float32 bytes.
+        """
+        now = time.time()
+        return [entry for entry in cache.get(self.cache_key, []) if entry["expires"] > now]
+
+    def lookup(self) -> tuple[str, list[Document], dict] | None:
+        """
+        Find the cached answer of the most similar question
+
+        return: answer, source documents and prepared request attributes or None
+                if no question is similar enough
+        """
+        entries = self.get_entries()
+        if not entries:
+            CACHE_REQUESTS.labels(cache="answer", result="miss").inc()
+            return None
+        similarities = numpy.frombuffer(
+            b"".join(entry["embedding"] for entry in entries), dtype=numpy.float32
+        ).reshape(len(entries), -1) @ self.embedding
+        best = int(numpy.argmax(similarities))
+        if similarities[best] < settings.RAG_ANSWER_CACHE_SIMILARITY_THRESHOLD:
+            LOGGER.debug("No cached answer found. Best similarity: %.3f", similarities[best])
+            CACHE_REQUESTS.labels(cache="answer", result="miss").inc()
+            return None
+        if (cached := cache.get(entries[best]["key"])) is None:
+            CACHE_REQUESTS.labels(cache="answer", result="miss").inc()
+            return None
+        CACHE_REQUESTS.labels(cache="answer", result="hit").inc()
+        LOGGER.debug(
+            "Found cached answer for question: %s, similarity: %.3f",
+            cached["question"], similarities[best]
+        )
+        return (
+            cached["answer"],
+            [Document.from_dict(document, self.language) for document in cached["documents"]],
+            cached["request"],
+        )
+
+    def acquire_lock(self, token: str) -> bool:
+        """
+        Lock the index for adding an entry, wait up to the lock timeout
+
+        param token: identifies the holder of the lock
+        """
+        deadline = time.monotonic() + settings.RAG_ANSWER_CACHE_LOCK_TIMEOUT
+        while not cache.add(
+            f"{self.cache_key}_lock", token, settings.RAG_ANSWER_CACHE_LOCK_TIMEOUT
+        ):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def release_lock(self, token: str) -> None:
+        """
+        Release the index lock if it is still held by this request
+        """
+        if cache.get(f"{self.cache_key}_lock") == token:
+            cache.delete(f"{self.cache_key}_lock")
+
+    def store(self, answer: str, documents: list[Document], prepared: dict) -> None:
+        """
+        Add answer for the question to the cache. The oldest entries are
+        dropped if the cache exceeds the maximum number of entries.
+
+        param answer: the generated answer
+        param documents: documents used for generating the answer
+        param prepared: prepared attributes of the request, e.g. its RAG language
+        """
+        entry_key = f"{self.cache_key}_{uuid.uuid4().hex}"
+        cache.set(entry_key, {
+            "question": self.question,
+            "answer": answer,
+            "documents": [document.as_dict() for document in documents],
+            "request": prepared,
+        }, timeout=settings.RAG_ANSWER_CACHE_TTL)
+        token = uuid.uuid4().hex
+        if not self.acquire_lock(token):
+            LOGGER.warning("Answer cache index %s is locked, answer not cached", self.cache_key)
+            return
+        try:
+            entries = self.get_entries()
+            entries.append({
+                "key": entry_key,
+                "embedding": self.embedding.tobytes(),
+                "expires": time.time() + settings.RAG_ANSWER_CACHE_TTL,
+            })
+            dropped = entries[:-settings.RAG_ANSWER_CACHE_MAX_ENTRIES]
+            cache.set(
+                self.cache_key,
+                entries[-settings.RAG_ANSWER_CACHE_MAX_ENTRIES:],
+                timeout=settings.RAG_ANSWER_CACHE_TTL,
+            )
+        finally:
+            self.release_lock(token)
+        if dropped:
+            cache.delete_many([entry["key"] for entry in dropped])
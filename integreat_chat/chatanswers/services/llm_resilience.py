@@ -0,0 +1,145 @@
+"""
+Latency tracking and circuit breaking for the LLM backend
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+import numpy
+from django.conf import settings
+
+LOGGER = logging.getLogger("django")
+
+
+class LlmUnavailableError(Exception):
+    """
+    Raised if the LLM backend can not answer a request
+    """
+
+
+class LatencyTracker:
+    """
+    Track recent latencies of successful requests per model and prompt type
+    to derive the delay after which a request is hedged.
+    """
+    trackers: dict[tuple[str, str | None], "LatencyTracker"] = {}
+    trackers_lock = threading.Lock()
+
+    def __init__(self) -> None:
+        self.latencies = deque(maxlen=settings.LLM_LATENCY_WINDOW)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get(cls, model: str, prompt_type: str | None) -> "LatencyTracker":
+        """
+        Get tracker for a model and prompt type
+        """
+        with cls.trackers_lock:
+            if (model, prompt_type) not in cls.trackers:
+                cls.trackers[(model, prompt_type)] = cls()
+            return cls.trackers[(model, prompt_type)]
+
+    def record(self, latency: float) -> None:
+        """
+        Record latency of a successful request in seconds
+        """
+        with self.lock:
+            self.latencies.append(latency)
+
+    def hedge_delay(self) -> float | None:
+        """
+        p95 latency, but at least LLM_HEDGE_MIN_DELAY. None if there are
+        not enough samples yet.
+        """
+        with self.lock:
+            if len(self.latencies) < settings.LLM_HEDGE_MIN_SAMPLES:
+                return None
+            p95 = float(numpy.percentile(self.latencies, 95))
+        return max(p95, settings.LLM_HEDGE_MIN_DELAY)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker per model. The circuit opens if the error rate within the
+    window exceeds the threshold. While open, requests fail immediately. After
+    the cooldown a single trial request is let through, which closes the
+    circuit on success. Another trial is allowed if a trial does not finish
+    within the cooldown. Only the outcome of the current trial decides about
+    an open circuit, outcomes of requests sent before it are ignored.
+    """
+    breakers: dict[str, "CircuitBreaker"] = {}
+    breakers_lock = threading.Lock()
+
+    def __init__(self, model: str) -> None:
+        """
+        param model: LLM model
+        """
+        self.model = model
+        self.outcomes = deque()
+        self.opened_at = None
+        self.trial_started_at = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get(cls, model: str) -> "CircuitBreaker":
+        """
+        Get circuit breaker for a model
+        """
+        with cls.breakers_lock:
+            if model not in cls.breakers:
+                cls.breakers[model] = cls(model)
+            return cls.breakers[model]
+
+    def check(self) -> float | None:
+        """
+        Raise LlmUnavailableError if the circuit is open
+
+        return: token of the trial request if the request is the trial of an open circuit
+        """
+        now = time.monotonic()
+        cooldown = settings.LLM_CIRCUIT_BREAKER_COOLDOWN
+        with self.lock:
+            if self.opened_at is None:
+                return None
+            if now - self.opened_at >= cooldown and (
+                self.trial_started_at is None or now - self.trial_started_at >= cooldown
+            ):
+                self.trial_started_at = now
+                return now
+        raise LlmUnavailableError(f"Circuit for model {self.model} is open")
+
+    def record(self, success: bool, trial: float | None = None) -> None:
+        """
+        Record outcome of a request and open or close the circuit
+
+        param success: True if the request has been answered
+        param trial: token returned by check() for the request
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.opened_at is not None:
+                if trial is None or trial != self.trial_started_at:
+                    return
+                self.trial_started_at = None
+                self.outcomes.clear()
+                if success:
+                    LOGGER.info("Closing circuit for LLM model %s", self.model)
+                    self.opened_at = None
+                else:
+                    self.opened_at = now
+                return
+            self.outcomes.append((now, success))
+            while self.outcomes and self.outcomes[0][0] < now - settings.LLM_CIRCUIT_BREAKER_WINDOW:
+                self.outcomes.popleft()
+            errors = sum(1 for _, outcome in self.outcomes if not outcome)
+            if (
+                self.opened_at is None
+                and len(self.outcomes) >= settings.LLM_CIRCUIT_BREAKER_MIN_REQUESTS
+                and errors / len(self.outcomes) >= settings.LLM_CIRCUIT_BREAKER_ERROR_RATE
+            ):
+                LOGGER.warning(
+                    "Opening circuit for LLM model %s, %i of %i requests failed",
+                    self.model, errors, len(self.outcomes)
+                )
+                self.opened_at = now
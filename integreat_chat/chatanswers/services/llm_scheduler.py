@@ -0,0 +1,182 @@
+"""
+Concurrency limits and priority scheduling for outbound LLM requests
+"""
+import contextlib
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import defaultdict
+
+import asyncio
+
+from django.conf import settings
+
+from integreat_chat.core.utils.metrics import LLM_QUEUE_DURATION, LLM_SHED_REQUESTS
+
+from .llm_resilience import LlmUnavailableError
+
+LOGGER = logging.getLogger("django")
+
+
+class LlmOverloadedError(LlmUnavailableError):
+    """
+    Raised if a request is shed because the queue for a model is too deep
+    """
+
+
+class LlmScheduler:
+    """
+    Limit the number of concurrent requests per model in this process. Waiting
+    requests are served by priority (lower value first) and in arrival order
+    within a priority. Requests are shed if the queue exceeds the maximum
+    depth of their priority, so lower priorities are shed first.
+
+    The scheduler is shared by all threads and event loops of a process.
+    """
+    schedulers: dict[str, "LlmScheduler"] = {}
+    schedulers_lock = threading.Lock()
+
+    def __init__(self, model: str) -> None:
+        """
+        param model: LLM model
+        """
+        self.model = model
+        self.limit = settings.LLM_CONCURRENCY_LIMITS.get(
+            model, settings.LLM_DEFAULT_CONCURRENCY_LIMIT
+        )
+        self.active = 0
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.statistics = defaultdict(
+            lambda: {"requests": 0, "shed": 0, "queue_time": 0.0, "max_queue_time": 0.0}
+        )
+
+    @classmethod
+    def get(cls, model: str) -> "LlmScheduler":
+        """
+        Get scheduler for a model
+        """
+        with cls.schedulers_lock:
+            if model not in cls.schedulers:
+                cls.schedulers[model] = cls(model)
+            return cls.schedulers[model]
+
+    @classmethod
+    def get_statistics(cls) -> dict:
+        """
+        Request counts, shed requests and queue times per model and priority
+        """
+        with cls.schedulers_lock:
+            schedulers = list(cls.schedulers.values())
+        statistics = {}
+        for scheduler in schedulers:
+            with scheduler.lock:
+                statistics[scheduler.model] = {
+                    "active": scheduler.active,
+                    "queued": len(scheduler.waiting),
+                    "priorities": {
+                        priority: {
+                            **values,
+                            "mean_queue_time": values["queue_time"] / values["requests"]
+                            if values["requests"] else 0.0,
+                        }
+                        for priority, values in scheduler.statistics.items()
+                    },
+                }
+        return statistics
+
+    def is_saturated(self) -> bool:
+        """
+        Check if a new request would have to wait for a slot
+        """
+        with self.lock:
+            return self.active >= self.limit or bool(self.waiting)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int):
+        """
+        Hold one of the concurrent slots of the model
+
+        param priority: priority class of the request, lower values are served first
+        """
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: int) -> float:
+        """
+        Wait for a free slot
+
+        param priority: priority class of the request
+        return: time spent in the queue in seconds
+        """
+        start = time.monotonic()
+        with self.lock:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                self.statistics[priority]["requests"] += 1
+                return 0.0
+            if len(self.waiting) >= settings.LLM_MAX_QUEUE_DEPTH.get(priority, 0):
+                self.statistics[priority]["shed"] += 1
+                LLM_SHED_REQUESTS.labels(model=self.model, priority=priority).inc()
+                LOGGER.warning(
+                    "Shedding LLM request for %s with priority %i, %i requests queued",
+                    self.model, priority, len(self.waiting)
+                )
+                raise LlmOverloadedError(f"Too many queued requests for model {self.model}")
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(
+                self.waiting,
+                (priority, next(self.sequence), asyncio.get_running_loop(), future)
+            )
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was granted before the cancellation arrived
+                self.release()
+                raise
+            with self.lock:
+                self.waiting = [entry for entry in self.waiting if entry[3] is not future]
+                heapq.heapify(self.waiting)
+            raise
+        queue_time = time.monotonic() - start
+        LLM_QUEUE_DURATION.labels(model=self.model, priority=priority).observe(queue_time)
+        with self.lock:
+            statistics = self.statistics[priority]
+            statistics["requests"] += 1
+            statistics["queue_time"] += queue_time
+            statistics["max_queue_time"] = max(statistics["max_queue_time"], queue_time)
+        LOGGER.debug(
+            "LLM request for %s with priority %i queued for %.3fs", self.model, priority, queue_time
+        )
+        return queue_time
+
+    def release(self) -> None:
+        """
+        Hand the slot over to the next waiting request or free it
+        """
+        with self.lock:
+            while self.waiting:
+                _, _, loop, future = heapq.heappop(self.waiting)
+                try:
+                    loop.call_soon_threadsafe(self.grant, future)
+                    return
+                except RuntimeError:
+                    # event loop of the waiting request has already been closed
+                    continue
+            self.active -= 1
+
+    def grant(self, future: asyncio.Future) -> None:
+        """
+        Wake up a waiting request in its own event loop
+        """
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
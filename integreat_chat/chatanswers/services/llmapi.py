@@ -1,12 +1,31 @@
 """
 Very simple LiteLLM Client (should be compatible to OpenAI API)
 """
+import concurrent.futures
+import hashlib
 import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
 
 import asyncio
 import aiohttp
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.cache import cache
+
+from integreat_chat.core.utils.metrics import (
+    CACHE_REQUESTS, LLM_REQUEST_DURATION, LLM_REQUEST_ERRORS, span
+)
+
+from .llm_resilience import CircuitBreaker, LatencyTracker, LlmUnavailableError
+from .llm_scheduler import LlmScheduler
+from .model_router import ModelRouter
+
+LOGGER = logging.getLogger("django")
 
 class LlmMessage:
     """
@@ -31,11 +50,23 @@ class LlmMessage:
 class LlmPrompt:
     """
     Class that represents a prompt to an LLM
+
+    param model: LLM model
+    param messages: list of messages
+    param json_schema: optional schema for structured output
+    param prompt_type: name of the used prompt in Prompts, used for selecting a cache TTL
     """
-    def __init__(self, model: str, messages: list[LlmMessage], json_schema: None | dict = None):
+    def __init__(
+            self,
+            model: str,
+            messages: list[LlmMessage],
+            json_schema: None | dict = None,
+            prompt_type: None | str = None,
+        ):
         self.messages = messages
         self.json_schema = json_schema
         self.model = model
+        self.prompt_type = prompt_type
 
     def as_dict(self) -> dict:
         """
@@ -52,6 +83,28 @@ class LlmPrompt:
             }
         return body
 
+    def with_model(self, model: str) -> "LlmPrompt":
+        """
+        Copy of the prompt for another model
+        """
+        return LlmPrompt(model, self.messages, self.json_schema, self.prompt_type)
+
+    @property
+    def priority(self) -> int:
+        """
+        Scheduling priority of the prompt type, lower values are served first
+        """
+        return settings.LLM_PROMPT_PRIORITIES.get(
+            self.prompt_type, settings.LLM_DEFAULT_PROMPT_PRIORITY
+        )
+
+    def cache_key(self) -> str:
+        """
+        Hash of the full request payload
+        """
+        payload = json.dumps(self.as_dict(), sort_keys=True, ensure_ascii=False)
+        return f"llm_response_{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
 class LlmResponse:
     """
     Class for parsing LLM responses
@@ -73,8 +126,17 @@ class LlmResponse:
 
 class LlmApiClient:
     """
-    API Client for prompting
+    API Client for prompting. Responses for prompt types listed in
+    LLM_RESPONSE_CACHE_TTL are cached. Concurrent identical prompts in one
+    process share a single in-flight request. The stampede protection is per
+    process, workers with identical prompts each send their own request.
     """
+    in_flight: dict[str, concurrent.futures.Future] = {}
+    in_flight_lock = threading.Lock()
+    cache_statistics: dict[str, dict[str, int]] = defaultdict(
+        lambda: {"hits": 0, "misses": 0, "shared": 0}
+    )
+
     def __init__(self):
         """
         Initialize the API client with a LLM model
@@ -84,17 +146,33 @@ class LlmApiClient:
         """
         self.api_url = f"{settings.LLM_SERVER}/chat/completions"
 
-    def simple_prompt(self, message: str) -> str:
+    def simple_prompt(self, message: str, prompt_type: None | str = None) -> str:
         """
-        Simple message and answer function.
+        Simple message and answer function. The model is selected by the
+        task of the prompt type.
 
         param message: Message prompted to LLM
+        param prompt_type: name of the used prompt in Prompts
+        return: message returned by LLM
+        """
+        return asyncio.run(self.asimple_prompt(message, prompt_type))
+
+    async def asimple_prompt(self, message: str, prompt_type: None | str = None) -> str:
+        """
+        Simple message and answer function for async code.
+
+        param message: Message prompted to LLM
+        param prompt_type: name of the used prompt in Prompts
         return: message returned by LLM
         """
         return str(
-            LlmResponse(asyncio.run(self.chat_prompt_session_wrapper(
-                LlmPrompt(settings.RAG_MODEL, [LlmMessage(message)])
-            )))
+            LlmResponse(await self.chat_prompt_session_wrapper(
+                LlmPrompt(
+                    ModelRouter.get_model(prompt_type),
+                    [LlmMessage(message)],
+                    prompt_type=prompt_type,
+                )
+            ))
         )
 
     async def chat_prompt_session_wrapper(self, prompt: LlmPrompt) -> dict:
@@ -104,15 +182,204 @@ class LlmApiClient:
         async with aiohttp.ClientSession() as session:
             return await self.chat_prompt(session, prompt)
 
+    @classmethod
+    def count_cache_access(cls, model: str, result: str) -> None:
+        """
+        Count cache accesses per model
+
+        param model: LLM model
+        param result: "hit", "miss" or "shared" for waiting on an identical in-flight prompt
+        """
+        CACHE_REQUESTS.labels(cache="llm_response", result=result).inc()
+        with cls.in_flight_lock:
+            cls.cache_statistics[model][
+                {"hit": "hits", "miss": "misses", "shared": "shared"}[result]
+            ] += 1
+
+    @classmethod
+    def get_cache_statistics(cls) -> dict:
+        """
+        Cache hits, misses, shared in-flight prompts and hit rate per model of
+        this process. Shared prompts are not counted as hits.
+        """
+        with cls.in_flight_lock:
+            return {
+                model: {
+                    **counts,
+                    "hit_rate": counts["hits"] / sum(counts.values()),
+                }
+                for model, counts in cls.cache_statistics.items()
+            }
+
     async def chat_prompt(self, session: aiohttp.ClientSession, prompt: LlmPrompt) -> dict:
         """
-        Get RAG answer
+        Get RAG answer. Escalate to the escalation model tier if a small model
+        gives an unclear answer or is unavailable.
+        """
+        if not ModelRouter.can_escalate(prompt.prompt_type, prompt.model):
+            return await self.cached_prompt(session, prompt)
+        try:
+            response = await self.cached_prompt(session, prompt)
+            if not ModelRouter.needs_escalation(
+                prompt.prompt_type, prompt.model, str(LlmResponse(response))
+            ):
+                return response
+            LOGGER.debug("Escalating unclear %s answer of %s", prompt.prompt_type, prompt.model)
+        except (LlmUnavailableError, KeyError, IndexError) as exc:
+            LOGGER.warning("Escalating %s prompt: %s", prompt.prompt_type, repr(exc))
+        return await self.cached_prompt(
+            session, prompt.with_model(ModelRouter.get_escalation_model())
+        )
+
+    async def cached_prompt(self, session: aiohttp.ClientSession, prompt: LlmPrompt) -> dict:
+        """
+        Get response, use cached response if available for the prompt type.
+        """
+        if (
+            not settings.LLM_RESPONSE_CACHE
+            or prompt.prompt_type not in settings.LLM_RESPONSE_CACHE_TTL
+        ):
+            return await self.request_completion(session, prompt)
+        cache_key = prompt.cache_key()
+        response = await sync_to_async(cache.get, thread_sensitive=False)(cache_key)
+        if response is not None:
+            self.count_cache_access(prompt.model, "hit")
+            return response
+        while True:
+            with self.in_flight_lock:
+                future = self.in_flight.get(cache_key)
+                is_leader = future is None
+                if is_leader:
+                    future = self.in_flight[cache_key] = concurrent.futures.Future()
+            if is_leader:
+                break
+            LOGGER.debug("Waiting for in-flight %s prompt", prompt.prompt_type)
+            try:
+                # shielded, so a cancelled follower does not cancel the shared future
+                response = await asyncio.shield(asyncio.wrap_future(future))
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # the leader was cancelled, e.g. its client disconnected, retry as leader
+                LOGGER.debug("In-flight %s prompt was cancelled, retrying", prompt.prompt_type)
+                continue
+            self.count_cache_access(prompt.model, "shared")
+            return response
+        self.count_cache_access(prompt.model, "miss")
+        try:
+            response = await self.request_completion(session, prompt)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self.in_flight_lock:
+                del self.in_flight[cache_key]
+        if "choices" in response:
+            await sync_to_async(cache.set, thread_sensitive=False)(
+                cache_key, response, settings.LLM_RESPONSE_CACHE_TTL[prompt.prompt_type]
+            )
+        future.set_result(response)
+        return response
+
+    async def request_completion(self, session: aiohttp.ClientSession, prompt: LlmPrompt) -> dict:
+        """
+        Send prompt to the LLM server. Fail fast if the circuit of the model is
+        open and retry idempotent prompt types with jittered exponential backoff.
+        """
+        circuit_breaker = CircuitBreaker.get(prompt.model)
+        attempts = (
+            settings.LLM_MAX_RETRIES + 1 if prompt.prompt_type in settings.LLM_RETRY_PROMPTS else 1
+        )
+        for attempt in range(attempts):
+            trial = circuit_breaker.check()
+            try:
+                response = await self.hedged_request(session, prompt)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                circuit_breaker.record(False, trial)
+                LLM_REQUEST_ERRORS.labels(model=prompt.model, prompt_type=prompt.prompt_type).inc()
+                LOGGER.warning(
+                    "LLM request for %s failed (attempt %i of %i): %s",
+                    prompt.model, attempt + 1, attempts, repr(exc)
+                )
+                if attempt + 1 == attempts:
+                    raise LlmUnavailableError(f"LLM request for {prompt.model} failed") from exc
+                await asyncio.sleep(random.uniform(0, settings.LLM_RETRY_BACKOFF * 2 ** attempt))
+                continue
+            circuit_breaker.record(True, trial)
+            return response
+        raise LlmUnavailableError(f"LLM request for {prompt.model} failed")
+
+    async def hedged_request(self, session: aiohttp.ClientSession, prompt: LlmPrompt) -> dict:
+        """
+        Send a duplicate request if the first one takes longer than the p95
+        latency of the prompt type and return the first successful response.
+        No duplicate is sent if it would have to wait for a slot of the model.
+        """
+        hedge_delay = (
+            LatencyTracker.get(prompt.model, prompt.prompt_type).hedge_delay()
+            if settings.LLM_HEDGING and prompt.prompt_type in settings.LLM_HEDGED_PROMPTS
+            else None
+        )
+        if hedge_delay is None:
+            return await self.timed_request(session, prompt)
+        pending = {asyncio.create_task(self.timed_request(session, prompt))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+            if not done and LlmScheduler.get(prompt.model).is_saturated():
+                LOGGER.debug(
+                    "Not hedging %s request, all slots for %s are in use",
+                    prompt.prompt_type, prompt.model
+                )
+            elif not done:
+                LOGGER.debug(
+                    "Hedging %s request for %s after %.2fs",
+                    prompt.prompt_type, prompt.model, hedge_delay
+                )
+                pending.add(asyncio.create_task(self.timed_request(session, prompt)))
+            exception = None
+            while True:
+                for task in done:
+                    if task.cancelled():
+                        exception = exception or asyncio.CancelledError()
+                    elif task.exception() is None:
+                        return task.result()
+                    else:
+                        exception = task.exception()
+                if not pending:
+                    raise exception
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def timed_request(self, session: aiohttp.ClientSession, prompt: LlmPrompt) -> dict:
+        """
+        Send prompt to the LLM server once a slot for the model is available
+        and record the latency
         """
-        async with session.post(self.api_url,
-                                json=prompt.as_dict(),
-                                timeout=120,
-                                headers={
-                                    'Authorization': f'Bearer {settings.LLM_API_KEY}',
-                                    'Content-Type': 'application/json',
-                                }) as response:
-            return await response.json()
+        async with LlmScheduler.get(prompt.model).slot(prompt.priority):
+            start = time.monotonic()
+            with span(
+                LLM_REQUEST_DURATION, f"llm:{prompt.prompt_type}:{prompt.model}",
+                model=prompt.model, prompt_type=prompt.prompt_type,
+            ):
+                async with session.post(self.api_url,
+                                        json=prompt.as_dict(),
+                                        timeout=aiohttp.ClientTimeout(
+                                            total=settings.LLM_REQUEST_TIMEOUTS.get(
+                                                prompt.prompt_type,
+                                                settings.LLM_DEFAULT_REQUEST_TIMEOUT
+                                            )
+                                        ),
+                                        headers={
+                                            'Authorization': f'Bearer {settings.LLM_API_KEY}',
+                                            'Content-Type': 'application/json',
+                                        }) as response:
+                    if response.status >= 500 or response.status == 429:
+                        response.raise_for_status()
+                    result = await response.json()
+            LatencyTracker.get(prompt.model, prompt.prompt_type).record(time.monotonic() - start)
+            return result
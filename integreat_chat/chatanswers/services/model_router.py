@@ -0,0 +1,98 @@
+"""
+Route prompts to model tiers based on their task
+"""
+import json
+import re
+
+from django.conf import settings
+
+from integreat_chat.translate.static.prompts import Prompts as TranslatePrompts
+
+from ..static.prompts import Prompts
+
+PROMPT_TASKS = {**Prompts.TASKS, **TranslatePrompts.TASKS}
+PROMPT_SCHEMAS = {
+    prompt_type: getattr(prompts, f"{prompt_type}_SCHEMA")
+    for prompts in (Prompts, TranslatePrompts)
+    for prompt_type in prompts.TASKS
+    if hasattr(prompts, f"{prompt_type}_SCHEMA")
+}
+
+
+class ModelRouter:
+    """
+    Select models for prompt types. Each prompt type declares a task, tasks are
+    mapped to model tiers. Answers of small models are escalated to the
+    escalation tier if they are unclear.
+    """
+
+    @staticmethod
+    def get_task(prompt_type: str | None) -> str:
+        """
+        Get the task of a prompt type
+        """
+        return PROMPT_TASKS.get(prompt_type, "generation")
+
+    @classmethod
+    def get_model(cls, prompt_type: str | None) -> str:
+        """
+        Get model for a prompt type
+
+        param prompt_type: name of the prompt in Prompts
+        return: model name
+        """
+        return settings.LLM_MODEL_TIERS[settings.LLM_TASK_TIERS[cls.get_task(prompt_type)]]
+
+    @staticmethod
+    def get_escalation_model() -> str:
+        """
+        Get model that handles escalated prompts
+        """
+        return settings.LLM_MODEL_TIERS[settings.LLM_ESCALATION_TIER]
+
+    @classmethod
+    def parse_answer(cls, prompt_type: str | None, answer: str) -> str | None:
+        """
+        Normalize the answer of a classifying task
+
+        param prompt_type: name of the prompt in Prompts
+        param answer: message returned by the LLM
+        return: normalized answer or None if the answer is unclear or lacks
+                required keys of the JSON schema of the prompt
+        """
+        task = cls.get_task(prompt_type)
+        if task == "yes_no":
+            if match := re.match(r"^\W*(yes|no)\b", answer.strip().lower()):
+                return match.group(1)
+            return None
+        if task == "classification":
+            try:
+                parsed = json.loads(answer)
+            except (json.JSONDecodeError, TypeError):
+                return None
+            required = PROMPT_SCHEMAS.get(prompt_type, {}).get("schema", {}).get("required", [])
+            if not isinstance(parsed, dict) or any(key not in parsed for key in required):
+                return None
+            return json.dumps(parsed, sort_keys=True)
+        return answer
+
+    @classmethod
+    def can_escalate(cls, prompt_type: str | None, model: str) -> bool:
+        """
+        Check if answers of a model for a prompt type may be escalated
+        """
+        return (
+            cls.get_task(prompt_type) in settings.LLM_ESCALATING_TASKS
+            and model != cls.get_escalation_model()
+        )
+
+    @classmethod
+    def needs_escalation(cls, prompt_type: str | None, model: str, answer: str) -> bool:
+        """
+        Check if an answer of a small model is unclear and has to be escalated
+
+        param prompt_type: name of the prompt in Prompts
+        param model: model that answered
+        param answer: message returned by the LLM
+        """
+        return cls.can_escalate(prompt_type, model) and cls.parse_answer(prompt_type, answer) is None
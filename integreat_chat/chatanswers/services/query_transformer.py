@@ -5,9 +5,9 @@ Service to transform/optimize input queries
 import re
 
 import asyncio
-from django.conf import settings
 
 from integreat_chat.chatanswers.services.llmapi import LlmApiClient, LlmMessage, LlmPrompt, LlmResponse
+from integreat_chat.chatanswers.services.model_router import ModelRouter
 
 from ..static.prompts import Prompts
 
@@ -67,16 +67,23 @@ class QueryTransformer:
         """
         Optimize the user query for document retrieval
         """
+        return asyncio.run(self.atransform_query())
+
+    async def atransform_query(self):
+        """
+        Optimize the user query for document retrieval without blocking the event loop
+        """
         prompt = LlmPrompt(
-            settings.RAG_QUERY_OPTIMIZATION_MODEL,
+            ModelRouter.get_model("OPTIMIZE_MESSAGE"),
             [
                 LlmMessage(Prompts.CHECK_SYSTEM_PROMPT, role="system"),
                 LlmMessage(Prompts.OPTIMIZE_MESSAGE.format(self.original_query))
-            ]
+            ],
+            prompt_type="OPTIMIZE_MESSAGE",
         )
-        self.modified_query = str(LlmResponse(asyncio.run(
-            self.llm_api.chat_prompt_session_wrapper(prompt)
-        )))
+        self.modified_query = str(LlmResponse(
+            await self.llm_api.chat_prompt_session_wrapper(prompt)
+        ))
         return {
             "original_query": self.original_query,
             "modified_query": self.modified_query,
@@ -8,4 +8,6 @@ class Messages:
 
     TALK_TO_HUMAN = """We will forward your request to a human advisor. Please wait."""
 
+    SERVICE_UNAVAILABLE = """Sorry, automatic answers are currently not available. Please wait for a message from a human advisor."""
+
     NOT_QUESTION = """Sorry, kindly formulate your message as a question that is as specific as possible."""
@@ -8,6 +8,15 @@ class Prompts:
     Collection of required prompts
     """
 
+    # Task of each prompt, used for routing prompts to a model tier
+    TASKS = {
+        "RAG": "generation",
+        "RELEVANCE_CHECK": "yes_no",
+        "CHECK_QUESTION": "yes_no",
+        "OPTIMIZE_MESSAGE": "summarization",
+        "HUMAN_REQUEST_CHECK": "yes_no",
+    }
+
     RAG_SYSTEM_PROMPT = "You are a helpful assistant in the Integreat App. You counsel migrants based on content that exists in the app."
 
     RAG = """You are an assistant for question-answering tasks.
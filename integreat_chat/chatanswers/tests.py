@@ -1,3 +1,614 @@
-from django.test import TestCase
+"""
+Answer cache and LLM client tests
+"""
+import asyncio
+import threading
+import time
+import zlib
+from unittest import mock
 
-# Create your tests here.
+import numpy
+from django.core.cache import cache
+from django.test import AsyncClient, SimpleTestCase
+from django.test.utils import override_settings
+
+from integreat_chat.core.utils.fake_services import (
+    FakeCmsServer, FakeInferenceWorker, FakeLlmServer, FakeOpenSearchServer
+)
+from integreat_chat.core.utils.model_registry import ModelRegistry
+from integreat_chat.search.services.embedding import EmbeddingService
+from integreat_chat.search.utils.search_response import Document
+
+from .services import llmapi
+from .services.answer_cache import AnswerCache
+from .static.messages import Messages
+from .services.llm_resilience import CircuitBreaker, LatencyTracker, LlmUnavailableError
+from .services.llm_scheduler import LlmOverloadedError, LlmScheduler
+from .services.llmapi import LlmApiClient, LlmMessage, LlmPrompt
+from .services.model_router import ModelRouter
+from .utils.context_builder import ContextBuilder
+from .utils.rag_request import RagRequest
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def unit_vector(position: int, dimension: int = 8) -> numpy.ndarray:
+    """
+    Embedding that is only similar to itself
+    """
+    embedding = numpy.zeros(dimension, dtype=numpy.float32)
+    embedding[position] = 1.0
+    return embedding
+
+
+def bag_of_words(message: str, dimension: int = 64) -> list[float]:
+    """
+    Embedding that is only similar for messages with the same words
+    """
+    embedding = [0.0] * dimension
+    for word in message.lower().split():
+        embedding[zlib.crc32(word.encode("utf-8")) % dimension] += 1.0
+    return embedding
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AnswerCacheTest(SimpleTestCase):
+    """
+    Semantic answer cache
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def get_answer_cache(self, position: int) -> AnswerCache:
+        """
+        Answer cache for a question with a fixed embedding
+        """
+        answer_cache = AnswerCache("testumgebung", "de", f"Frage {position}")
+        answer_cache.embedding = unit_vector(position)
+        return answer_cache
+
+    def test_lookup(self):
+        """
+        Only similar questions are answered from the cache
+        """
+        self.get_answer_cache(1).store("Antwort 1", [], {"likely_message_language": "de"})
+        self.assertEqual(
+            self.get_answer_cache(1).lookup(),
+            ("Antwort 1", [], {"likely_message_language": "de"}),
+        )
+        self.assertIsNone(self.get_answer_cache(2).lookup())
+
+    def test_concurrent_store(self):
+        """
+        Answers stored by concurrent requests are all kept
+        """
+        threads = [
+            threading.Thread(
+                target=self.get_answer_cache(position).store,
+                args=(f"Antwort {position}", [], {}),
+            )
+            for position in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.get_answer_cache(0).get_entries()), 8)
+        for position in range(8):
+            self.assertEqual(
+                self.get_answer_cache(position).lookup()[0], f"Antwort {position}"
+            )
+
+    @override_settings(RAG_ANSWER_CACHE_MAX_ENTRIES=2)
+    def test_oldest_entries_dropped(self):
+        """
+        Entries beyond the maximum are removed with their answers
+        """
+        for position in range(3):
+            self.get_answer_cache(position).store(f"Antwort {position}", [], {})
+        self.assertIsNone(self.get_answer_cache(0).lookup())
+        self.assertEqual(self.get_answer_cache(2).lookup()[0], "Antwort 2")
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    LLM_RESPONSE_CACHE=True,
+    LLM_RESPONSE_CACHE_TTL={"CHECK_QUESTION": 60, "LANGUAGE_CLASSIFICATION": 600},
+)
+class LlmResponseCacheTest(SimpleTestCase):
+    """
+    Cache and in-flight sharing of LLM responses
+    """
+
+    def setUp(self):
+        cache.clear()
+        LlmApiClient.cache_statistics.clear()
+        self.completions = 0
+
+    async def request_completion(self, session, prompt):  # pylint: disable=unused-argument
+        """
+        Slow fake completion
+        """
+        self.completions += 1
+        await asyncio.sleep(0.05)
+        return {"choices": [{"message": {"content": f"Answer {self.completions}"}}]}
+
+    def prompt(self, prompt_type: str) -> LlmPrompt:
+        """
+        Prompt of a prompt type
+        """
+        return LlmPrompt("model", [LlmMessage(f"{prompt_type} prompt")], prompt_type=prompt_type)
+
+    def run_prompts(self, *prompts: LlmPrompt) -> list[dict]:
+        """
+        Send prompts concurrently
+        """
+        client = LlmApiClient()
+        client.request_completion = self.request_completion
+
+        async def run():
+            return await asyncio.gather(
+                *[client.cached_prompt(None, prompt) for prompt in prompts]
+            )
+
+        return asyncio.run(run())
+
+    def test_ttl_per_prompt_type(self):
+        """
+        Responses are cached with the TTL of their prompt type, other prompt types are not cached
+        """
+        with mock.patch.object(llmapi, "cache", wraps=cache) as wrapped_cache:
+            self.run_prompts(self.prompt("CHECK_QUESTION"))
+            self.run_prompts(self.prompt("LANGUAGE_CLASSIFICATION"))
+            self.run_prompts(self.prompt("RAG"))
+            self.run_prompts(self.prompt("RAG"))
+        timeouts = [call.args[2] for call in wrapped_cache.set.call_args_list]
+        self.assertEqual(timeouts, [60, 600])
+        self.assertEqual(self.completions, 4)
+        self.run_prompts(self.prompt("CHECK_QUESTION"))
+        self.assertEqual(self.completions, 4)
+
+    def test_in_flight_sharing(self):
+        """
+        Concurrent identical prompts send one request, waiting prompts are not counted as hits
+        """
+        responses = self.run_prompts(*[self.prompt("CHECK_QUESTION") for _ in range(3)])
+        self.assertEqual(self.completions, 1)
+        self.assertEqual(len({str(response) for response in responses}), 1)
+        self.assertEqual(
+            LlmApiClient.get_cache_statistics()["model"],
+            {"hits": 0, "misses": 1, "shared": 2, "hit_rate": 0.0},
+        )
+
+    def test_cancelled_leader(self):
+        """
+        A waiting prompt is sent again if the prompt it waits for is cancelled
+        """
+        client = LlmApiClient()
+        client.request_completion = self.request_completion
+
+        async def run():
+            leader = asyncio.create_task(
+                client.cached_prompt(None, self.prompt("CHECK_QUESTION"))
+            )
+            await asyncio.sleep(0.01)
+            follower = asyncio.create_task(
+                client.cached_prompt(None, self.prompt("CHECK_QUESTION"))
+            )
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower
+
+        response = asyncio.run(run())
+        self.assertEqual(response["choices"][0]["message"]["content"], "Answer 2")
+        self.assertEqual(self.completions, 2)
+        self.assertEqual(LlmApiClient.in_flight, {})
+
+
+@mock.patch.object(ContextBuilder, "count_tokens", lambda self, text: len(text.split()) or 1)
+class ContextBuilderTest(SimpleTestCase):
+    """
+    Token budget of the RAG context, one token per word and per separator
+    """
+
+    def document(self, chunk: str, score: float) -> Document:
+        """
+        Retrieved document with a chunk
+        """
+        return Document("/testumgebung/de/seite/", chunk, score, "de")
+
+    def build(self, max_tokens: int, *documents: Document) -> ContextBuilder:
+        """
+        Build a context without loading the tokenizer
+        """
+        with mock.patch.object(ModelRegistry, "get", return_value=None):
+            context_builder = ContextBuilder(max_tokens)
+        context_builder.build(list(documents))
+        return context_builder
+
+    def test_skip_passage_that_does_not_fit(self):
+        """
+        A passage that does not fit is skipped, later shorter passages are added
+        """
+        context_builder = self.build(
+            6,
+            self.document("eins zwei drei", 3),
+            self.document("vier fünf sechs sieben", 2),
+            self.document("acht", 1),
+        )
+        self.assertEqual(context_builder.passages, ["eins zwei drei", "acht"])
+
+    def test_separators_are_counted(self):
+        """
+        Separators between passages count towards the budget
+        """
+        context_builder = self.build(
+            4, self.document("eins zwei", 2), self.document("drei vier", 1)
+        )
+        self.assertEqual(context_builder.passages, ["eins zwei"])
+        context_builder = self.build(
+            5, self.document("eins zwei", 2), self.document("drei vier", 1)
+        )
+        self.assertEqual(context_builder.passages, ["eins zwei", "drei vier"])
+        self.assertEqual(context_builder.tokens_used, 5)
+
+    def test_passage_cut_at_sentence(self):
+        """
+        A passage that does not fit is shortened to complete sentences
+        """
+        context_builder = self.build(
+            4, self.document("Eins zwei. Drei vier. Fünf sechs.", 1)
+        )
+        self.assertEqual(context_builder.passages, ["Eins zwei. Drei vier."])
+
+    def test_overlapping_passages_skipped(self):
+        """
+        Page excerpts that contain an added chunk are not added again
+        """
+        document = Document("/testumgebung/de/seite/", "Drei vier.", 1, "de")
+        document.content = "Eins zwei. Drei vier.\n\nFünf sechs."
+        context_builder = self.build(10, document)
+        self.assertEqual(context_builder.passages, ["Drei vier.", "Fünf sechs."])
+
+    @override_settings(RAG_CONTEXT_MAX_TOKENS=3)
+    def test_budget_read_at_runtime(self):
+        """
+        The default budget follows the settings
+        """
+        with mock.patch.object(ModelRegistry, "get", return_value=None):
+            self.assertEqual(ContextBuilder().max_tokens, 3)
+
+
+@override_settings(
+    LLM_CONCURRENCY_LIMITS={"model": 1}, LLM_MAX_QUEUE_DEPTH={0: 4, 1: 4, 2: 1}
+)
+class LlmSchedulerTest(SimpleTestCase):
+    """
+    Concurrency limit, priorities and shedding of LLM requests
+    """
+
+    def test_priority_order(self):
+        """
+        Waiting requests are served by priority, then in arrival order
+        """
+        scheduler = LlmScheduler("model")
+        order = []
+
+        async def request(name: str, priority: int):
+            async with scheduler.slot(priority):
+                order.append(name)
+
+        async def run():
+            await scheduler.acquire(0)
+            tasks = []
+            for name, priority in [("a", 1), ("b", 0), ("c", 1), ("d", 0)]:
+                tasks.append(asyncio.create_task(request(name, priority)))
+                await asyncio.sleep(0)
+            scheduler.release()
+            await asyncio.gather(*tasks)
+
+        asyncio.run(run())
+        self.assertEqual(order, ["b", "d", "a", "c"])
+        self.assertEqual(scheduler.active, 0)
+
+    def test_shedding(self):
+        """
+        Requests are shed if the queue of their priority is full
+        """
+        scheduler = LlmScheduler("model")
+
+        async def run():
+            await scheduler.acquire(0)
+            waiting = asyncio.create_task(scheduler.acquire(1))
+            await asyncio.sleep(0)
+            with self.assertRaises(LlmOverloadedError):
+                await scheduler.acquire(2)
+            scheduler.release()
+            await waiting
+            scheduler.release()
+
+        asyncio.run(run())
+        self.assertEqual(scheduler.statistics[2]["shed"], 1)
+        self.assertEqual(scheduler.active, 0)
+
+    def test_cancellation(self):
+        """
+        Cancelled requests leave the queue and do not keep a slot, also if the
+        slot was granted just before the cancellation
+        """
+        scheduler = LlmScheduler("model")
+
+        async def run():
+            await scheduler.acquire(0)
+            cancelled = asyncio.create_task(scheduler.acquire(0))
+            granted = asyncio.create_task(scheduler.acquire(0))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            await asyncio.sleep(0)
+            self.assertEqual(len(scheduler.waiting), 1)
+            scheduler.release()
+            # the grant runs before the waiting request resumes
+            await asyncio.sleep(0)
+            granted.cancel()
+            for task in (cancelled, granted):
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+        asyncio.run(run())
+        self.assertEqual(scheduler.active, 0)
+        self.assertEqual(scheduler.waiting, [])
+
+
+@override_settings(
+    LLM_CIRCUIT_BREAKER_MIN_REQUESTS=2,
+    LLM_CIRCUIT_BREAKER_ERROR_RATE=0.5,
+    LLM_CIRCUIT_BREAKER_COOLDOWN=0.05,
+)
+class CircuitBreakerTest(SimpleTestCase):
+    """
+    Opening and closing the circuit of a model
+    """
+
+    def open_circuit(self) -> CircuitBreaker:
+        """
+        Circuit breaker with an open circuit
+        """
+        circuit_breaker = CircuitBreaker("model")
+        circuit_breaker.record(False)
+        circuit_breaker.record(False)
+        with self.assertRaises(LlmUnavailableError):
+            circuit_breaker.check()
+        return circuit_breaker
+
+    def test_only_trial_closes_circuit(self):
+        """
+        Requests sent before the trial do not close the circuit
+        """
+        circuit_breaker = self.open_circuit()
+        time.sleep(0.05)
+        trial = circuit_breaker.check()
+        self.assertIsNotNone(trial)
+        circuit_breaker.record(True)
+        with self.assertRaises(LlmUnavailableError):
+            circuit_breaker.check()
+        circuit_breaker.record(True, trial)
+        self.assertIsNone(circuit_breaker.check())
+
+    def test_superseded_trial_ignored(self):
+        """
+        A trial that did not finish within the cooldown is replaced by a new trial
+        """
+        circuit_breaker = self.open_circuit()
+        time.sleep(0.05)
+        first_trial = circuit_breaker.check()
+        time.sleep(0.05)
+        second_trial = circuit_breaker.check()
+        circuit_breaker.record(True, first_trial)
+        with self.assertRaises(LlmUnavailableError):
+            circuit_breaker.check()
+        circuit_breaker.record(False, second_trial)
+        with self.assertRaises(LlmUnavailableError):
+            circuit_breaker.check()
+
+
+@override_settings(LLM_HEDGING=True, LLM_HEDGED_PROMPTS=["CHECK_QUESTION"])
+@mock.patch.object(LatencyTracker, "hedge_delay", lambda self: 0.01)
+class HedgedRequestTest(SimpleTestCase):
+    """
+    Duplicate requests for slow prompts
+    """
+
+    def setUp(self):
+        self.requests = 0
+
+    async def timed_request(self, session, prompt):  # pylint: disable=unused-argument
+        """
+        Slow fake request
+        """
+        self.requests += 1
+        await asyncio.sleep(0.05)
+        return {"choices": [{"message": {"content": "Answer"}}]}
+
+    def run_prompt(self) -> dict:
+        """
+        Send a hedged prompt
+        """
+        client = LlmApiClient()
+        client.timed_request = self.timed_request
+        prompt = LlmPrompt("model", [LlmMessage("prompt")], prompt_type="CHECK_QUESTION")
+        return asyncio.run(client.hedged_request(None, prompt))
+
+    def test_hedging(self):
+        """
+        A duplicate is sent if the first request is slow
+        """
+        with mock.patch.dict(LlmScheduler.schedulers, clear=True):
+            self.run_prompt()
+        self.assertEqual(self.requests, 2)
+
+    def test_cancelled_request(self):
+        """
+        The duplicate answers if the first request was cancelled
+        """
+        async def timed_request(session, prompt):
+            self.requests += 1
+            if self.requests == 1:
+                await asyncio.sleep(0.02)
+                raise asyncio.CancelledError()
+            return await self.timed_request(session, prompt)
+
+        client = LlmApiClient()
+        client.timed_request = timed_request
+        prompt = LlmPrompt("model", [LlmMessage("prompt")], prompt_type="CHECK_QUESTION")
+        with mock.patch.dict(LlmScheduler.schedulers, clear=True):
+            response = asyncio.run(client.hedged_request(None, prompt))
+        self.assertEqual(response["choices"][0]["message"]["content"], "Answer")
+
+    def test_no_hedging_if_saturated(self):
+        """
+        No duplicate is sent if all slots of the model are in use
+        """
+        with mock.patch.dict(LlmScheduler.schedulers, clear=True):
+            scheduler = LlmScheduler.get("model")
+            scheduler.active = scheduler.limit
+            self.run_prompt()
+        self.assertEqual(self.requests, 1)
+
+
+@override_settings(LLM_MODEL_TIERS={"small": "small-model", "large": "large-model"})
+class ModelRouterTest(SimpleTestCase):
+    """
+    Model selection and escalation by task
+    """
+
+    def test_get_model(self):
+        """
+        Prompt types are routed to the tier of their task
+        """
+        self.assertEqual(ModelRouter.get_model("CHECK_QUESTION"), "small-model")
+        self.assertEqual(ModelRouter.get_model("RAG"), "large-model")
+        self.assertEqual(ModelRouter.get_model(None), "large-model")
+
+    def test_parse_answer(self):
+        """
+        Answers of classifying tasks are normalized, unclear answers are None
+        """
+        self.assertEqual(ModelRouter.parse_answer("CHECK_QUESTION", " Yes, it is."), "yes")
+        self.assertIsNone(ModelRouter.parse_answer("CHECK_QUESTION", "Maybe"))
+        self.assertEqual(
+            ModelRouter.parse_answer("LANGUAGE_CLASSIFICATION", '{"bcp47-tag": "de-DE"}'),
+            '{"bcp47-tag": "de-DE"}',
+        )
+        self.assertIsNone(ModelRouter.parse_answer("LANGUAGE_CLASSIFICATION", "German"))
+        self.assertIsNone(ModelRouter.parse_answer("LANGUAGE_CLASSIFICATION", '{"tag": "de"}'))
+        self.assertIsNone(ModelRouter.parse_answer("LANGUAGE_CLASSIFICATION", '["de"]'))
+
+    def test_needs_escalation(self):
+        """
+        Only unclear answers of small models are escalated
+        """
+        self.assertTrue(ModelRouter.needs_escalation("CHECK_QUESTION", "small-model", "Maybe"))
+        self.assertFalse(ModelRouter.needs_escalation("CHECK_QUESTION", "small-model", "no"))
+        self.assertFalse(ModelRouter.needs_escalation("CHECK_QUESTION", "large-model", "Maybe"))
+        self.assertFalse(ModelRouter.needs_escalation("RAG", "small-model", "Maybe"))
+
+
+class RagRequestTest(SimpleTestCase):
+    """
+    Language detection, translation and optimization of chat messages against fake services
+    """
+    data = {
+        "message": "Де можна пройти курс німецької?",
+        "language": "de",
+        "region": "testumgebung",
+    }
+
+    def setUp(self):
+        services = [
+            FakeLlmServer(language="uk"), FakeOpenSearchServer(), FakeCmsServer(),
+            FakeInferenceWorker(),
+        ]
+        for service in services:
+            service.start()
+            self.addCleanup(service.stop)
+        llm, opensearch, cms, inference = services
+        self.llm = llm
+        overrides = override_settings(
+            LLM_SERVER=llm.url,
+            OPENSEARCH_URL=opensearch.url,
+            INTEGREAT_CMS_URL=cms.url,
+            INFERENCE_WORKER_URL=inference.url,
+            ALLOWED_HOSTS=["testserver"],
+            CACHES=LOCMEM_CACHES,
+            LLM_RESPONSE_CACHE=False,
+            RAG_ANSWER_CACHE=False,
+            SEARCH_RESULT_CACHE=False,
+            SINGLE_FLIGHT=False,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        cache.clear()
+
+    def test_sync_and_async_preparation_agree(self):
+        """
+        The sync properties and prepare() compute the same values
+        """
+        sync_request = RagRequest(self.data)
+        async_request = RagRequest(self.data)
+        asyncio.run(async_request.prepare())
+        for name in RagRequest.prepared_attributes:
+            with self.subTest(attribute=name):
+                self.assertEqual(getattr(sync_request, name), async_request.__dict__[name])
+        self.assertEqual(async_request.likely_message_language, "uk")
+        self.assertEqual(async_request.translated_message, f"[en] {self.data['message']}")
+
+    def test_extract_answer_view(self):
+        """
+        The async view answers with the translated message
+        """
+        response = asyncio.run(AsyncClient().post(
+            "/chatanswers/extract_answer/", self.data, content_type="application/json"
+        ))
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["rag_language"], "en")
+        self.assertEqual(result["rag_message"], f"[en] {self.data['message']}")
+
+    def test_inference_unavailable(self):
+        """
+        The async view answers with a canned message if the message can not be translated
+        """
+        with override_settings(INFERENCE_WORKER_URL="http://127.0.0.1:9"):
+            response = asyncio.run(AsyncClient().post(
+                "/chatanswers/extract_answer/", self.data, content_type="application/json"
+            ))
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result["answer"], Messages.SERVICE_UNAVAILABLE)
+        self.assertEqual(result["rag_message"], self.data["message"])
+
+    def test_answer_cache(self):
+        """
+        A cached answer is found before any LLM call, a message with another meaning is not
+        """
+        def extract_answer(message: str) -> dict:
+            return asyncio.run(AsyncClient().post(
+                "/chatanswers/extract_answer/",
+                {"message": message, "language": "de", "region": "testumgebung"},
+                content_type="application/json",
+            )).json()
+
+        with (
+            override_settings(RAG_ANSWER_CACHE=True),
+            mock.patch.object(EmbeddingService, "embed_query", side_effect=bag_of_words),
+        ):
+            first = extract_answer("Gibt es eine Kita für Kinder unter 3 Jahren?")
+            llm_requests = self.llm.requests
+            second = extract_answer("Gibt es eine Kita für Kinder unter 3 Jahren?")
+            self.assertEqual(self.llm.requests, llm_requests)
+            self.assertEqual(second["answer"], first["answer"])
+            self.assertEqual(second["rag_language"], first["rag_language"])
+            extract_answer("Gibt es eine Kita für Kinder über 3 Jahren?")
+            self.assertGreater(self.llm.requests, llm_requests)
@@ -0,0 +1,134 @@
+"""
+Assemble the RAG context from retrieved documents within a token budget
+"""
+
+import logging
+import re
+
+from django.conf import settings
+
+from integreat_chat.core.utils.model_registry import ModelRegistry
+from integreat_chat.search.utils.search_response import Document
+
+LOGGER = logging.getLogger("django")
+
+
+class ContextBuilder:
+    """
+    Fill a token budget with passages of the retrieved documents. Matched chunks
+    are preferred over page excerpts, documents are ordered by score, and passages
+    that overlap the context by containment are skipped. Passages that do not fit
+    are shortened to complete sentences or skipped, so that shorter later passages
+    can still fill the budget.
+    """
+
+    separator = "\n\n"
+
+    def __init__(self, max_tokens: int | None = None) -> None:
+        """
+        Loads the tokenizer on first use, construct it in an executor in async code
+
+        param max_tokens: token budget for the context, defaults to RAG_CONTEXT_MAX_TOKENS
+        """
+        self.max_tokens = max_tokens or settings.RAG_CONTEXT_MAX_TOKENS
+        self.tokens_used = 0
+        self.passages = []
+        self.normalized_passages = []
+        self.tokenizer = ModelRegistry.get("tokenizer")
+        self.separator_tokens = self.count_tokens(self.separator)
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Count tokens of a text with the model tokenizer
+        """
+        if self.tokenizer is None:
+            return len(text) // 4 + 1
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Normalize case and whitespace for detecting duplicate passages
+        """
+        return " ".join(text.lower().split())
+
+    @staticmethod
+    def split_passages(text: str) -> list[str]:
+        """
+        Split text into paragraphs
+        """
+        return [passage.strip() for passage in re.split(r"\n\s*\n", text) if passage.strip()]
+
+    @staticmethod
+    def split_sentences(text: str) -> list[str]:
+        """
+        Split a passage into sentences
+        """
+        return [sentence for sentence in re.split(r"(?<=[.!?。؟])\s+", text) if sentence]
+
+    def is_duplicate(self, passage: str) -> bool:
+        """
+        Check if the passage is already (part of) the context or contains a passage
+        of the context, e.g. a page excerpt that contains an added chunk
+        """
+        normalized = self.normalize(passage)
+        return any(
+            normalized in existing or existing in normalized
+            for existing in self.normalized_passages
+        )
+
+    def add(self, passage: str) -> bool:
+        """
+        Add a passage if it fits the remaining budget. Add as many complete
+        sentences as possible otherwise. Separators between passages count
+        towards the budget.
+
+        return: True if (a part of) the passage was added
+        """
+        if self.is_duplicate(passage):
+            return False
+        separator_tokens = self.separator_tokens if self.passages else 0
+        tokens = self.count_tokens(passage) + separator_tokens
+        if self.tokens_used + tokens <= self.max_tokens:
+            self.passages.append(passage)
+            self.normalized_passages.append(self.normalize(passage))
+            self.tokens_used += tokens
+            return True
+        sentences = []
+        tokens = separator_tokens
+        for sentence in self.split_sentences(passage):
+            sentence_tokens = self.count_tokens(sentence)
+            if self.tokens_used + tokens + sentence_tokens > self.max_tokens:
+                break
+            sentences.append(sentence)
+            tokens += sentence_tokens
+        if not sentences:
+            return False
+        self.passages.append(" ".join(sentences))
+        self.normalized_passages.append(self.normalize(self.passages[-1]))
+        self.tokens_used += tokens
+        return True
+
+    def build(self, documents: list[Document]) -> str:
+        """
+        Create context from documents
+
+        param documents: retrieved documents
+        return: context for the RAG prompt
+        """
+        ranked_documents = sorted(documents, key=lambda document: document.score, reverse=True)
+        texts = (
+            [document.chunk for document in ranked_documents] +
+            [document.content for document in ranked_documents]
+        )
+        for text in texts:
+            if not text:
+                continue
+            for passage in self.split_passages(text):
+                if self.tokens_used + self.separator_tokens >= self.max_tokens:
+                    break
+                self.add(passage)
+        LOGGER.debug(
+            "Built context with %i passages and %i tokens", len(self.passages), self.tokens_used
+        )
+        return self.separator.join(self.passages)
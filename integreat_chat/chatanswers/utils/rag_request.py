@@ -2,12 +2,14 @@
 Message for processing a user message / RAG request
 """
 
+import asyncio
 import logging
 
 from django.conf import settings
 from django.utils.functional import cached_property
 
 from integreat_chat.core.utils.integreat_request import IntegreatRequest
+from integreat_chat.chatanswers.services.llm_resilience import LlmUnavailableError
 from integreat_chat.chatanswers.services.query_transformer import QueryTransformer
 
 LOGGER = logging.getLogger("django")
@@ -17,6 +19,8 @@ class RagRequest(IntegreatRequest):
     """
     Class that represents a chat user message
     """
+    prepared_attributes = [*IntegreatRequest.prepared_attributes, "optimized_message"]
+
     def __init__(self, data: dict, skip_language_detection: bool = False):
         """
         Set needed attributes for RAG request
@@ -26,17 +30,37 @@ class RagRequest(IntegreatRequest):
         super().__init__(data, skip_language_detection)
 
     @cached_property
-    def optimized_message(self) -> bool:
+    def optimized_message(self) -> str:
         """
         Optimize RAG message if required
         """
+        return asyncio.run(self.aoptimize_message())
+
+    async def aoptimize_message(self) -> str:
+        """
+        Optimize the translated message if required. Keep the message as it is
+        if the LLM is unavailable.
+        """
+        if "translated_message" not in self.__dict__:
+            await super().prepare()
         query_transformer = QueryTransformer(self.translated_message)
         LOGGER.debug("Checking if query needs optimization.")
         if query_transformer.is_transformation_required():
             LOGGER.debug("Optimizing user query.")
-            return query_transformer.transform_query()["modified_query"]
+            try:
+                return (await query_transformer.atransform_query())["modified_query"]
+            except LlmUnavailableError:
+                LOGGER.warning("Query optimization failed, using original query")
         return self.translated_message
 
+    async def prepare(self) -> None:
+        """
+        Detect language, translate and optimize the message without blocking the event loop
+        """
+        await super().prepare()
+        if settings.RAG_QUERY_OPTIMIZATION and "optimized_message" not in self.__dict__:
+            self.optimized_message = await self.aoptimize_message()
+
     def __str__(self) -> str:
         """
         string representation returns the message prepared for prompting
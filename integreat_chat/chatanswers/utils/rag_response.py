@@ -2,11 +2,18 @@
 RAG response
 """
 
-from django.conf import settings
+import asyncio
+import logging
 
+import aiohttp
+
+from integreat_chat.core.utils.inference_client import InferenceUnavailableError
+from integreat_chat.core.utils.metrics import stage
 from integreat_chat.search.utils.search_response import Document
 from integreat_chat.core.utils.integreat_request import IntegreatRequest
 
+LOGGER = logging.getLogger("django")
+
 
 class RagResponse:
     """
@@ -19,11 +26,13 @@ class RagResponse:
         request: IntegreatRequest,
         rag_response: str,
         automatic_answers: bool = True,
+        context_tokens: int = 0,
     ):
         self.documents = documents
         self.request = request
         self.rag_response = rag_response
         self.automatic_answers = automatic_answers
+        self.context_tokens = context_tokens
 
     def __str__(self):
         """
@@ -38,6 +47,26 @@ class RagResponse:
             message = self.rag_response
         return f"{message}{self.create_citation()}"
 
+    async def render(self) -> str:
+        """
+        RAG response with citations, without blocking the event loop. The answer
+        is not translated if the inference worker is unavailable.
+        """
+        if self.request.gui_language != self.request.use_language:
+            with stage("answer_translation"):
+                try:
+                    message = await self.request.language_service.atranslate_message(
+                        self.request.use_language, self.request.gui_language, self.rag_response
+                    )
+                except InferenceUnavailableError as exc:
+                    LOGGER.warning("Answer translation failed, answering in RAG language: %s", exc)
+                    message = self.rag_response
+        else:
+            message = self.rag_response
+        with stage("citations"):
+            citation = await self.acreate_citation()
+        return f"{message}{citation}"
+
     def create_citation(self):
         """
         Create human readable list of citations
@@ -50,7 +79,27 @@ class RagResponse:
                 )
             else:
                 sources.append((document.chunk_source_path, document.title))
+        return self.format_citation(sources)
 
+    async def acreate_citation(self):
+        """
+        Create human readable list of citations, fetch translated sources concurrently
+        """
+        if self.request.gui_language == self.request.use_language:
+            return self.format_citation(
+                [(document.chunk_source_path, document.title) for document in self.documents]
+            )
+        async with aiohttp.ClientSession() as session:
+            sources = await asyncio.gather(*[
+                document.aget_source_for_language(session, self.request.gui_language)
+                for document in self.documents
+            ])
+        return self.format_citation(sources)
+
+    def format_citation(self, sources: list[tuple[str, str]]) -> str:
+        """
+        Format sources as HTML list
+        """
         citation = "".join(
             [
                 f"<li><a href='{path}'>{title}</a></li>"
@@ -60,18 +109,61 @@ class RagResponse:
         )
         return f"\n<ul>{citation}</ul>" if citation else ""
 
+    def as_payload(self) -> dict:
+        """
+        Serializable representation, independent of the request
+        """
+        return {
+            "documents": [document.as_dict() for document in self.documents],
+            "rag_response": self.rag_response,
+            "automatic_answers": self.automatic_answers,
+            "context_tokens": self.context_tokens,
+        }
+
+    @classmethod
+    def from_payload(cls, payload: dict, request: IntegreatRequest) -> "RagResponse":
+        """
+        Restore response created by as_payload() for a request
+
+        param payload: dict created by as_payload()
+        param request: the request that should be answered
+        """
+        return cls(
+            [
+                Document.from_dict(document, request.gui_language)
+                for document in payload["documents"]
+            ],
+            request,
+            payload["rag_response"],
+            payload["automatic_answers"],
+            payload["context_tokens"],
+        )
+
     def as_dict(self):
         """
         Response suitable for returning as JSON
         """
+        return self.build_dict(str(self))
+
+    async def aas_dict(self):
+        """
+        Response suitable for returning as JSON, for async views
+        """
+        return self.build_dict(await self.render())
+
+    def build_dict(self, answer: str) -> dict:
+        """
+        JSON response for a rendered answer
+        """
         return {
-            "answer": str(self),
+            "answer": answer,
             "status": "success",
             "message": self.request.original_message,
             "rag_language": self.request.use_language,
             "rag_message": self.request.translated_message,
             "rag_sources": [document.chunk_source_path for document in self.documents],
             "automatic_answers": self.automatic_answers,
+            "context_tokens": self.context_tokens,
             "details": [
                 {
                     "source": document.chunk_source_path,
@@ -5,10 +5,13 @@ Django views
 import json
 import logging
 
+from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
 from integreat_chat.chatanswers.services.answer import AnswerService
+from integreat_chat.core.utils.metrics import collect_timings
+from integreat_chat.core.utils.traffic_capture import TrafficCapture
 
 from .utils.rag_request import RagRequest
 
@@ -16,17 +19,23 @@ LOGGER = logging.getLogger("django")
 
 
 @csrf_exempt
-def extract_answer(request):
+async def extract_answer(request):
     """
     Extract an answer for a user query from Integreat content. Expects a JSON body with message
     and language attributes
     """
-    rag_response = {"status": "error"}
+    result = {"status": "error"}
     if (
         request.method in ("POST")
         and request.META.get("CONTENT_TYPE").lower() == "application/json"
     ):
-        rag_request = RagRequest(json.loads(request.body))
-        answer_service = AnswerService(rag_request)
-        rag_response = answer_service.extract_answer()
-    return JsonResponse(rag_response.as_dict())
+        data = json.loads(request.body)
+        with collect_timings() as timings:
+            async with TrafficCapture("extract_answer", data, timings):
+                rag_request = RagRequest(data)
+                answer_service = AnswerService(rag_request)
+                rag_response = await answer_service.aextract_answer()
+                result = await rag_response.aas_dict()
+        if settings.DEBUG:
+            result["timings"] = timings
+    return JsonResponse(result)
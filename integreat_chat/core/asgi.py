@@ -14,3 +14,12 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'integreat_chat.core.settings')
 
 application = get_asgi_application()
+
+# pylint: disable=wrong-import-position
+from django.conf import settings
+from integreat_chat.core.utils.model_registry import ModelRegistry
+
+if settings.MODEL_PRELOAD:
+    ModelRegistry.preload()
+else:
+    ModelRegistry.warmup()
@@ -15,8 +15,6 @@ import os
 
 from pathlib import Path
 
-from langchain_huggingface import HuggingFaceEmbeddings
-
 config = configparser.ConfigParser()
 if os.path.isfile('/etc/integreat-chat.ini'):
     config.read('/etc/integreat-chat.ini')
@@ -59,17 +57,45 @@ ALLOWED_HOSTS = ["127.0.0.1", "igchat-inference.tuerantuer.org"]
 
 INTEGREAT_CMS_DOMAIN = config["DEFAULT"]["INTEGREAT_CMS_DOMAIN"]
 INTEGREAT_APP_DOMAIN = config["DEFAULT"]["INTEGREAT_APP_DOMAIN"]
+INTEGREAT_CMS_URL = (
+    config["DEFAULT"]["INTEGREAT_CMS_URL"]
+    if "INTEGREAT_CMS_URL" in config["DEFAULT"]
+    else f"https://{INTEGREAT_CMS_DOMAIN}"
+)
 
 # Configuration Variables for answer service
-QUESTION_CLASSIFICATION_MODEL = "llama3.3"
-
-LANGUAGE_CLASSIFICATIONH_MODEL = "llama3.3"
-
 TRANSLATION_MODEL = "facebook/nllb-200-3.3B"
 
+# MODEL_WARMUP - models of the ModelRegistry loaded when a worker boots,
+# all other models are loaded on first use
+MODEL_WARMUP = [
+    name.strip() for name in (
+        config["DEFAULT"]["MODEL_WARMUP"] if "MODEL_WARMUP" in config["DEFAULT"] else ""
+    ).split(",") if name.strip()
+]
+# MODEL_PRELOAD - load and freeze all models when the application module is
+# imported. Use with a pre-forking server (gunicorn --preload) to share the
+# models copy-on-write between workers.
+MODEL_PRELOAD = (
+        config["DEFAULT"]["MODEL_PRELOAD"] if
+        "MODEL_PRELOAD" in config["DEFAULT"] else "False"
+    ) == "True"
+# INFERENCE_WORKER_URL - if set, translations and embeddings are computed by the
+# inference worker (manage.py inference_worker) instead of the web workers
+INFERENCE_WORKER_URL = (
+    config["DEFAULT"]["INFERENCE_WORKER_URL"]
+    if "INFERENCE_WORKER_URL" in config["DEFAULT"]
+    else None
+)
+INFERENCE_WORKER_TIMEOUT = 30
+# INFERENCE_WORKER_MAX_QUEUE - queued requests per operation, further requests
+# are rejected with 503
+INFERENCE_WORKER_MAX_QUEUE = 64
+INFERENCE_WORKER_MAX_BATCH = 16
+INFERENCE_WORKER_BATCH_WAIT = 0.01
+
 RAG_SCORE_THRESHOLD = 0.2
 RAG_MAX_PAGES = 3
-RAG_MODEL = "llama3.3"
 RAG_RELEVANCE_CHECK = (
         config["DEFAULT"]["RAG_RELEVANCE_CHECK"] if
         "RAG_RELEVANCE_CHECK" in config["DEFAULT"] else "True"
@@ -78,12 +104,25 @@ RAG_HUMAN_REQUEST_CHECK = (
         config["DEFAULT"]["RAG_HUMAN_REQUEST_CHECK"] if
         "RAG_HUMAN_REQUEST_CHECK" in config["DEFAULT"] else "True"
     ) == "True"
-RAG_RELEVANCE_CHECK_MODEL = "llama3.3"
 RAG_QUERY_OPTIMIZATION = True
-RAG_QUERY_OPTIMIZATION_MODEL = "llama3.3"
-RAG_CONTEXT_MAX_LENGTH = 8000
+# Token budget for the RAG context, counted with the tokenizer of the RAG model.
+# The tokenizer is loaded from an ungated mirror, the meta-llama repos require a login.
+RAG_CONTEXT_MAX_TOKENS = 2000
+RAG_CONTEXT_TOKENIZER = "unsloth/Llama-3.3-70B-Instruct"
 RAG_SUPPORTED_LANGUAGES = ["en", "de"]
 RAG_FALLBACK_LANGUAGE = "en"
+# RAG_ANSWER_CACHE - opt-in cache for answers of similar messages. Similar messages can
+# differ in meaning, e.g. "Kita für unter 3" and "über 3", so keep the threshold high.
+RAG_ANSWER_CACHE = (
+        config["DEFAULT"]["RAG_ANSWER_CACHE"] if
+        "RAG_ANSWER_CACHE" in config["DEFAULT"] else "False"
+    ) == "True"
+# Minimum cosine similarity of two messages to reuse a cached answer
+RAG_ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
+RAG_ANSWER_CACHE_TTL = 3600 * 24
+RAG_ANSWER_CACHE_MAX_ENTRIES = 1000
+# Seconds an answer cache index is locked while an answer is added
+RAG_ANSWER_CACHE_LOCK_TIMEOUT = 5
 
 # SEARCH_MAX_DOCUMENTS - number of documents retrieved from the VDB
 SEARCH_MAX_DOCUMENTS = 15
@@ -93,18 +132,140 @@ SEARCH_EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-Min
 OPENSEARCH_EMBEDDING_MODEL_NAME = (
     "huggingface/sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
 )
-SEARCH_EMBEDDING_MODEL = HuggingFaceEmbeddings(
-    model_name=SEARCH_EMBEDDING_MODEL_NAME, show_progress=False
-)
 SEARCH_EMBEDDING_MODEL_SUPPORTED_LANGUAGES = [
     "ar","bg","ca","cs","da","de","el","en","es","et","fa","fi","fr","gl","gu","he","hi",
     "hr","hu","hy","id","it","ja","ka","ko","ku","lt","lv","mk","mn","mr","ms","my","nb",
     "nl","pl","pt","ro","ru","sk","sl","sq","sr","sv","th","tr","uk","ur","vi"
 ]
-SEARCH_DENSE_WEIGHT = 0.7
+# SEARCH_HYBRID_WEIGHTS - weights of the hybrid sub-queries: title match, content match,
+# title embedding and content embedding. Used by the OpenSearch search pipeline
+# and the local search backend. Evaluate alternatives with manage.py evaluate_search.
+SEARCH_HYBRID_WEIGHTS = [
+    float(weight) for weight in (
+        config["DEFAULT"]["SEARCH_HYBRID_WEIGHTS"]
+        if "SEARCH_HYBRID_WEIGHTS" in config["DEFAULT"]
+        else "0.15,0.2,0.15,0.5"
+    ).split(",")
+]
+# SEARCH_VECTOR_K - nearest neighbors per vector sub-query
+SEARCH_VECTOR_K = int(
+    config["DEFAULT"]["SEARCH_VECTOR_K"] if "SEARCH_VECTOR_K" in config["DEFAULT"] else "5"
+)
+# SEARCH_FUSION - combination of the hybrid sub-queries: "normalization" (weighted mean of
+# min-max normalized scores) or "rrf" (reciprocal rank fusion, requires OpenSearch 2.19).
+# RRF scores are scaled to 0..1, so score thresholds apply to both.
+SEARCH_FUSION = (
+    config["DEFAULT"]["SEARCH_FUSION"]
+    if "SEARCH_FUSION" in config["DEFAULT"]
+    else "normalization"
+)
+SEARCH_RRF_RANK_CONSTANT = 60
+# SEARCH_CANDIDATES_PER_RESULT - hits fetched per requested result if results are
+# deduplicated by URL, at most SEARCH_MAX_DOCUMENTS
+SEARCH_CANDIDATES_PER_RESULT = 2
+# SEARCH_COLLAPSE - deduplicate search results in OpenSearch by collapsing hits on the url
+# field, so only the best chunk per page is returned. Hybrid queries support collapse
+# since OpenSearch 3.1. Indices need to be recreated for the keyword url field.
+SEARCH_COLLAPSE = (
+        config["DEFAULT"]["SEARCH_COLLAPSE"] if
+        "SEARCH_COLLAPSE" in config["DEFAULT"] else "False"
+    ) == "True"
+# SEARCH_BACKEND - "opensearch" or "local". The local backend keeps the embeddings of
+# each region/language in memory-mapped NumPy arrays in SEARCH_LOCAL_INDEX_DIR and
+# needs no OpenSearch cluster. Indices are built with the index_pages/index_region commands.
+SEARCH_BACKEND = (
+    config["DEFAULT"]["SEARCH_BACKEND"]
+    if "SEARCH_BACKEND" in config["DEFAULT"]
+    else "opensearch"
+)
+SEARCH_LOCAL_INDEX_DIR = (
+    config["DEFAULT"]["SEARCH_LOCAL_INDEX_DIR"]
+    if "SEARCH_LOCAL_INDEX_DIR" in config["DEFAULT"]
+    else str(BASE_DIR / "search_index")
+)
+# SEARCH_LOCAL_QUERY_EMBEDDING - embed the query once in this service and send
+# knn vector queries instead of letting the OpenSearch ML node embed it
+SEARCH_LOCAL_QUERY_EMBEDDING = (
+        config["DEFAULT"]["SEARCH_LOCAL_QUERY_EMBEDDING"] if
+        "SEARCH_LOCAL_QUERY_EMBEDDING" in config["DEFAULT"] else "False"
+    ) == "True"
+SEARCH_QUERY_EMBEDDING_CACHE_TTL = 3600 * 24
+# SEARCH_LOCAL_INDEX_EMBEDDING - compute embeddings in this service when indexing
+# and bypass the ingest pipeline of the OpenSearch ML node
+SEARCH_LOCAL_INDEX_EMBEDDING = (
+        config["DEFAULT"]["SEARCH_LOCAL_INDEX_EMBEDDING"] if
+        "SEARCH_LOCAL_INDEX_EMBEDDING" in config["DEFAULT"] else "False"
+    ) == "True"
+SEARCH_INDEX_EMBEDDING_BATCH_SIZE = 256
+SEARCH_INDEX_BULK_SIZE = 500
+# SEARCH_INDEX_PROFILES - knn_vector methods for the embedding fields of new indices.
+# Quantized profiles reduce the memory of the vector graphs (sq: 8 bit lucene scalar
+# quantization, fp16: half precision faiss vectors). ef_search is sent with knn queries.
+# Compare profiles with manage.py benchmark_index_profiles.
+SEARCH_INDEX_PROFILES = {
+    "default": {
+        "method": {
+            "engine": "lucene",
+            "space_type": "l2",
+            "name": "hnsw",
+            "parameters": {},
+        },
+    },
+    "lucene_sq": {
+        "method": {
+            "engine": "lucene",
+            "space_type": "cosinesimil",
+            "name": "hnsw",
+            "parameters": {
+                "m": 16,
+                "ef_construction": 128,
+                "encoder": {"name": "sq"},
+            },
+        },
+        "ef_search": 100,
+    },
+    "faiss_fp16": {
+        "method": {
+            "engine": "faiss",
+            "space_type": "cosinesimil",
+            "name": "hnsw",
+            "parameters": {
+                "m": 16,
+                "ef_construction": 128,
+                "encoder": {"name": "sq", "parameters": {"type": "fp16"}},
+            },
+        },
+        "ef_search": 100,
+    },
+}
+SEARCH_INDEX_PROFILE = (
+    config["DEFAULT"]["SEARCH_INDEX_PROFILE"]
+    if "SEARCH_INDEX_PROFILE" in config["DEFAULT"]
+    else "default"
+)
+SEARCH_EMBEDDING_DIMENSION = 384
+SEARCH_RESULT_CACHE = (
+        config["DEFAULT"]["SEARCH_RESULT_CACHE"] if
+        "SEARCH_RESULT_CACHE" in config["DEFAULT"] else "True"
+    ) == "True"
+SEARCH_RESULT_CACHE_TTL = 600
+# SEARCH_HIGHLIGHT - return a snippet of the matched chunk instead of the whole chunk
+# in search results. Answers are always generated from whole chunks.
+SEARCH_HIGHLIGHT = (
+        config["DEFAULT"]["SEARCH_HIGHLIGHT"] if
+        "SEARCH_HIGHLIGHT" in config["DEFAULT"] else "False"
+    ) == "True"
+SEARCH_HIGHLIGHT_FRAGMENT_SIZE = 200
 SEARCH_FALLBACK_LANGUAGE = "en"
+# SEARCH_MAX_INDICES - further region/language indices a search request may include
+SEARCH_MAX_INDICES = 5
 SEARCH_OPENSEARCH_MODEL_ID = config["OPENSEARCH"]["MODEL_ID"]
 SEARCH_OPENSEARCH_MODEL_GROUP_ID = config["OPENSEARCH"]["MODEL_GROUP_ID"]
+OPENSEARCH_URL = (
+    config["OPENSEARCH"]["URL"]
+    if "URL" in config["OPENSEARCH"]
+    else "https://localhost:9200"
+)
 OPENSEARCH_USER = (
     config["OPENSEARCH"]["USER"]
     if "USER" in config["OPENSEARCH"]
@@ -116,11 +277,126 @@ OPENSEARCH_PASSWORD = (
     else "changeme"
 )
 
+# Coalesce identical concurrent answer and search requests across workers
+SINGLE_FLIGHT = True
+SINGLE_FLIGHT_LOCK_TIMEOUT = 120
+# SINGLE_FLIGHT_RESULT_TTL - seconds the result of a leader stays available for waiting
+# requests. Identical requests arriving within this time also get the result, so it
+# acts as a short result cache.
+SINGLE_FLIGHT_RESULT_TTL = 10
+SINGLE_FLIGHT_POLL_INTERVAL = 0.1
+
 VDB_HOST = "127.0.0.1"
 VDB_PORT = "19530"
 
 LLM_SERVER=config['LiteLLM']['SERVER']
 LLM_API_KEY=config['LiteLLM']['API_KEY']
+# LLM models are selected by the task of a prompt (see TASKS in Prompts).
+# Tasks are mapped to model tiers. Unclear answers of escalating tasks are
+# escalated to LLM_ESCALATION_TIER. The small tier uses the large model unless
+# SMALL_MODEL is configured, so routing to a smaller model is opt-in.
+LLM_MODEL_TIERS = {
+    "large": (
+        config["LiteLLM"]["LARGE_MODEL"]
+        if "LARGE_MODEL" in config["LiteLLM"]
+        else "llama3.3"
+    ),
+}
+LLM_MODEL_TIERS["small"] = (
+    config["LiteLLM"]["SMALL_MODEL"]
+    if "SMALL_MODEL" in config["LiteLLM"]
+    else LLM_MODEL_TIERS["large"]
+)
+LLM_TASK_TIERS = {
+    "yes_no": "small",
+    "classification": "small",
+    "summarization": "large",
+    "generation": "large",
+}
+LLM_ESCALATION_TIER = "large"
+LLM_ESCALATING_TASKS = ["yes_no", "classification"]
+# LLM_RESPONSE_CACHE - opt-in cache for responses of the prompt types below
+LLM_RESPONSE_CACHE = (
+        config["LiteLLM"]["RESPONSE_CACHE"] if
+        "RESPONSE_CACHE" in config["LiteLLM"] else "False"
+    ) == "True"
+# Cache TTL in seconds for prompt types (names of prompts in Prompts) with
+# deterministic answers. Prompt types not listed here are never cached.
+LLM_RESPONSE_CACHE_TTL = {
+    "CHECK_QUESTION": 3600 * 24,
+    "HUMAN_REQUEST_CHECK": 3600 * 24,
+    "LANGUAGE_CLASSIFICATION": 3600 * 24 * 7,
+    "RELEVANCE_CHECK": 3600 * 24,
+    "OPTIMIZE_MESSAGE": 3600 * 24,
+}
+# Concurrent requests per LLM model and Django worker process
+LLM_CONCURRENCY_LIMITS = {}
+LLM_DEFAULT_CONCURRENCY_LIMIT = 8
+# Scheduling priorities of prompt types, lower values are served first:
+# final answer > gating checks > relevance checks
+LLM_PROMPT_PRIORITIES = {
+    "RAG": 0,
+    "CHECK_QUESTION": 1,
+    "HUMAN_REQUEST_CHECK": 1,
+    "LANGUAGE_CLASSIFICATION": 1,
+    "OPTIMIZE_MESSAGE": 1,
+    "RELEVANCE_CHECK": 2,
+}
+LLM_DEFAULT_PROMPT_PRIORITY = 1
+# Requests are shed if more requests than the maximum depth of their
+# priority are already waiting for a model
+LLM_MAX_QUEUE_DEPTH = {
+    0: 64,
+    1: 32,
+    2: 16,
+}
+# Request timeouts in seconds per prompt type
+LLM_REQUEST_TIMEOUTS = {
+    "RAG": 60,
+}
+LLM_DEFAULT_REQUEST_TIMEOUT = 20
+# Idempotent prompt types that are retried with jittered exponential backoff
+LLM_RETRY_PROMPTS = [
+    "CHECK_QUESTION",
+    "HUMAN_REQUEST_CHECK",
+    "LANGUAGE_CLASSIFICATION",
+    "OPTIMIZE_MESSAGE",
+    "RELEVANCE_CHECK",
+]
+LLM_MAX_RETRIES = 2
+LLM_RETRY_BACKOFF = 0.5
+# Send a duplicate request if a request takes longer than the p95 latency
+# of its prompt type. Latencies are tracked over the last LLM_LATENCY_WINDOW requests.
+LLM_HEDGING = True
+LLM_HEDGED_PROMPTS = [
+    "CHECK_QUESTION",
+    "HUMAN_REQUEST_CHECK",
+    "LANGUAGE_CLASSIFICATION",
+    "OPTIMIZE_MESSAGE",
+    "RAG",
+]
+LLM_HEDGE_MIN_DELAY = 0.5
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_LATENCY_WINDOW = 200
+# Fail fast for LLM_CIRCUIT_BREAKER_COOLDOWN seconds if the error rate of a model
+# within LLM_CIRCUIT_BREAKER_WINDOW seconds exceeds LLM_CIRCUIT_BREAKER_ERROR_RATE
+LLM_CIRCUIT_BREAKER_WINDOW = 60
+LLM_CIRCUIT_BREAKER_MIN_REQUESTS = 10
+LLM_CIRCUIT_BREAKER_ERROR_RATE = 0.5
+LLM_CIRCUIT_BREAKER_COOLDOWN = 30
+
+# TRAFFIC_CAPTURE - append anonymized records of chat, search and translate requests
+# to TRAFFIC_CAPTURE_FILE. Messages are only stored as keyed hash and length.
+# Captured traces can be replayed with manage.py replay_traffic.
+TRAFFIC_CAPTURE = (
+        config["DEFAULT"]["TRAFFIC_CAPTURE"] if
+        "TRAFFIC_CAPTURE" in config["DEFAULT"] else "False"
+    ) == "True"
+TRAFFIC_CAPTURE_FILE = (
+    config["DEFAULT"]["TRAFFIC_CAPTURE_FILE"]
+    if "TRAFFIC_CAPTURE_FILE" in config["DEFAULT"]
+    else str(BASE_DIR / "traffic.jsonl")
+)
 
 # Application definition
 
@@ -0,0 +1,397 @@
+"""
+Startup, benchmark, traffic capture, single-flight and inference worker tests
+"""
+import asyncio
+import gc
+import io
+import json
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+import requests
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, SimpleTestCase
+from django.test.utils import override_settings
+
+from integreat_chat.core.utils.metrics import collect_timings, stage
+from integreat_chat.core.utils.model_registry import ModelRegistry
+
+from .utils.benchmark import SCENARIOS, Benchmark
+from .utils.fake_services import LatencyDistribution
+from .utils.inference_client import InferenceClient, InferenceUnavailableError
+from .utils.inference_worker import BatchQueue, InferenceRequestHandler
+from .utils.single_flight import SingleFlight
+from .utils.traffic_capture import build_replay_payload, synthesize_message
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+# IMPORT_TIME_BUDGET - seconds for setting up Django and importing all views
+IMPORT_TIME_BUDGET = 5.0
+# P95_BUDGET - seconds of overhead per request on top of the fake service latencies
+P95_BUDGET = 1.0
+HEAVY_MODULES = ["torch", "transformers", "sentence_transformers", "spacy"]
+
+STARTUP_SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+import integreat_chat.core.urls
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "heavy_modules": [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+class StartupTest(SimpleTestCase):
+    """
+    Loading the app must not load models. Models are loaded by the ModelRegistry.
+    """
+
+    def measure_startup(self) -> dict:
+        """
+        Set up Django in a fresh interpreter
+        """
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT],
+            capture_output=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent.parent,
+            env={
+                **os.environ,
+                "DJANGO_SETTINGS_MODULE": "integreat_chat.core.settings",
+            },
+            text=True,
+        )
+        return json.loads(output.stdout.splitlines()[-1])
+
+    def test_no_models_loaded_on_startup(self):
+        """
+        Importing settings and views does not import model frameworks
+        """
+        self.assertEqual(self.measure_startup()["heavy_modules"], [])
+
+    def test_import_time_budget(self):
+        """
+        Importing settings and views stays within the import time budget
+        """
+        self.assertLess(self.measure_startup()["seconds"], IMPORT_TIME_BUDGET)
+
+
+class FakeModel:
+    """
+    Model with torch-like eval() and parameters() and a few MiB of weights
+    """
+
+    def __init__(self, size: int) -> None:
+        """
+        param size: MiB of weights
+        """
+        self.weights = b"w" * size * 1024 * 1024
+        self.evaluating = False
+
+    def eval(self) -> None:
+        """
+        Switch to inference mode
+        """
+        self.evaluating = True
+
+    def parameters(self) -> list:
+        """
+        Weights that could require gradients
+        """
+        return []
+
+
+class ModelPreloadTest(SimpleTestCase):
+    """
+    Preloading and memory per model of the ModelRegistry
+    """
+
+    def setUp(self):
+        self.loads = []
+        loaders = {
+            name: lambda name=name, size=size: self.load(name, size)
+            for name, size in [("embedding", 16), ("tokenizer", 8)]
+        }
+        for patcher in [
+            mock.patch.dict(ModelRegistry.loaders, loaders, clear=True),
+            mock.patch.dict(ModelRegistry.models, clear=True),
+            mock.patch.dict(
+                ModelRegistry.locks, {name: threading.Lock() for name in loaders}, clear=True
+            ),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def load(self, name: str, size: int) -> FakeModel:
+        """
+        Fake loader that records loads
+        """
+        self.loads.append(name)
+        return FakeModel(size)
+
+    @override_settings(INFERENCE_WORKER_URL=None)
+    def test_preload(self):
+        """
+        All models are loaded once, put in inference mode and the heap is frozen
+        """
+        with mock.patch.object(gc, "freeze") as freeze:
+            ModelRegistry.preload()
+            ModelRegistry.get("embedding")
+        self.assertEqual(self.loads, ["embedding", "tokenizer"])
+        self.assertTrue(all(model.evaluating for model in ModelRegistry.models.values()))
+        freeze.assert_called_once()
+
+    @override_settings(INFERENCE_WORKER_URL="http://127.0.0.1:8765")
+    def test_preload_skips_worker_models(self):
+        """
+        Models of the inference worker are not loaded by the web processes
+        """
+        with mock.patch.object(gc, "freeze"):
+            ModelRegistry.preload()
+        self.assertEqual(self.loads, ["tokenizer"])
+
+    def test_memory_report_per_model(self):
+        """
+        memory_report --models prints the memory of every model
+        """
+        output = io.StringIO()
+        call_command("memory_report", "--models", stdout=output)
+        rows = {
+            line.split()[0]: float(line.split()[1])
+            for line in output.getvalue().splitlines()[1:-1]
+        }
+        self.assertEqual(list(rows), ["embedding", "tokenizer"])
+        self.assertGreaterEqual(rows["embedding"], 15)
+        self.assertGreaterEqual(rows["tokenizer"], 7)
+        self.assertIn("Total models:", output.getvalue())
+
+
+STAGE_SCRIPT = """
+import django
+django.setup()
+from integreat_chat.core.utils.metrics import collect_timings, stage
+with collect_timings():
+    with stage("worker_stage"):
+        pass
+"""
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class MetricsTest(SimpleTestCase):
+    """
+    Prometheus exposition of the stage histograms
+    """
+
+    def test_stage_histograms(self):
+        """
+        Stages timed in a request are exposed
+        """
+        with collect_timings() as timings:
+            with stage("metrics_test_stage"):
+                pass
+        self.assertEqual(timings[0]["name"], "metrics_test_stage")
+        response = Client().get("/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'integreat_chat_stage_duration_seconds_count{stage="metrics_test_stage"} 1.0',
+            response.content.decode(),
+        )
+
+    def test_multiprocess(self):
+        """
+        Stages timed in other worker processes are aggregated
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            env = {
+                **os.environ,
+                "DJANGO_SETTINGS_MODULE": "integreat_chat.core.settings",
+                "PROMETHEUS_MULTIPROC_DIR": directory,
+            }
+            for _ in range(2):
+                subprocess.run(
+                    [sys.executable, "-c", STAGE_SCRIPT], check=True, env=env,
+                    cwd=Path(__file__).resolve().parent.parent, capture_output=True,
+                )
+            with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}):
+                response = Client().get("/metrics")
+        self.assertIn(
+            'integreat_chat_stage_duration_seconds_count{stage="worker_stage"} 2.0',
+            response.content.decode(),
+        )
+
+
+class BenchmarkTest(SimpleTestCase):
+    """
+    Endpoints handle concurrent requests against fake backing services
+    """
+
+    def test_endpoints_within_budget(self):
+        """
+        All scenarios succeed and stay within the latency budget
+        """
+        results = Benchmark(
+            latencies={"llm": LatencyDistribution(0.01)}, concurrency=4, requests=12
+        ).run(list(SCENARIOS))
+        for scenario, result in results.items():
+            with self.subTest(scenario=scenario):
+                self.assertEqual(result["errors"], 0)
+                self.assertLess(result["p95"], P95_BUDGET)
+
+
+class TrafficCaptureTest(SimpleTestCase):
+    """
+    Captured traffic is anonymized and can be replayed
+    """
+
+    def test_capture_is_anonymized(self):
+        """
+        Records contain the message hash and length but not the message
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            capture_file = Path(directory) / "traffic.jsonl"
+            with override_settings(TRAFFIC_CAPTURE=True, TRAFFIC_CAPTURE_FILE=str(capture_file)):
+                Benchmark(with_caches=True, requests=4).run(["search_documents"])
+            records = [json.loads(line) for line in capture_file.read_text().splitlines()]
+        self.assertEqual(len(records), 4)
+        for record in records:
+            self.assertNotIn("message", record)
+            self.assertEqual(record["status"], 200)
+            self.assertTrue(record["timings"])
+        replayed = [build_replay_payload(record)["message"] for record in records]
+        self.assertEqual(
+            [len(message) for message in replayed],
+            [record["message_length"] for record in records],
+        )
+        self.assertEqual(len(set(replayed)), len({record["message_hash"] for record in records}))
+
+    def test_synthetic_messages_unique(self):
+        """
+        Short synthetic messages of different hashes differ and keep their length
+        """
+        hashes = [f"{number:032x}"[::-1] for number in range(100)]
+        messages = [synthesize_message(message_hash, 12) for message_hash in hashes]
+        self.assertEqual(len(set(messages)), len(hashes))
+        self.assertEqual({len(message) for message in messages}, {12})
+        self.assertEqual(synthesize_message(hashes[0], 12), messages[0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SINGLE_FLIGHT=True, SINGLE_FLIGHT_POLL_INTERVAL=0.01)
+class SingleFlightTest(SimpleTestCase):
+    """
+    Identical concurrent requests are computed once
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    async def compute(self, fail: bool = False) -> str:
+        """
+        Slow computation that optionally fails
+        """
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        if fail:
+            raise RuntimeError("Leader failed")
+        return f"result {self.calls}"
+
+    def run_concurrently(self, *funcs) -> list:
+        """
+        Run functions as identical single-flight requests, the first one leads
+        """
+        async def run():
+            tasks = []
+            for func in funcs:
+                tasks.append(asyncio.create_task(SingleFlight("test", ["message"]).run(func)))
+                await asyncio.sleep(0.01)
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+        return asyncio.run(run())
+
+    def test_followers_use_result_of_leader(self):
+        """
+        Followers wait for the leader instead of computing the result
+        """
+        results = self.run_concurrently(self.compute, self.compute, self.compute)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ["result 1"] * 3)
+
+    def test_takeover(self):
+        """
+        A follower takes over if the leader fails
+        """
+        results = self.run_concurrently(lambda: self.compute(fail=True), self.compute)
+        self.assertIsInstance(results[0], RuntimeError)
+        self.assertEqual(results[1], "result 2")
+        self.assertEqual(self.calls, 2)
+
+
+def translate_batch(key: tuple[str, str], messages: list[str]) -> list[str]:
+    """
+    Fake translation that only supports English as target language
+    """
+    if key[1] != "en":
+        raise KeyError(f"Language pair {key} not supported")
+    return [f"[{key[1]}] {message}" for message in messages]
+
+
+class InferenceWorkerTest(SimpleTestCase):
+    """
+    Inference worker API and client with fake models
+    """
+
+    def setUp(self):
+        queues = {
+            "translate": BatchQueue("translate", translate_batch),
+            "embed": BatchQueue("embed", lambda _, texts: [[[1.0]] * len(t) for t in texts]),
+        }
+        patcher = mock.patch.object(InferenceRequestHandler, "queues", queues)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), InferenceRequestHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f"http://127.0.0.1:{server.server_address[1]}"
+        self.client = InferenceClient(self.url)
+
+    def test_inference(self):
+        """
+        Translations and embeddings are returned per request
+        """
+        self.assertEqual(self.client.translate("de", "en", "Hallo"), "[en] Hallo")
+        self.assertEqual(self.client.embed(["eins", "zwei"]), [[1.0], [1.0]])
+
+    def test_client_errors(self):
+        """
+        Unsupported language pairs raise KeyError, an overloaded or unreachable
+        worker raises InferenceUnavailableError
+        """
+        with self.assertRaises(KeyError):
+            self.client.translate("de", "fr", "Hallo")
+        with mock.patch.object(
+            InferenceRequestHandler.queues["translate"], "submit", side_effect=queue.Full
+        ):
+            with self.assertRaises(InferenceUnavailableError):
+                self.client.translate("de", "en", "Hallo")
+        with self.assertRaises(InferenceUnavailableError):
+            InferenceClient("http://127.0.0.1:9").translate("de", "en", "Hallo")
+
+    def test_malformed_requests(self):
+        """
+        Invalid JSON and missing attributes are rejected with 400
+        """
+        response = requests.post(f"{self.url}/translate", data="{", timeout=5)
+        self.assertEqual(response.status_code, 400)
+        response = requests.post(f"{self.url}/translate", json={"message": "Hallo"}, timeout=5)
+        self.assertEqual(response.status_code, 400)
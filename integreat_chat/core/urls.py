@@ -1,8 +1,9 @@
 """
 URL configuration for integreat_chat project.
 """
-from django.urls import path, include
+from django.urls import path, include, re_path
 
+from integreat_chat.core.views import metrics
 from integreat_chat.search.views import search_documents
 from integreat_chat.translate.views import translate_message
 
@@ -15,4 +16,5 @@ urlpatterns = [
     path('chatanswers/', include('integreat_chat.chatanswers.urls')),
     path('search/', include('integreat_chat.search.urls')),
     path('translate/', include('integreat_chat.translate.urls')),
+    re_path(r'^metrics/?$', metrics, name="metrics"),
 ]
@@ -0,0 +1,191 @@
+"""
+Offline benchmark of the HTTP endpoints against fake backing services
+"""
+import logging
+import time
+
+import asyncio
+import numpy
+from django.test import AsyncClient
+from django.test.utils import override_settings
+
+from .fake_services import (
+    FakeCmsServer, FakeInferenceWorker, FakeLlmServer, FakeOpenSearchServer, LatencyDistribution
+)
+
+LOGGER = logging.getLogger("django")
+
+SCENARIOS = {
+    "extract_answer": "/chatanswers/extract_answer/",
+    "search_documents": "/search/documents/",
+    "translate_message": "/translate/message/",
+}
+
+MESSAGES = [
+    "Wo kann ich einen Deutschkurs machen?",
+    "Wie melde ich meine Wohnung an?",
+    "Ich suche eine Kinderarztpraxis in der Nähe.",
+    "Welche Unterlagen brauche ich für die Ausländerbehörde?",
+    "Wie bekomme ich ein Bankkonto?",
+    "Wo finde ich eine Beratung zur Arbeitssuche?",
+]
+
+
+class Benchmark:
+    """
+    Send requests to the views at a controlled concurrency. LiteLLM,
+    OpenSearch, the Integreat CMS and the inference worker are replaced by
+    local fake services with configurable latency distributions.
+    """
+
+    def __init__(
+            self,
+            latencies: dict[str, LatencyDistribution] | None = None,
+            concurrency: int = 8,
+            requests: int = 100,
+            with_caches: bool = False,
+            region: str = "testumgebung",
+            language: str = "de",
+        ) -> None:
+        """
+        param latencies: latency per fake service: llm, opensearch, cms and inference
+        param concurrency: number of requests in flight
+        param requests: number of requests per scenario
+        param with_caches: keep response caches and single-flight enabled. Messages
+                           are repeated in this case, otherwise every message is unique.
+        param region: region slug of the requests
+        param language: GUI language and detected language of the messages
+        """
+        self.latencies = latencies or {}
+        self.concurrency = concurrency
+        self.requests = requests
+        self.with_caches = with_caches
+        self.region = region
+        self.language = language
+
+    def get_message(self, number: int) -> str:
+        """
+        Message of the n-th request
+        """
+        message = MESSAGES[number % len(MESSAGES)]
+        return message if self.with_caches else f"{message} {number}"
+
+    def get_payload(self, scenario: str, number: int) -> dict:
+        """
+        Request body of the n-th request of a scenario
+        """
+        if scenario == "translate_message":
+            return {
+                "source_language": self.language,
+                "target_language": "en",
+                "message": self.get_message(number),
+            }
+        return {
+            "message": self.get_message(number),
+            "language": self.language,
+            "region": self.region,
+        }
+
+    def get_settings(self, services: dict) -> dict:
+        """
+        Settings that point the app to the fake services
+        """
+        overrides = {
+            "LLM_SERVER": services["llm"].url,
+            "OPENSEARCH_URL": services["opensearch"].url,
+            "INTEGREAT_CMS_URL": services["cms"].url,
+            "INFERENCE_WORKER_URL": services["inference"].url,
+            "ALLOWED_HOSTS": ["testserver"],
+            "CACHES": {
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+            },
+        }
+        if not self.with_caches:
+            overrides.update({
+                "LLM_RESPONSE_CACHE": False,
+                "RAG_ANSWER_CACHE": False,
+                "SEARCH_RESULT_CACHE": False,
+                "SINGLE_FLIGHT": False,
+            })
+        return overrides
+
+    def run(self, scenarios: list[str]) -> dict[str, dict]:
+        """
+        Start the fake services and run the scenarios one after another
+
+        param scenarios: names of scenarios in SCENARIOS
+        return: summary per scenario, see summarize()
+        """
+        services = {
+            "llm": FakeLlmServer(self.latencies.get("llm"), language=self.language),
+            "opensearch": FakeOpenSearchServer(self.latencies.get("opensearch")),
+            "cms": FakeCmsServer(self.latencies.get("cms")),
+            "inference": FakeInferenceWorker(self.latencies.get("inference")),
+        }
+        for service in services.values():
+            service.start()
+        try:
+            with override_settings(**self.get_settings(services)):
+                results = {}
+                for scenario in scenarios:
+                    LOGGER.info("Running benchmark scenario %s", scenario)
+                    results[scenario] = asyncio.run(self.run_scenario(scenario))
+                    results[scenario]["backend_requests"] = {
+                        name: service.requests for name, service in services.items()
+                    }
+                    for service in services.values():
+                        service.requests = 0
+                return results
+        finally:
+            for service in services.values():
+                service.stop()
+
+    async def run_scenario(self, scenario: str) -> dict:
+        """
+        Send the requests of a scenario with at most self.concurrency in flight
+        """
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send(number: int) -> tuple[float, bool]:
+            async with semaphore:
+                start = time.monotonic()
+                try:
+                    response = await client.post(
+                        SCENARIOS[scenario],
+                        self.get_payload(scenario, number),
+                        content_type="application/json",
+                    )
+                    success = (
+                        response.status_code == 200
+                        and response.json().get("status") != "error"
+                    )
+                except Exception:  # pylint: disable=broad-exception-caught
+                    LOGGER.exception("Benchmark request %i of %s failed", number, scenario)
+                    success = False
+                return time.monotonic() - start, success
+
+        start = time.monotonic()
+        results = await asyncio.gather(*[send(number) for number in range(self.requests)])
+        return self.summarize(results, time.monotonic() - start)
+
+    @staticmethod
+    def summarize(results: list[tuple[float, bool]], duration: float) -> dict:
+        """
+        Throughput and latency percentiles of a scenario
+
+        param results: latency and success of every request
+        param duration: wall clock time of the scenario in seconds
+        """
+        latencies = [latency for latency, _ in results]
+        p50, p95, p99 = numpy.percentile(latencies, [50, 95, 99])
+        return {
+            "requests": len(results),
+            "errors": sum(1 for _, success in results if not success),
+            "duration": duration,
+            "throughput": len(results) / duration,
+            "mean": float(numpy.mean(latencies)),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+        }
@@ -0,0 +1,433 @@
+"""
+Local stand-ins for LiteLLM, OpenSearch, the Integreat CMS and the inference
+worker. They answer like the real services after a sampled latency and are
+used for offline benchmarks.
+"""
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.conf import settings
+
+from integreat_chat.chatanswers.static.prompts import Prompts
+
+LOGGER = logging.getLogger("django")
+
+
+class LatencyDistribution:
+    """
+    Log-normal latency distribution. A sigma of 0 results in a fixed latency.
+    """
+
+    def __init__(self, median: float = 0.0, sigma: float = 0.0) -> None:
+        """
+        param median: median latency in seconds
+        param sigma: standard deviation of the underlying normal distribution
+        """
+        self.median = median
+        self.sigma = sigma
+
+    @classmethod
+    def parse(cls, value: str) -> "LatencyDistribution":
+        """
+        Parse "median" or "median:sigma", e.g. "0.8:0.5"
+        """
+        median, _, sigma = value.partition(":")
+        return cls(float(median), float(sigma or 0))
+
+    def sample(self) -> float:
+        """
+        Draw a latency in seconds
+        """
+        if self.sigma == 0:
+            return self.median
+        return self.median * math.exp(random.gauss(0, self.sigma))
+
+    def __str__(self) -> str:
+        return f"{self.median}:{self.sigma}"
+
+
+class FakeRequestHandler(BaseHTTPRequestHandler):
+    """
+    Pass requests to the handle() method of the fake service
+    """
+    server: "FakeHttpServer"
+
+    def respond(self, method: str) -> None:
+        """
+        Wait for the sampled latency and send the response of the service
+        """
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(self.server.service.latency.sample())
+        try:
+            status, payload = self.server.service.handle(method, self.path, body)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            LOGGER.exception("Fake %s failed", self.server.service.name)
+            status, payload = 500, {"error": str(exc)}
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.respond("GET")
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self.respond("POST")
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        self.respond("PUT")
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        self.respond("DELETE")
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        LOGGER.debug("Fake %s: %s", self.server.service.name, format % args)
+
+
+class FakeHttpServer(ThreadingHTTPServer):
+    """
+    HTTP server of a fake service
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, service: "FakeService") -> None:
+        self.service = service
+        super().__init__(("127.0.0.1", 0), FakeRequestHandler)
+
+
+class FakeService:
+    """
+    Base class of fake services. Services listen on a free local port
+    and answer in threads, so concurrent requests wait in parallel.
+    """
+    name = "service"
+
+    def __init__(self, latency: LatencyDistribution | None = None) -> None:
+        """
+        param latency: latency of responses
+        """
+        self.latency = latency or LatencyDistribution()
+        self.server = None
+        self.requests = 0
+        self.requests_lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        """
+        Base URL of the running service
+        """
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> "FakeService":
+        """
+        Start serving in a background thread
+        """
+        self.server = FakeHttpServer(self)
+        threading.Thread(
+            target=self.server.serve_forever, daemon=True, name=f"fake-{self.name}"
+        ).start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop serving
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeService":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def count_request(self) -> None:
+        """
+        Count handled requests
+        """
+        with self.requests_lock:
+            self.requests += 1
+
+    def handle(self, method: str, path: str, body: bytes) -> tuple[int, dict | list]:
+        """
+        Answer a request
+
+        param method: HTTP method
+        param path: request path including the query string
+        param body: raw request body
+        return: HTTP status and JSON payload
+        """
+        raise NotImplementedError
+
+
+class FakeLlmServer(FakeService):
+    """
+    OpenAI-compatible chat completions API. Prompts are recognized by the
+    templates in Prompts. Language classification answers with a fixed
+    language, yes/no checks let every message pass to answer generation.
+    """
+    name = "llm"
+    answers = {
+        "HUMAN_REQUEST_CHECK": "No",
+        "CHECK_QUESTION": "yes",
+        "RELEVANCE_CHECK": "yes",
+    }
+
+    def __init__(self, latency: LatencyDistribution | None = None, language: str = "de") -> None:
+        """
+        param latency: latency of responses
+        param language: BCP-47 tag returned by language classification
+        """
+        super().__init__(latency)
+        self.language = language
+        self.templates = {
+            prompt_type: getattr(Prompts, prompt_type).split("{")[0]
+            for prompt_type in Prompts.TASKS
+        }
+
+    def get_prompt_type(self, message: str) -> str | None:
+        """
+        Prompt type of a user message
+        """
+        for prompt_type, template in self.templates.items():
+            if message.startswith(template):
+                return prompt_type
+        return None
+
+    def get_answer(self, body: dict) -> str:
+        """
+        Content of the completion
+        """
+        if "response_format" in body:
+            return json.dumps({"bcp47-tag": self.language})
+        message = body["messages"][-1]["content"]
+        prompt_type = self.get_prompt_type(message)
+        if prompt_type in self.answers:
+            return self.answers[prompt_type]
+        if prompt_type == "OPTIMIZE_MESSAGE":
+            return message.rsplit("Text: ", 1)[-1][:150]
+        return (
+            "This is a generated answer. It summarizes the retrieved pages in "
+            "three sentences. It is only used for benchmarks."
+        )
+
+    def handle(self, method: str, path: str, body: bytes) -> tuple[int, dict | list]:
+        if method != "POST" or not path.endswith("/chat/completions"):
+            return 404, {"error": f"Unknown path {path}"}
+        self.count_request()
+        request = json.loads(body)
+        return 200, {
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.get_answer(request)},
+                "finish_reason": "stop",
+            }],
+        }
+
+
+class FakeOpenSearchServer(FakeService):
+    """
+    OpenSearch _search, _msearch, _doc, _bulk, _settings and _cat/indices
+    endpoints. Searches return hits on pages of the index region and language
+    with decreasing scores.
+    """
+    name = "opensearch"
+
+    def __init__(
+            self,
+            latency: LatencyDistribution | None = None,
+            hits: int = 10,
+            indices: list[str] | None = None,
+            failing_bulk_items: int = 0,
+        ) -> None:
+        """
+        param latency: latency of responses
+        param hits: number of hits per search
+        param indices: names of existing indices, _msearch fails for other indices if set
+        param failing_bulk_items: number of documents of every _bulk request that fail
+        """
+        super().__init__(latency)
+        self.hits = hits
+        self.indices = indices or []
+        self.index_settings = {}
+        self.failing_bulk_items = failing_bulk_items
+        self.bulk_requests = []
+
+    def search_response(self, index: str, size: int | None = None) -> dict:
+        """
+        Search response for an index named {region}_{language}
+
+        param size: requested number of hits
+        """
+        region, _, language = index.partition("_")
+        hits = min(self.hits, size if size is not None else 10)
+        return {
+            "took": 1,
+            "timed_out": False,
+            "hits": {
+                "total": {"value": hits, "relation": "eq"},
+                "max_score": 1.0,
+                "hits": [
+                    {
+                        "_index": index,
+                        "_id": f"page-{number}",
+                        "_score": round(1 - number / (self.hits + 1), 4),
+                        "_source": {
+                            "url": (
+                                f"https://{settings.INTEGREAT_APP_DOMAIN}/"
+                                f"{region}/{language}/page-{number}/"
+                            ),
+                            "title": f"Page {number}",
+                            "chunk_text": f"Chunk of page {number} that matches the query.",
+                        },
+                    }
+                    for number in range(hits)
+                ],
+            },
+        }
+
+    def handle(self, method: str, path: str, body: bytes) -> tuple[int, dict | list]:
+        self.count_request()
+        segments = urlparse(path).path.strip("/").split("/")
+        if "_msearch" in segments:
+            lines = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+            return 200, {"took": 1, "responses": [
+                self.search_response(header.get("index", segments[0]), payload.get("size"))
+                if not self.indices or header.get("index") in self.indices
+                else {
+                    "error": {
+                        "type": "index_not_found_exception",
+                        "reason": f"no such index [{header.get('index')}]",
+                    },
+                    "status": 404,
+                }
+                for header, payload in zip(lines[::2], lines[1::2])
+            ]}
+        if "_search" in segments:
+            return 200, self.search_response(
+                segments[0], json.loads(body or b"{}").get("size")
+            )
+        if segments[:2] == ["_cat", "indices"]:
+            return 200, [{"index": index} for index in self.indices]
+        if "_settings" in segments and method == "PUT":
+            for index in segments[0].split(","):
+                self.index_settings[index] = json.loads(body)
+            return 200, {"acknowledged": True}
+        if "_bulk" in segments:
+            lines = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+            self.bulk_requests.append((path, lines))
+            items = [
+                {"index": {
+                    "_index": header["index"]["_index"],
+                    "_id": header["index"]["_id"],
+                    **(
+                        {"status": 400, "error": {"type": "mapper_parsing_exception"}}
+                        if position < self.failing_bulk_items else {"status": 201}
+                    ),
+                }}
+                for position, header in enumerate(lines[::2])
+            ]
+            return 200, {"took": 1, "errors": self.failing_bulk_items > 0, "items": items}
+        if "_doc" in segments:
+            return 200, {"_index": segments[0], "result": "created"}
+        return 200, {"acknowledged": True}
+
+
+class FakeCmsServer(FakeService):
+    """
+    Integreat CMS API for languages, pages and children of a page
+    """
+    name = "cms"
+    languages = ["de", "en"]
+
+    def __init__(self, latency: LatencyDistribution | None = None, pages: int = 10) -> None:
+        """
+        param latency: latency of responses
+        param pages: number of pages per region and language
+        """
+        super().__init__(latency)
+        self.pages = pages
+
+    def page(self, region: str, language: str, slug: str) -> dict:
+        """
+        Page object like the CMS returns it
+        """
+        return {
+            "id": int(hashlib.sha256(f"{region}/{slug}".encode("utf-8")).hexdigest()[:8], 16),
+            "path": f"/{region}/{language}/{slug}/",
+            "title": f"Title of {slug}",
+            "excerpt": f"Excerpt of {slug}. It contains a few sentences of page content.",
+            "content": f"<h1>{slug}</h1><p>Content of {slug}.</p>",
+            "available_languages": {
+                other: {"path": f"/{region}/{other}/{slug}/"}
+                for other in self.languages if other != language
+            },
+        }
+
+    def handle(self, method: str, path: str, body: bytes) -> tuple[int, dict | list]:
+        self.count_request()
+        url = urlparse(path)
+        if re.match(r"^/api/v3/([^/]+)/languages/?$", url.path):
+            return 200, [{"code": language} for language in self.languages]
+        if match := re.match(r"^/api/v3/([^/]+)/([^/]+)/pages/?$", url.path):
+            return 200, [
+                self.page(match.group(1), match.group(2), f"page-{number}")
+                for number in range(self.pages)
+            ]
+        if re.match(r"^/api/v3/([^/]+)/([^/]+)/children/?$", url.path):
+            page_path = parse_qs(url.query)["url"][0]
+            region, language, slug = page_path.strip("/").split("/")[:3]
+            return 200, [self.page(region, language, slug)]
+        return 404, {"error": f"Unknown path {path}"}
+
+
+class FakeInferenceWorker(FakeService):
+    """
+    Inference worker API, see manage.py inference_worker
+    """
+    name = "inference"
+
+    def __init__(self, latency: LatencyDistribution | None = None, dimension: int = 384) -> None:
+        """
+        param latency: latency of responses
+        param dimension: dimension of embeddings
+        """
+        super().__init__(latency)
+        self.dimension = dimension
+
+    def embed(self, text: str) -> list[float]:
+        """
+        Deterministic unit vector for a text
+        """
+        generator = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        vector = [generator.gauss(0, 1) for _ in range(self.dimension)]
+        norm = math.sqrt(sum(value * value for value in vector))
+        return [value / norm for value in vector]
+
+    def handle(self, method: str, path: str, body: bytes) -> tuple[int, dict | list]:
+        if method == "GET":
+            return 200, {"status": "ok"}
+        self.count_request()
+        request = json.loads(body)
+        if path == "/translate":
+            return 200, {
+                "translation": f"[{request['target_language']}] {request['message']}"
+            }
+        if path == "/embed":
+            return 200, {"embeddings": [self.embed(text) for text in request["texts"]]}
+        return 404, {"error": f"Unknown path {path}"}
@@ -0,0 +1,70 @@
+"""
+Client for the local inference worker
+"""
+import logging
+
+import requests
+from django.conf import settings
+
+LOGGER = logging.getLogger("django")
+
+
+class InferenceUnavailableError(Exception):
+    """
+    Raised if the inference worker is overloaded or does not respond
+    """
+
+
+class InferenceClient:
+    """
+    Thin client for the inference worker, see manage.py inference_worker
+    """
+
+    def __init__(self, base_url: str | None = None) -> None:
+        """
+        param base_url: URL of the inference worker, defaults to INFERENCE_WORKER_URL
+        """
+        self.base_url = (base_url or settings.INFERENCE_WORKER_URL).rstrip("/")
+
+    def request(self, path: str, payload: dict) -> dict:
+        """
+        Send a request to the inference worker
+
+        param path: operation path
+        param payload: JSON payload
+        """
+        try:
+            response = requests.post(
+                f"{self.base_url}{path}", json=payload, timeout=settings.INFERENCE_WORKER_TIMEOUT
+            )
+        except requests.RequestException as exc:
+            raise InferenceUnavailableError(f"Inference worker request failed: {exc}") from exc
+        if response.status_code == 404:
+            raise KeyError(response.json()["error"])
+        if response.status_code in (503, 504):
+            LOGGER.warning("Inference worker rejected %s request", path)
+            raise InferenceUnavailableError(response.json()["error"])
+        response.raise_for_status()
+        return response.json()
+
+    def translate(self, source_language: str, target_language: str, message: str) -> str:
+        """
+        Translate a message
+
+        param source_language: language slug of the message
+        param target_language: language slug of the translation
+        param message: message to translate
+        """
+        return self.request("/translate", {
+            "source_language": source_language,
+            "target_language": target_language,
+            "message": message,
+        })["translation"]
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed texts with the search embedding model
+
+        param texts: texts to embed
+        """
+        return self.request("/embed", {"texts": texts})["embeddings"]
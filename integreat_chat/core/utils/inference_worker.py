@@ -0,0 +1,195 @@
+"""
+Out-of-process inference worker. The worker owns the translation and
+embedding models and batches requests of all web workers.
+"""
+import concurrent.futures
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+from django.conf import settings
+
+from integreat_chat.core.utils.model_registry import ModelRegistry
+from integreat_chat.translate.services.language import LanguageService
+
+LOGGER = logging.getLogger("django")
+
+
+class BatchQueue:
+    """
+    Bounded queue that collects requests for a short time and processes
+    requests with the same key in one batch
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any, list], list]) -> None:
+        """
+        param name: name of the operation
+        param handler: function that processes a list of payloads with the same key
+                       and returns a result per payload
+        """
+        self.name = name
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=settings.INFERENCE_WORKER_MAX_QUEUE)
+        threading.Thread(target=self.run, daemon=True, name=f"batch-{name}").start()
+
+    def submit(self, key: Any, payload: Any) -> concurrent.futures.Future:
+        """
+        Queue a request
+
+        param key: requests with equal keys can be batched
+        param payload: payload passed to the handler
+        raise queue.Full: if the queue is full
+        """
+        future = concurrent.futures.Future()
+        self.queue.put_nowait((key, payload, future))
+        return future
+
+    def collect(self) -> list[tuple[Any, Any, concurrent.futures.Future]]:
+        """
+        Wait for a request and collect further requests for up to INFERENCE_WORKER_BATCH_WAIT
+        """
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + settings.INFERENCE_WORKER_BATCH_WAIT
+        while len(batch) < settings.INFERENCE_WORKER_MAX_BATCH:
+            try:
+                batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self) -> None:
+        """
+        Process batches forever
+        """
+        while True:
+            groups = defaultdict(list)
+            for key, payload, future in self.collect():
+                groups[key].append((payload, future))
+            for key, items in groups.items():
+                start = time.monotonic()
+                try:
+                    results = self.handler(key, [payload for payload, _ in items])
+                except Exception as exc:  # pylint: disable=broad-exception-caught
+                    for _, future in items:
+                        future.set_exception(exc)
+                    continue
+                for (_, future), result in zip(items, results):
+                    future.set_result(result)
+                LOGGER.debug(
+                    "Processed %s batch of %i requests in %.3fs",
+                    self.name, len(items), time.monotonic() - start
+                )
+
+
+def translate_batch(key: tuple[str, str], messages: list[str]) -> list[str]:
+    """
+    Translate messages with the same language pair
+    """
+    return LanguageService().local_translation_pipeline(key[0], key[1], messages)
+
+
+def embed_batch(_, texts: list[list[str]]) -> list[list[list[float]]]:
+    """
+    Embed the texts of several requests at once
+    """
+    embeddings = ModelRegistry.get("embedding").embed_documents(
+        [text for request_texts in texts for text in request_texts]
+    )
+    results = []
+    for request_texts in texts:
+        results.append(embeddings[:len(request_texts)])
+        embeddings = embeddings[len(request_texts):]
+    return results
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of the inference worker
+    """
+    queues: dict[str, BatchQueue] = {}
+
+    def send_json(self, status: int, data: dict) -> None:
+        """
+        Send JSON response
+        """
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 503:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        Health check with queue depths
+        """
+        self.send_json(200, {
+            "status": "success",
+            "queued": {name: batch_queue.queue.qsize() for name, batch_queue in self.queues.items()},
+        })
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """
+        Queue request and wait for the result of its batch
+        """
+        try:
+            data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError:
+            self.send_json(400, {"status": "error", "error": "Invalid JSON request"})
+            return
+        try:
+            if self.path == "/translate":
+                future = self.queues["translate"].submit(
+                    (data["source_language"], data["target_language"]), data["message"]
+                )
+                result_name = "translation"
+            elif self.path == "/embed":
+                future = self.queues["embed"].submit(None, data["texts"])
+                result_name = "embeddings"
+            else:
+                self.send_json(400, {"status": "error", "error": f"Unknown path {self.path}"})
+                return
+        except (KeyError, TypeError) as exc:
+            self.send_json(400, {"status": "error", "error": f"Missing attribute {exc}"})
+            return
+        except queue.Full:
+            self.send_json(503, {"status": "error", "error": "Inference worker overloaded"})
+            return
+        try:
+            result = future.result(timeout=settings.INFERENCE_WORKER_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            self.send_json(504, {"status": "error", "error": "Inference timed out"})
+        except KeyError as exc:
+            self.send_json(404, {"status": "error", "error": str(exc)})
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            LOGGER.exception("Inference failed")
+            self.send_json(500, {"status": "error", "error": str(exc)})
+        else:
+            self.send_json(200, {"status": "success", result_name: result})
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        LOGGER.debug(format, *args)
+
+
+def serve(host: str, port: int) -> None:
+    """
+    Load the models and serve inference requests until interrupted
+    """
+    ModelRegistry.warmup(["translation", "sentence_splitter", "embedding"])
+    InferenceRequestHandler.queues = {
+        "translate": BatchQueue("translate", translate_batch),
+        "embed": BatchQueue("embed", embed_batch),
+    }
+    server = ThreadingHTTPServer((host, port), InferenceRequestHandler)
+    LOGGER.info("Inference worker listening on %s:%i", host, port)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -1,35 +1,60 @@
 """
 Integreat CMS helper functions
 """
+import urllib.error
 from urllib.parse import quote
 
+import aiohttp
 import requests
 from django.conf import settings
 
+from .metrics import CMS_REQUEST_DURATION, span
+
+CMS_HEADERS = {"X-Integreat-Development": "true"}
+
 def get_region_languages(region: str) -> list[str]:
     """
     get all language slugs of a given region
     """
-    url = f"https://{settings.INTEGREAT_CMS_DOMAIN}/api/v3/{region}/languages/"
-    headers = {"X-Integreat-Development": "true"}
-    languages = requests.get(url, timeout=15, headers=headers).json()
+    url = f"{settings.INTEGREAT_CMS_URL}/api/v3/{region}/languages/"
+    with span(CMS_REQUEST_DURATION, "cms:languages", endpoint="languages"):
+        languages = requests.get(url, timeout=15, headers=CMS_HEADERS).json()
     return [language["code"] for language in languages]
 
-def get_page(path: str) -> dict:
+def get_page_url(path: str) -> str:
     """
-    get page object for RAG source
+    get CMS API URL of the page object for a page path
     """
     path = (
         path
         .replace(f"https://{settings.INTEGREAT_APP_DOMAIN}", "")
-        .replace(f"https://{settings.INTEGREAT_CMS_DOMAIN}", "")
+        .replace(settings.INTEGREAT_CMS_URL, "")
     )
     region = path.split("/")[1]
     cur_language = path.split("/")[2]
-    headers = {"X-Integreat-Development": "true"}
     pages_url = (
-        f"https://{settings.INTEGREAT_CMS_DOMAIN}/api/v3/{region}/"
+        f"{settings.INTEGREAT_CMS_URL}/api/v3/{region}/"
         f"{cur_language}/children/?url={path}&depth=0"
     )
-    encoded_url = quote(pages_url, safe=':/=?&')
-    return requests.get(encoded_url, timeout=15, headers=headers).json()[0]
+    return quote(pages_url, safe=':/=?&')
+
+def get_page(path: str) -> dict:
+    """
+    get page object for RAG source
+    """
+    with span(CMS_REQUEST_DURATION, "cms:children", endpoint="children"):
+        return requests.get(get_page_url(path), timeout=15, headers=CMS_HEADERS).json()[0]
+
+async def aget_page(session: aiohttp.ClientSession, path: str) -> dict:
+    """
+    get page object for RAG source without blocking the event loop
+    """
+    with span(CMS_REQUEST_DURATION, "cms:children", endpoint="children"):
+        async with session.get(
+            get_page_url(path), timeout=aiohttp.ClientTimeout(total=15), headers=CMS_HEADERS
+        ) as response:
+            if response.status >= 400:
+                raise urllib.error.HTTPError(
+                    response.url, response.status, response.reason, response.headers, None
+                )
+            return (await response.json())[0]
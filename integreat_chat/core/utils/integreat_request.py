@@ -1,9 +1,11 @@
 """
 base request class
 """
+import asyncio
 import logging
 from django.utils.functional import cached_property
 
+from integreat_chat.chatanswers.services.llm_resilience import LlmUnavailableError
 from integreat_chat.translate.services.language import LanguageService
 
 from ..static.region_language_map import REGION_LANGUAGE_MAP
@@ -30,6 +32,26 @@ class IntegreatRequest:
         if self.supported_languages is None or self.fallback_language is None:
             raise ValueError("supported_languages or fallback_language has not been set.")
 
+    # attributes set by prepare()
+    prepared_attributes = ["likely_message_language", "translated_message"]
+
+    def get_prepared(self) -> dict:
+        """
+        Values of the prepared attributes that have been computed
+        """
+        return {
+            name: self.__dict__[name] for name in self.prepared_attributes if name in self.__dict__
+        }
+
+    def restore_prepared(self, prepared: dict) -> None:
+        """
+        Restore prepared attributes of an identical request, e.g. of a single-flight leader,
+        so prepare() does not compute them again
+
+        param prepared: dict created by get_prepared()
+        """
+        self.__dict__.update(prepared)
+
     def parse_arguments(self, data: dict) -> None:
         """
         Parse arguments from HTTP request body
@@ -50,21 +72,50 @@ class IntegreatRequest:
         """
         Detect language and decide which language to use for RAG
         """
-        if self.skip_language_detection:
-            return self.gui_language
-        return self.language_service.classify_language(self.original_message)
+        return asyncio.run(self.adetect_language())
 
     @cached_property
     def translated_message(self) -> str:
         """
         If necessary, translate message into GUI language
         """
+        return asyncio.run(self.atranslate_message())
+
+    async def adetect_language(self) -> str:
+        """
+        Detect the message language. Assume the GUI language if the LLM is unavailable.
+        """
+        if self.skip_language_detection:
+            return self.gui_language
+        try:
+            return await self.language_service.aclassify_language(self.original_message)
+        except LlmUnavailableError:
+            LOGGER.warning("Language detection failed, assuming GUI language")
+            return self.gui_language
+
+    async def atranslate_message(self) -> str:
+        """
+        Translate the message into the fallback language if its language is not supported
+        """
+        if "likely_message_language" not in self.__dict__:
+            self.likely_message_language = await self.adetect_language()
         if self.likely_message_language not in self.supported_languages:
-            return self.language_service.translate_message(
+            return await self.language_service.atranslate_message(
                 self.likely_message_language, self.fallback_language, self.original_message
             )
         return self.original_message
 
+    async def prepare(self) -> None:
+        """
+        Detect the message language and translate the message without blocking
+        the event loop. Async code has to await this before accessing
+        likely_message_language or translated_message.
+        """
+        if "likely_message_language" not in self.__dict__:
+            self.likely_message_language = await self.adetect_language()
+        if "translated_message" not in self.__dict__:
+            self.translated_message = await self.atranslate_message()
+
     @property
     def use_language(self) -> str:
         """
@@ -0,0 +1,116 @@
+"""
+Prometheus metrics and timed spans for pipeline stages and outbound calls
+"""
+import contextlib
+import contextvars
+import time
+
+from prometheus_client import Counter, Histogram
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+STAGE_DURATION = Histogram(
+    "integreat_chat_stage_duration_seconds",
+    "Duration of pipeline stages",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_REQUEST_DURATION = Histogram(
+    "integreat_chat_llm_request_duration_seconds",
+    "Duration of LLM requests",
+    ["model", "prompt_type"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_REQUEST_ERRORS = Counter(
+    "integreat_chat_llm_request_errors_total",
+    "Failed LLM requests",
+    ["model", "prompt_type"],
+)
+LLM_QUEUE_DURATION = Histogram(
+    "integreat_chat_llm_queue_duration_seconds",
+    "Time LLM requests wait for a slot",
+    ["model", "priority"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_SHED_REQUESTS = Counter(
+    "integreat_chat_llm_shed_requests_total",
+    "LLM requests rejected because the queue was too deep",
+    ["model", "priority"],
+)
+OPENSEARCH_REQUEST_DURATION = Histogram(
+    "integreat_chat_opensearch_request_duration_seconds",
+    "Duration of OpenSearch requests",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+OPENSEARCH_RESPONSE_SIZE = Histogram(
+    "integreat_chat_opensearch_response_size_bytes",
+    "Size of OpenSearch response bodies",
+    ["endpoint"],
+    buckets=SIZE_BUCKETS,
+)
+CMS_REQUEST_DURATION = Histogram(
+    "integreat_chat_cms_request_duration_seconds",
+    "Duration of Integreat CMS requests",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+MODEL_INFERENCE_DURATION = Histogram(
+    "integreat_chat_model_inference_duration_seconds",
+    "Duration of translation and embedding inference",
+    ["model", "backend"],
+    buckets=LATENCY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "integreat_chat_cache_requests_total",
+    "Cache lookups",
+    ["cache", "result"],
+)
+
+timings_var: contextvars.ContextVar[list | None] = contextvars.ContextVar("timings", default=None)
+
+
+@contextlib.contextmanager
+def collect_timings():
+    """
+    Collect the spans of the current request, including spans of tasks and
+    executor threads started by it
+
+    return: list of {"name": ..., "seconds": ...} dicts, filled when spans finish
+    """
+    timings = []
+    token = timings_var.set(timings)
+    try:
+        yield timings
+    finally:
+        timings_var.reset(token)
+
+
+@contextlib.contextmanager
+def span(histogram: Histogram, name: str, **labels):
+    """
+    Time a block and record the duration in a histogram and in the timings
+    of the current request
+
+    param histogram: histogram for the duration
+    param name: name of the span in the timing breakdown
+    param labels: label values of the histogram
+    """
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        duration = time.monotonic() - start
+        histogram.labels(**labels).observe(duration)
+        if (timings := timings_var.get()) is not None:
+            timings.append({"name": name, "seconds": round(duration, 4)})
+
+
+def stage(name: str):
+    """
+    Time a pipeline stage
+
+    param name: name of the stage
+    """
+    return span(STAGE_DURATION, name, stage=name)
@@ -0,0 +1,148 @@
+"""
+Lazy registry for heavyweight models. Models are loaded on first use or by
+an explicit warmup, so that importing settings, running management commands
+and booting workers does not pull in torch and friends.
+
+In preload mode, all models are loaded in the master process of a pre-forking
+server (e.g. gunicorn --preload) and frozen, so forked workers share the model
+memory copy-on-write.
+"""
+import gc
+import logging
+import threading
+import time
+from typing import Any, Callable
+
+from django.conf import settings
+
+LOGGER = logging.getLogger("django")
+
+
+def load_embedding_model() -> Any:
+    """
+    Sentence transformer for embedding search queries and questions
+    """
+    # pylint: disable=import-outside-toplevel
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=settings.SEARCH_EMBEDDING_MODEL_NAME, show_progress=False
+    )
+
+
+def load_translation_model() -> Any:
+    """
+    NLLB translation pipeline
+    """
+    # pylint: disable=import-outside-toplevel,no-name-in-module
+    from transformers import pipeline
+    return pipeline("translation", model=settings.TRANSLATION_MODEL)
+
+
+def load_sentence_splitter() -> Any:
+    """
+    spaCy multi-lingual sentence segmenter, see https://spacy.io/models/xx
+    """
+    # pylint: disable=import-outside-toplevel
+    import spacy
+    return spacy.load("xx_sent_ud_sm")
+
+
+def load_tokenizer() -> Any:
+    """
+    Tokenizer of the RAG model. None if it is not available, token counts are
+    estimated in that case.
+    """
+    try:
+        # pylint: disable=import-outside-toplevel
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(settings.RAG_CONTEXT_TOKENIZER)
+    except (ImportError, OSError):
+        LOGGER.warning(
+            "Tokenizer %s not available, estimating token counts", settings.RAG_CONTEXT_TOKENIZER
+        )
+        return None
+
+
+def freeze_model(model: Any) -> None:
+    """
+    Put torch modules of a model in inference mode and drop gradient tracking,
+    so that workers do not write to the shared weight pages
+
+    param model: a loaded model, pipeline or embedding wrapper
+    """
+    for module in (model, getattr(model, "model", None), getattr(model, "_client", None)):
+        if hasattr(module, "eval") and hasattr(module, "parameters"):
+            module.eval()
+            for parameter in module.parameters():
+                parameter.requires_grad_(False)
+
+
+class ModelRegistry:
+    """
+    Process wide registry of lazily loaded models. Each model is loaded at most
+    once per process, concurrent first accesses wait for the same load.
+    """
+    loaders: dict[str, Callable[[], Any]] = {
+        "embedding": load_embedding_model,
+        "translation": load_translation_model,
+        "sentence_splitter": load_sentence_splitter,
+        "tokenizer": load_tokenizer,
+    }
+    # models that are owned by the inference worker if INFERENCE_WORKER_URL is set
+    worker_models = ["embedding", "translation", "sentence_splitter"]
+    models: dict[str, Any] = {}
+    locks: dict[str, threading.Lock] = {name: threading.Lock() for name in loaders}
+
+    @classmethod
+    def get(cls, name: str) -> Any:
+        """
+        Get a model, load it if necessary
+
+        param name: name of the model in loaders
+        """
+        if name in cls.models:
+            return cls.models[name]
+        with cls.locks[name]:
+            if name not in cls.models:
+                start = time.monotonic()
+                cls.models[name] = cls.loaders[name]()
+                LOGGER.info("Loaded model %s in %.1fs", name, time.monotonic() - start)
+            return cls.models[name]
+
+    @classmethod
+    def is_loaded(cls, name: str) -> bool:
+        """
+        Check if a model has already been loaded
+        """
+        return name in cls.models
+
+    @classmethod
+    def warmup(cls, names: list[str] | None = None) -> None:
+        """
+        Load models ahead of the first request
+
+        param names: models to load, defaults to MODEL_WARMUP
+        """
+        for name in settings.MODEL_WARMUP if names is None else names:
+            cls.get(name)
+
+    @classmethod
+    def preload(cls) -> None:
+        """
+        Load and freeze all models before workers are forked. Objects that exist
+        at this point are moved to the permanent GC generation, so garbage
+        collection in the workers does not touch (and thereby copy) their pages.
+        """
+        start = time.monotonic()
+        for name in cls.loaders:
+            if settings.INFERENCE_WORKER_URL and name in cls.worker_models:
+                continue
+            model = cls.get(name)
+            if model is not None:
+                freeze_model(model)
+        gc.collect()
+        gc.freeze()
+        LOGGER.info(
+            "Preloaded models in %.1fs, %i objects frozen",
+            time.monotonic() - start, gc.get_freeze_count()
+        )
@@ -0,0 +1,113 @@
+"""
+Coalesce identical concurrent requests across workers
+"""
+import hashlib
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable
+
+import asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+LOGGER = logging.getLogger("django")
+
+
+class SingleFlight:
+    """
+    Single-flight execution of identical requests. The first worker acquires
+    a lock in the shared cache (Redis) and computes the result. Workers with
+    identical requests wait until the leader publishes the result. If the
+    leader fails, one of the waiting workers takes over. Neither waiting nor
+    cache access block the event loop. The result is kept for SINGLE_FLIGHT_RESULT_TTL
+    seconds, identical requests in this time get it without computing it.
+    """
+
+    def __init__(self, namespace: str, key_parts: list[str]) -> None:
+        """
+        param namespace: kind of request, for example "answer" or "search"
+        param key_parts: values that identify identical requests. Strings are normalized.
+        """
+        digest = hashlib.sha256(
+            "\x1f".join(self.normalize(str(part)) for part in key_parts).encode("utf-8")
+        ).hexdigest()
+        self.namespace = namespace
+        self.lock_key = f"single_flight_lock_{namespace}_{digest}"
+        self.result_key = f"single_flight_result_{namespace}_{digest}"
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Normalize case and whitespace of a message
+        """
+        return " ".join(text.lower().split())
+
+    async def run(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run func, or wait for the result of an identical request that is already
+        in flight. The result has to be serializable by the cache backend.
+
+        param func: coroutine function that computes the result
+        return: result of func
+        """
+        if not settings.SINGLE_FLIGHT:
+            return await func()
+        token = uuid.uuid4().hex
+        acquire = sync_to_async(self.acquire, thread_sensitive=False)
+        get_result = sync_to_async(self.get_result, thread_sensitive=False)
+        if await acquire(token):
+            return await self.lead(func, token)
+        deadline = time.monotonic() + settings.SINGLE_FLIGHT_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL)
+            if (result := await get_result()) is not None:
+                LOGGER.debug("Using result of identical %s request", self.namespace)
+                return result
+            if await acquire(token):
+                if (result := await get_result()) is not None:
+                    await sync_to_async(self.release, thread_sensitive=False)(token)
+                    return result
+                LOGGER.debug("Taking over identical %s request", self.namespace)
+                return await self.lead(func, token)
+        LOGGER.warning("Timeout while waiting for identical %s request", self.namespace)
+        return await func()
+
+    async def lead(self, func: Callable[[], Awaitable[Any]], token: str) -> Any:
+        """
+        Compute and publish the result while holding the lock
+        """
+        try:
+            result = await func()
+            await sync_to_async(self.publish, thread_sensitive=False)(result)
+            return result
+        finally:
+            await sync_to_async(self.release, thread_sensitive=False)(token)
+
+    def acquire(self, token: str) -> bool:
+        """
+        Acquire the lock if no identical request holds it
+
+        return: True if this request is the leader now
+        """
+        return cache.add(self.lock_key, token, settings.SINGLE_FLIGHT_LOCK_TIMEOUT)
+
+    def get_result(self) -> Any:
+        """
+        Get the published result, None if there is none
+        """
+        return cache.get(self.result_key)
+
+    def publish(self, result: Any) -> None:
+        """
+        Publish the result for waiting and later identical requests
+        """
+        cache.set(self.result_key, result, settings.SINGLE_FLIGHT_RESULT_TTL)
+
+    def release(self, token: str) -> None:
+        """
+        Release the lock if it is still held by this request
+        """
+        if cache.get(self.lock_key) == token:
+            cache.delete(self.lock_key)
@@ -0,0 +1,133 @@
+"""
+Capture anonymized request records for replaying realistic traffic
+"""
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+LOGGER = logging.getLogger("django")
+
+CAPTURED_FIELDS = [
+    "region", "language", "source_language", "target_language", "force_source_language",
+    "indices",
+]
+
+SYNTHETIC_WORDS = [
+    "Deutschkurs", "Wohnung", "Anmeldung", "Termin", "Beratung", "Arbeit", "Kita",
+    "Schule", "Arzt", "Versicherung", "Aufenthalt", "Antrag", "Bank", "Konto",
+    "wo", "wie", "kann", "ich", "einen", "finde", "brauche", "für", "mein", "Kind",
+]
+
+
+class TrafficCapture:
+    """
+    Async context manager that appends a record of a request to TRAFFIC_CAPTURE_FILE
+    when the request finishes. The record is written in a worker thread, so the
+    event loop does not wait for the file. Messages are replaced by a keyed hash
+    and their length, so repeated messages can be recognized without storing them.
+    """
+    lock = threading.Lock()
+
+    def __init__(self, endpoint: str, data: dict, timings: list) -> None:
+        """
+        param endpoint: name of the endpoint, see SCENARIOS in benchmark
+        param data: parsed request body
+        param timings: timings list of collect_timings()
+        """
+        self.endpoint = endpoint
+        self.data = data
+        self.timings = timings
+        self.status = 200
+        self.timestamp = None
+        self.start = None
+
+    async def __aenter__(self) -> "TrafficCapture":
+        self.timestamp = time.time()
+        self.start = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            self.status = 500
+        if settings.TRAFFIC_CAPTURE:
+            record = self.as_dict(time.monotonic() - self.start)
+            try:
+                await sync_to_async(self.write, thread_sensitive=False)(record)
+            except OSError:
+                LOGGER.exception("Could not write traffic capture record")
+
+    @staticmethod
+    def hash_message(message: str) -> str:
+        """
+        Keyed hash of a normalized message
+        """
+        return hmac.new(
+            settings.SECRET_KEY.encode("utf-8"),
+            " ".join(message.lower().split()).encode("utf-8"),
+            hashlib.sha256,
+        ).hexdigest()[:32]
+
+    def as_dict(self, duration: float) -> dict:
+        """
+        Anonymized record of the request
+        """
+        message = str(self.data.get("message", ""))
+        return {
+            "endpoint": self.endpoint,
+            "timestamp": round(self.timestamp, 3),
+            **{field: self.data[field] for field in CAPTURED_FIELDS if field in self.data},
+            "message_hash": self.hash_message(message),
+            "message_length": len(message),
+            "status": self.status,
+            "duration": round(duration, 4),
+            "timings": self.timings,
+        }
+
+    @classmethod
+    def write(cls, record: dict) -> None:
+        """
+        Append a record as JSON line. Lines are short, so appends of
+        several worker processes do not interleave.
+        """
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with cls.lock:
+            with open(settings.TRAFFIC_CAPTURE_FILE, "a", encoding="utf-8") as capture_file:
+                capture_file.write(line)
+
+
+def synthesize_message(message_hash: str, length: int) -> str:
+    """
+    Deterministic stand-in for a captured message. Equal hashes result in equal
+    messages, so repeat rates and message lengths of the trace are preserved.
+    The message starts with a part of the hash, so messages of different hashes
+    differ even if they are truncated, unless they are shorter than 10 characters.
+
+    param message_hash: message_hash of a captured record
+    param length: message_length of a captured record
+    """
+    if not length:
+        return ""
+    generator = random.Random(message_hash)
+    words = [message_hash[:8]]
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(generator.choice(SYNTHETIC_WORDS))
+    return " ".join(words)[:length - 1] + "?"
+
+
+def build_replay_payload(record: dict) -> dict:
+    """
+    Request body for replaying a captured record
+
+    param record: captured record
+    """
+    return {
+        **{field: record[field] for field in CAPTURED_FIELDS if field in record},
+        "message": synthesize_message(record["message_hash"], record["message_length"]),
+    }
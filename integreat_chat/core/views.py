@@ -0,0 +1,21 @@
+"""
+Views for operating the service
+"""
+import os
+
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+)
+
+
+def metrics(request):  # pylint: disable=unused-argument
+    """
+    Prometheus metrics. Metrics of all worker processes are aggregated if
+    PROMETHEUS_MULTIPROC_DIR is set.
+    """
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
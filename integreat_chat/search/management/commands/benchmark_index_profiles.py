@@ -0,0 +1,149 @@
+"""
+Compare recall and latency of vector index profiles
+"""
+
+import json
+import time
+
+import numpy
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from integreat_chat.search.services.embedding import EmbeddingService
+from integreat_chat.search.services.opensearch import OpenSearchSetup
+
+
+def exact_neighbors(
+        space_type: str, vectors: numpy.ndarray, query: numpy.ndarray, k: int
+    ) -> list[int]:
+    """
+    Positions of the exact k nearest neighbors in the space of a profile
+
+    param space_type: space_type of the knn_vector method
+    param vectors: document vectors
+    param query: query vector
+    param k: number of neighbors
+    """
+    if space_type == "l2":
+        scores = -numpy.sum((vectors - query) ** 2, axis=1)
+    elif space_type == "cosinesimil":
+        scores = (vectors @ query) / (
+            numpy.linalg.norm(vectors, axis=1) * numpy.linalg.norm(query) + 1e-12
+        )
+    else:
+        scores = vectors @ query
+    return numpy.argsort(-scores)[:k].tolist()
+
+
+class Command(BaseCommand):
+    """
+    Build a temporary index of a region/language for every profile in
+    SEARCH_INDEX_PROFILES and measure index size, knn recall@k against exact
+    nearest neighbors, hybrid recall@k against labeled relevant pages and
+    search latency.
+    """
+    help = "Benchmark recall@k and latency of vector index profiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument("region", type=str)
+        parser.add_argument("language", type=str)
+        parser.add_argument(
+            "queries", type=str,
+            help='JSONL file with {"message": "...", "relevant": ["https://..."]} per line'
+        )
+        parser.add_argument(
+            "--profiles", type=str, nargs="+", default=list(settings.SEARCH_INDEX_PROFILES)
+        )
+        parser.add_argument("--k", type=int, default=5)
+        parser.add_argument("--repeat", type=int, default=3, help="searches per query")
+        parser.add_argument("--keep", action="store_true", help="keep the profile indices")
+
+    def handle(self, *args, **options):
+        if unknown := set(options["profiles"]) - set(settings.SEARCH_INDEX_PROFILES):
+            raise CommandError(f"Unknown profiles {', '.join(unknown)}")
+        with open(options["queries"], encoding="utf-8") as queries_file:
+            queries = [json.loads(line) for line in queries_file if line.strip()]
+        if not queries:
+            raise CommandError("Empty query set")
+        oss = OpenSearchSetup(password=settings.OPENSEARCH_PASSWORD)
+        documents = oss.get_chunk_documents(options["region"], options["language"])
+        oss.add_embeddings(documents)
+        embeddings = numpy.array(EmbeddingService().embed_queries(
+            [query["message"] for query in queries]
+        ), dtype=numpy.float32)
+        for profile in options["profiles"]:
+            result = self.benchmark_profile(profile, options, documents, queries, embeddings)
+            self.stdout.write(
+                f"{profile}: {result['documents']} documents, "
+                f"{result['store_bytes'] / 1024 / 1024:.1f} MB\n"
+                f"  knn recall@{options['k']}: {result['knn_recall']:.3f}\n"
+                f"  hybrid recall@{options['k']}: "
+                + (f"{result['hybrid_recall']:.3f}" if result["hybrid_recall"] is not None
+                   else "no labels") + "\n"
+                f"  knn latency p50: {result['knn_p50']:.3f}s, p95: {result['knn_p95']:.3f}s\n"
+                f"  hybrid latency p50: {result['hybrid_p50']:.3f}s, "
+                f"p95: {result['hybrid_p95']:.3f}s"
+            )
+
+    def benchmark_profile(
+            self,
+            profile: str,
+            options: dict,
+            documents: list[dict],
+            queries: list[dict],
+            embeddings: numpy.ndarray,
+        ) -> dict:
+        """
+        Index the documents with a profile and run all queries
+        """
+        k = options["k"]
+        oss = OpenSearchSetup(password=settings.OPENSEARCH_PASSWORD, index_profile=profile)
+        index = f"{options['region']}_{options['language']}_profile_{profile}"
+        oss.delete_index(index)
+        oss.create_index(index)
+        for start in range(0, len(documents), settings.SEARCH_INDEX_BULK_SIZE):
+            oss.bulk_index(index, documents[start:start + settings.SEARCH_INDEX_BULK_SIZE])
+        oss.request(f"/{index}/_refresh", {}, "POST")
+        vectors = numpy.array(
+            [document["chunk_embedding"] for document in documents], dtype=numpy.float32
+        )
+        space_type = oss.index_profile["method"]["space_type"]
+        knn_recalls, hybrid_recalls, knn_latencies, hybrid_latencies = [], [], [], []
+        for query, embedding in zip(queries, embeddings):
+            knn_query = oss.build_vector_query(
+                "chunk_embedding", query["message"], embedding.tolist()
+            )
+            knn_query["knn"]["chunk_embedding"]["k"] = k
+            knn_payload = {"size": k, "_source": ["url", "chunk_text"], "query": knn_query}
+            hybrid_payload = {
+                **oss.build_search_payload(query["message"], embedding.tolist()), "size": k
+            }
+            for _ in range(options["repeat"]):
+                start = time.monotonic()
+                knn_response = oss.request(f"/{index}/_search", knn_payload, "GET")
+                knn_latencies.append(time.monotonic() - start)
+                start = time.monotonic()
+                hybrid_response = oss.request(f"/{index}/_search", hybrid_payload, "GET")
+                hybrid_latencies.append(time.monotonic() - start)
+            expected = {
+                documents[position]["id"]
+                for position in exact_neighbors(space_type, vectors, embedding, k)
+            }
+            found = {hit["_id"] for hit in knn_response["hits"]["hits"]}
+            knn_recalls.append(len(found & expected) / len(expected))
+            if query.get("relevant"):
+                urls = {hit["_source"]["url"] for hit in hybrid_response["hits"]["hits"]}
+                hybrid_recalls.append(len(urls & set(query["relevant"])) / len(query["relevant"]))
+        store = oss.request(f"/{index}/_stats/store", {}, "GET")
+        if not options["keep"]:
+            oss.delete_index(index)
+        return {
+            "documents": len(documents),
+            "store_bytes": store["_all"]["primaries"]["store"]["size_in_bytes"],
+            "knn_recall": float(numpy.mean(knn_recalls)),
+            "hybrid_recall": float(numpy.mean(hybrid_recalls)) if hybrid_recalls else None,
+            "knn_p50": float(numpy.percentile(knn_latencies, 50)),
+            "knn_p95": float(numpy.percentile(knn_latencies, 95)),
+            "hybrid_p50": float(numpy.percentile(hybrid_latencies, 50)),
+            "hybrid_p95": float(numpy.percentile(hybrid_latencies, 95)),
+        }
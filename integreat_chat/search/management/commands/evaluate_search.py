@@ -0,0 +1,247 @@
+"""
+Evaluate hybrid search configurations against a labeled question set
+"""
+
+import argparse
+import itertools
+import json
+import time
+
+import numpy
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from integreat_chat.search.services.embedding import EmbeddingService
+from integreat_chat.search.services.opensearch import FUSION_TECHNIQUES, OpenSearch
+
+
+def parse_weights(value: str) -> list[float]:
+    """
+    Parse comma-separated weights of the four hybrid sub-queries
+    """
+    weights = [float(weight) for weight in value.split(",")]
+    if len(weights) != 4:
+        raise ValueError("Four weights are required")
+    return weights
+
+
+def ndcg(urls: list[str], relevant: set[str], top: int) -> float:
+    """
+    Normalized discounted cumulative gain of the top results with binary relevance
+
+    param urls: URLs of the results, best first
+    param relevant: URLs of the relevant pages
+    param top: number of results that are evaluated
+    """
+    dcg = sum(
+        1 / numpy.log2(rank + 1)
+        for rank, url in enumerate(urls[:top], start=1) if url in relevant
+    )
+    ideal = sum(1 / numpy.log2(rank + 1) for rank in range(1, min(len(relevant), top) + 1))
+    return float(dcg / ideal) if ideal else 0.0
+
+
+def parse_bool(value: str) -> bool:
+    """
+    Parse true/false
+    """
+    return value.lower() in ("true", "yes", "1")
+
+
+class Command(BaseCommand):
+    """
+    Run every question of a labeled set through all combinations of fusion
+    technique, hybrid weights, k, size, score threshold and deduplication. The
+    fusion is sent as temporary search pipeline with each request, so the stored
+    pipeline is not changed. Reports recall@top, MRR, nDCG@top, number of results
+    and latency per configuration.
+    """
+    help = "Evaluate recall, MRR, nDCG and latency of hybrid search configurations"
+
+    def add_arguments(self, parser):
+        parser.add_argument("region", type=str)
+        parser.add_argument("language", type=str)
+        parser.add_argument(
+            "queries", type=str,
+            help='JSONL file with {"message": "...", "relevant": ["https://..."]} per line'
+        )
+        parser.add_argument(
+            "--weights", type=parse_weights, nargs="+",
+            default=[settings.SEARCH_HYBRID_WEIGHTS],
+            help="comma-separated weights: title match, content match, title and content knn",
+        )
+        parser.add_argument(
+            "--fusion", type=str, nargs="+", choices=FUSION_TECHNIQUES,
+            default=[settings.SEARCH_FUSION],
+        )
+        parser.add_argument("--k", type=int, nargs="+", default=[settings.SEARCH_VECTOR_K])
+        parser.add_argument(
+            "--size", type=int, nargs="+",
+            help="hits fetched per question, defaults to the candidates of a RAG search"
+        )
+        parser.add_argument(
+            "--min-scores", type=float, nargs="+", default=[settings.SEARCH_SCORE_THRESHOLD]
+        )
+        parser.add_argument("--dedup", type=parse_bool, nargs="+", default=[True, False])
+        parser.add_argument(
+            "--top", type=int, default=settings.RAG_MAX_PAGES * 2,
+            help="number of results that are evaluated, like the documents retrieved for RAG"
+        )
+        parser.add_argument(
+            "--local-embedding", action=argparse.BooleanOptionalAction,
+            default=settings.SEARCH_LOCAL_QUERY_EMBEDDING,
+            help="embed the questions in this service and send knn queries",
+        )
+        parser.add_argument(
+            "--write-best", action="store_true",
+            help="store the weights of the best configuration using SEARCH_FUSION "
+                 "in the search pipeline",
+        )
+
+    def handle(self, *args, **options):
+        with open(options["queries"], encoding="utf-8") as queries_file:
+            queries = [json.loads(line) for line in queries_file if line.strip()]
+        queries = [query for query in queries if query.get("relevant")]
+        if not queries:
+            raise CommandError("No labeled questions")
+        embeddings = (
+            EmbeddingService().embed_queries([query["message"] for query in queries])
+            if options["local_embedding"] else [None] * len(queries)
+        )
+        index = f"{options['region']}_{options['language']}"
+        sizes = options["size"] or [min(
+            options["top"] * settings.SEARCH_CANDIDATES_PER_RESULT, settings.SEARCH_MAX_DOCUMENTS
+        )]
+        results = []
+        for fusion, weights, k, size in itertools.product(
+                options["fusion"], options["weights"], options["k"], sizes
+            ):
+            # reciprocal rank fusion does not use the weights
+            if fusion == "rrf" and weights != options["weights"][0]:
+                continue
+            oss = OpenSearch(password=settings.OPENSEARCH_PASSWORD, fusion=fusion)
+            responses, latencies = self.run_searches(
+                oss, index, queries, embeddings, weights, k, size
+            )
+            for min_score, dedup in itertools.product(options["min_scores"], options["dedup"]):
+                results.append({
+                    "fusion": fusion,
+                    "weights": weights,
+                    "k": k,
+                    "size": size,
+                    "min_score": min_score,
+                    "dedup": dedup,
+                    **self.evaluate(oss, queries, responses, min_score, dedup, options["top"]),
+                    "p50": float(numpy.percentile(latencies, 50)),
+                    "p95": float(numpy.percentile(latencies, 95)),
+                })
+        results.sort(
+            key=lambda result: (
+                -result["recall"], -result["mrr"], result["results"], result["p50"]
+            )
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result['fusion']}, "
+                f"weights {','.join(str(weight) for weight in result['weights'])}, "
+                f"k {result['k']}, size {result['size']}, "
+                f"min_score {result['min_score']}, dedup {result['dedup']}: "
+                f"recall@{options['top']} {result['recall']:.3f}, MRR {result['mrr']:.3f}, "
+                f"nDCG@{options['top']} {result['ndcg']:.3f}, "
+                f"{result['results']:.1f} results, "
+                f"p50 {result['p50']:.3f}s, p95 {result['p95']:.3f}s"
+            )
+        best = results[0]
+        best_weights = ",".join(str(weight) for weight in best["weights"])
+        self.stdout.write(self.style.SUCCESS(  # pylint: disable=no-member
+            f"Best: SEARCH_FUSION = {best['fusion']}, SEARCH_HYBRID_WEIGHTS = {best_weights}, "
+            f"SEARCH_VECTOR_K = {best['k']}, SEARCH_SCORE_THRESHOLD = {best['min_score']}, "
+            f"size {best['size']}, deduplication {best['dedup']}"
+        ))
+        if options["write_best"]:
+            self.write_best(results)
+
+    def write_best(self, results: list[dict]) -> None:
+        """
+        Store the weights of the best configuration with the fusion of SEARCH_FUSION,
+        as scores are scaled by it
+
+        param results: evaluated configurations, best first
+        """
+        matching = [result for result in results if result["fusion"] == settings.SEARCH_FUSION]
+        if not matching:
+            raise CommandError(
+                f"No configuration with SEARCH_FUSION = {settings.SEARCH_FUSION} evaluated"
+            )
+        if matching[0] is not results[0]:
+            self.stdout.write(self.style.WARNING(  # pylint: disable=no-member
+                f"Storing the best configuration with {settings.SEARCH_FUSION}, set "
+                f"SEARCH_FUSION = {results[0]['fusion']} to store the best configuration"
+            ))
+        call_command(
+            "update_search_pipeline",
+            weights=matching[0]["weights"],
+            fusion=settings.SEARCH_FUSION,
+        )
+
+    def run_searches(
+            self,
+            oss: OpenSearch,
+            index: str,
+            queries: list[dict],
+            embeddings: list,
+            weights: list[float],
+            k: int,
+            size: int,
+        ) -> tuple[list[dict], list[float]]:
+        """
+        Search all questions with a temporary pipeline
+
+        return: responses and latencies
+        """
+        pipeline = oss.build_search_pipeline(weights)
+        responses, latencies = [], []
+        for query, embedding in zip(queries, embeddings):
+            payload = {
+                **oss.build_search_payload(query["message"], embedding, k, size),
+                "search_pipeline": pipeline,
+            }
+            start = time.monotonic()
+            responses.append(oss.request(f"/{index}/_search", payload, "GET"))
+            latencies.append(time.monotonic() - start)
+        return responses, latencies
+
+    def evaluate(
+            self,
+            oss: OpenSearch,
+            queries: list[dict],
+            responses: list[dict],
+            min_score: float,
+            dedup: bool,
+            top: int,
+        ) -> dict:
+        """
+        Recall of relevant pages within the top results, mean reciprocal rank of
+        the first relevant page, nDCG of the top results and mean number of results
+        """
+        recalls, reciprocal_ranks, gains, counts = [], [], [], []
+        for query, response in zip(queries, responses):
+            urls = [
+                result["url"] for result in oss.reduce_search_result(
+                    response, deduplicate=dedup, max_results=top, min_score=min_score
+                )
+            ]
+            relevant = set(query["relevant"])
+            recalls.append(len(relevant & set(urls)) / len(relevant))
+            reciprocal_ranks.append(next(
+                (1 / rank for rank, url in enumerate(urls, start=1) if url in relevant), 0
+            ))
+            gains.append(ndcg(urls, relevant, top))
+            counts.append(len(urls))
+        return {
+            "recall": float(numpy.mean(recalls)),
+            "mrr": float(numpy.mean(reciprocal_ranks)),
+            "ndcg": float(numpy.mean(gains)),
+            "results": float(numpy.mean(counts)),
+        }
@@ -1,10 +1,11 @@
 """
 Index pages for region & language
 """
+import argparse
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from integreat_chat.search.services.opensearch import OpenSearchSetup
+from integreat_chat.search.services.local_search import get_search_backend
 
 class Command(BaseCommand):
     """
@@ -15,14 +16,19 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("region", type=str)
         parser.add_argument("language", type=str)
+        parser.add_argument(
+            "--local-embeddings", action=argparse.BooleanOptionalAction,
+            default=settings.SEARCH_LOCAL_INDEX_EMBEDDING,
+            help="compute embeddings locally and bypass the ingest pipeline",
+        )
 
     def handle(self, *args, **options):
         if "region" not in options or "language" not in options:
             raise CommandError('missing region or language argument')
         region_slug = options["region"]
         language_slug = options["language"]
-        oss = OpenSearchSetup(password=settings.OPENSEARCH_PASSWORD)
+        oss = get_search_backend(setup=True)
         print(f"Indexing pages for region {options['region']} and language {options['language']}")
         print(oss.delete_index(f"{region_slug}_{language_slug}"))
         print(oss.create_index(f"{region_slug}_{language_slug}"))
-        oss.index_pages(region_slug, language_slug)
+        oss.index_pages(region_slug, language_slug, options["local_embeddings"])
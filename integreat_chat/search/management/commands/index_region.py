@@ -1,10 +1,11 @@
 """
 Index pages for region & language
 """
+import argparse
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from integreat_chat.search.services.opensearch import OpenSearchSetup
+from integreat_chat.search.services.local_search import get_search_backend
 from integreat_chat.core.utils.integreat_cms import get_region_languages
 
 class Command(BaseCommand):
@@ -15,16 +16,21 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("region", type=str)
+        parser.add_argument(
+            "--local-embeddings", action=argparse.BooleanOptionalAction,
+            default=settings.SEARCH_LOCAL_INDEX_EMBEDDING,
+            help="compute embeddings locally and bypass the ingest pipeline",
+        )
 
     def handle(self, *args, **options):
         if "region" not in options:
             raise CommandError('missing region argument')
         region_slug = options["region"]
-        oss = OpenSearchSetup(password=settings.OPENSEARCH_PASSWORD)
+        oss = get_search_backend(setup=True)
         for language_slug in get_region_languages(region_slug):
             self.stdout.write(self.style.SUCCESS(  # pylint: disable=no-member
                 f"Indexing pages for region {region_slug} and language {language_slug}"
             ))
             oss.delete_index(f"{region_slug}_{language_slug}")
             oss.create_index(f"{region_slug}_{language_slug}")
-            oss.index_pages(region_slug, language_slug)
+            oss.index_pages(region_slug, language_slug, options["local_embeddings"])
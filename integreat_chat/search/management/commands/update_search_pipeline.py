@@ -1,20 +1,39 @@
 """
-Index pages for region & language
+Update the hybrid search pipeline
 """
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
-from integreat_chat.search.services.opensearch import OpenSearchSetup
+from django.core.management.base import BaseCommand, CommandError
+from integreat_chat.search.services.opensearch import FUSION_TECHNIQUES, OpenSearchSetup
 
 class Command(BaseCommand):
     """
-    Index pages for region & language
+    Update the hybrid search pipeline and use it as default for all region/language
+    indices, e.g. for queries of the search API without a search_pipeline parameter
     """
-    help = "Index pages for region & language"
+    help = "Update the hybrid search pipeline"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--weights", type=lambda value: [float(weight) for weight in value.split(",")],
+            help="comma-separated weights of the hybrid sub-queries, "
+                 "defaults to SEARCH_HYBRID_WEIGHTS",
+        )
+        parser.add_argument(
+            "--fusion", type=str, choices=FUSION_TECHNIQUES,
+            help="combination of the hybrid sub-queries, has to match SEARCH_FUSION",
+        )
 
     def handle(self, *args, **options):
-        oss = OpenSearchSetup(password=settings.OPENSEARCH_PASSWORD)
-        oss.create_search_pipeline()
+        # the app scales search scores by SEARCH_FUSION, so the stored pipeline has to match it
+        if options["fusion"] and options["fusion"] != settings.SEARCH_FUSION:
+            raise CommandError(
+                f"--fusion {options['fusion']} differs from SEARCH_FUSION = "
+                f"{settings.SEARCH_FUSION}. Set SEARCH_FUSION = {options['fusion']} first."
+            )
+        oss = OpenSearchSetup(password=settings.OPENSEARCH_PASSWORD, fusion=options["fusion"])
+        oss.create_search_pipeline(options["weights"])
+        oss.set_default_search_pipeline()
         self.stdout.write(
             self.style.SUCCESS('Updated Search Pipeline')  # pylint: disable=no-member
         )
@@ -0,0 +1,92 @@
+"""
+A service to embed search queries with the search embedding model
+"""
+import hashlib
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from integreat_chat.core.utils.inference_client import InferenceClient
+from integreat_chat.core.utils.metrics import CACHE_REQUESTS, MODEL_INFERENCE_DURATION, span
+from integreat_chat.core.utils.model_registry import ModelRegistry
+
+LOGGER = logging.getLogger("django")
+
+
+class EmbeddingService:
+    """
+    Embed queries with the same model OpenSearch uses for the index, so that
+    the vectors can be sent as knn queries. Embeddings are cached by normalized
+    text and missing embeddings are computed in one batch.
+    """
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Normalize case and whitespace of a query, the model barely distinguishes them
+        """
+        return " ".join(text.casefold().split())
+
+    @staticmethod
+    def get_cache_key(text: str) -> str:
+        """
+        Cache key of a normalized query
+        """
+        digest = hashlib.sha256(
+            f"{settings.SEARCH_EMBEDDING_MODEL_NAME}-{text}".encode("utf-8")
+        ).hexdigest()
+        return f"query_embedding_{digest}"
+
+    def encode(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed texts in one batch with the inference worker or the local model
+        """
+        backend = "worker" if settings.INFERENCE_WORKER_URL else "local"
+        with span(
+            MODEL_INFERENCE_DURATION, f"embedding:{backend}", model="embedding", backend=backend
+        ):
+            if settings.INFERENCE_WORKER_URL:
+                return InferenceClient().embed(texts)
+            return ModelRegistry.get("embedding").embed_documents(texts)
+
+    def embed_queries(self, queries: list[str]) -> list[list[float]]:
+        """
+        Embed queries, use cached embeddings if available
+
+        param queries: search queries
+        return: an embedding per query
+        """
+        texts = [self.normalize(query) for query in queries]
+        keys = {text: self.get_cache_key(text) for text in texts}
+        cached = cache.get_many(list(keys.values()))
+        embeddings = {text: cached[key] for text, key in keys.items() if key in cached}
+        missing = [text for text in keys if text not in embeddings]
+        CACHE_REQUESTS.labels(cache="query_embedding", result="hit").inc(len(embeddings))
+        CACHE_REQUESTS.labels(cache="query_embedding", result="miss").inc(len(missing))
+        if missing:
+            LOGGER.debug("Embedding %i of %i queries", len(missing), len(keys))
+            computed = dict(zip(missing, self.encode(missing)))
+            cache.set_many(
+                {keys[text]: embedding for text, embedding in computed.items()},
+                settings.SEARCH_QUERY_EMBEDDING_CACHE_TTL,
+            )
+            embeddings.update(computed)
+        return [embeddings[text] for text in texts]
+
+    def embed_query(self, query: str) -> list[float]:
+        """
+        Embed a single query
+
+        param query: search query
+        """
+        return self.embed_queries([query])[0]
+
+    async def aembed_query(self, query: str) -> list[float]:
+        """
+        Embed a query in an executor, as the embedding model is CPU-bound
+
+        param query: search query
+        """
+        return await sync_to_async(self.embed_query, thread_sensitive=False)(query)
@@ -0,0 +1,260 @@
+"""
+In-process search backend as an alternative to OpenSearch
+"""
+import logging
+import os
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from integreat_chat.core.utils.metrics import OPENSEARCH_REQUEST_DURATION, span
+
+from .embedding import EmbeddingService
+from .opensearch import OpenSearch, OpenSearchSetup
+from ..utils.index_generation import bump_index_generation
+from ..utils.local_index import LocalIndex
+
+LOGGER = logging.getLogger("django")
+
+
+class LocalSearch(OpenSearch):
+    """
+    Hybrid search on local indices, see LocalIndex. Responses have the format
+    of OpenSearch responses, so results are processed like OpenSearch results.
+    Hits contain whole chunks, highlighting is not supported.
+    """
+    size = 10
+
+    def __init__(
+            self,
+            index_dir: str | None = None,
+            fusion: str | None = None,
+            collapse: bool = False,
+        ) -> None:
+        """
+        param index_dir: directory of the indices, defaults to SEARCH_LOCAL_INDEX_DIR
+        param fusion: combination of the hybrid sub-queries, defaults to SEARCH_FUSION
+        param collapse: return only the best chunk per URL
+        """
+        super().__init__(fusion=fusion, collapse=collapse)
+        self.index_dir = index_dir or settings.SEARCH_LOCAL_INDEX_DIR
+
+    def get_index_path(self, index: str) -> str:
+        """
+        Directory of an index
+        """
+        return os.path.join(self.index_dir, index)
+
+    def search_index(
+            self,
+            index: str,
+            message: str,
+            embedding: list[float] | None,
+            size: int | None = None,
+            k: int | None = None,
+        ) -> dict:
+        """
+        Search an index and build an OpenSearch-like response
+
+        param index: name of the index, {region}_{language}
+        param message: search string / message
+        param embedding: embedding of the message, computed if not set
+        param size: number of hits
+        param k: number of nearest neighbors of the vector sub-queries
+        """
+        with span(OPENSEARCH_REQUEST_DURATION, "local:_search", endpoint="local_search"):
+            start = time.monotonic()
+            local_index = LocalIndex.get(self.get_index_path(index))
+            if local_index is None:
+                return {
+                    "error": {
+                        "type": "index_not_found_exception",
+                        "reason": f"no such index [{index}]",
+                    },
+                    "status": 404,
+                }
+            if embedding is None:
+                embedding = EmbeddingService().embed_query(message)
+            hits = local_index.search(
+                message, embedding, settings.SEARCH_HYBRID_WEIGHTS, size or self.size,
+                k or settings.SEARCH_VECTOR_K,
+                settings.SEARCH_RRF_RANK_CONSTANT if self.fusion == "rrf" else None,
+                self.collapse,
+            )
+            return {
+                "took": int((time.monotonic() - start) * 1000),
+                "hits": {
+                    "total": {"value": len(hits), "relation": "eq"},
+                    "max_score": hits[0][1] if hits else None,
+                    "hits": [
+                        {
+                            "_index": index,
+                            "_id": local_index.documents[position]["id"],
+                            "_score": score,
+                            "_source": local_index.documents[position],
+                        }
+                        for position, score in hits
+                    ],
+                },
+            }
+
+    def search(
+            self,
+            region_slug: str,
+            language_slug: str,
+            message: str,
+            embedding: list[float] | None = None,
+            size: int | None = None,
+            k: int | None = None,
+        ) -> dict:
+        """
+        Search for message
+
+        param region_slug: slug of an Integreat region
+        param language_slug: slug of a language of a region
+        param message: search string / message
+        param embedding: embedding of the message, computed if not set
+        param size: number of hits
+        param k: number of nearest neighbors of the vector sub-queries
+        """
+        return self.search_index(
+            f"{region_slug}_{language_slug}", message, embedding, size, k
+        )
+
+    async def asearch(
+            self,
+            region_slug: str,
+            language_slug: str,
+            message: str,
+            embedding: list[float] | None = None,
+            size: int | None = None,
+            k: int | None = None,
+        ) -> dict:
+        """
+        Search for message in an executor, as scoring is CPU-bound
+
+        param region_slug: slug of an Integreat region
+        param language_slug: slug of a language of a region
+        param message: search string / message
+        param embedding: embedding of the message, computed if not set
+        param size: number of hits
+        param k: number of nearest neighbors of the vector sub-queries
+        """
+        return await sync_to_async(self.search, thread_sensitive=False)(
+            region_slug, language_slug, message, embedding, size, k
+        )
+
+    def search_many(
+            self,
+            queries: list[tuple[str, str, list[float] | None]],
+            size: int | None = None,
+            k: int | None = None,
+        ) -> list[dict]:
+        """
+        Run several hybrid searches
+
+        param queries: index, message and optional embedding per query
+        param size: number of hits per query
+        param k: number of nearest neighbors of the vector sub-queries
+        return: a search response per query
+        """
+        return [self.search_index(*query, size, k) for query in queries]
+
+    async def asearch_many(
+            self,
+            queries: list[tuple[str, str, list[float] | None]],
+            size: int | None = None,
+            k: int | None = None,
+        ) -> list[dict]:
+        """
+        Run several hybrid searches in an executor
+
+        param queries: index, message and optional embedding per query
+        param size: number of hits per query
+        param k: number of nearest neighbors of the vector sub-queries
+        return: a search response per query
+        """
+        return await sync_to_async(self.search_many, thread_sensitive=False)(
+            queries, size, k
+        )
+
+    def search_api(self, index: str, payload: dict) -> dict:
+        """
+        The OpenSearch query DSL is not supported, answer with an OpenSearch-like error
+        """
+        return {
+            "error": {
+                "type": "unsupported_operation_exception",
+                "reason": "The local search backend does not support the search API",
+            },
+            "status": 501,
+        }
+
+    async def asearch_api(self, index: str, payload: dict) -> dict:
+        """
+        The OpenSearch query DSL is not supported, answer with an OpenSearch-like error
+        """
+        return self.search_api(index, payload)
+
+
+class LocalSearchSetup(LocalSearch, OpenSearchSetup):
+    """
+    Build local indices with the indexing flow of OpenSearchSetup. Embeddings
+    are always computed in this service.
+    """
+
+    def delete_index(self, index_slug: str) -> None:
+        """
+        Delete an index
+        """
+        LocalIndex.delete(self.get_index_path(index_slug))
+
+    def create_index(self, index_slug: str) -> None:
+        """
+        Indices are created when pages are indexed
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def index_pages(
+            self,
+            region_slug: str,
+            language_slug: str,
+            local_embeddings: bool = True,
+        ):
+        """
+        Fill index with pages from region
+
+        param region_slug: slug of an Integreat region
+        param language_slug: slug of a language of a region
+        param local_embeddings: ignored, embeddings are always computed locally
+        """
+        documents = self.get_chunk_documents(region_slug, language_slug)
+        self.add_embeddings(documents)
+        LocalIndex.save(self.get_index_path(f"{region_slug}_{language_slug}"), documents)
+        LOGGER.info(
+            "Wrote local index %s_%s with %i documents",
+            region_slug, language_slug, len(documents)
+        )
+        bump_index_generation(region_slug, language_slug)
+
+
+def get_search_backend(
+        setup: bool = False,
+        highlight: bool = False,
+        collapse: bool = False,
+    ) -> OpenSearch:
+    """
+    Search backend selected by SEARCH_BACKEND
+
+    param setup: return the class for building indices
+    param highlight: return snippets of the matched chunks, only supported by OpenSearch
+    param collapse: return only the best chunk per URL
+    """
+    if settings.SEARCH_BACKEND == "local":
+        return LocalSearchSetup() if setup else LocalSearch(collapse=collapse)
+    if setup:
+        return OpenSearchSetup(password=settings.OPENSEARCH_PASSWORD)
+    return OpenSearch(
+        password=settings.OPENSEARCH_PASSWORD, highlight=highlight, collapse=collapse
+    )
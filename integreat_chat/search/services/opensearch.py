@@ -2,11 +2,36 @@
 Setup and use of OpenSearch
 """
 import hashlib
+import json
+import logging
+import re
 import time
+import aiohttp
 import requests
 from django.conf import settings
 from langchain_text_splitters import HTMLHeaderTextSplitter
 
+from integreat_chat.core.utils.metrics import (
+    CMS_REQUEST_DURATION, OPENSEARCH_REQUEST_DURATION, OPENSEARCH_RESPONSE_SIZE, span
+)
+
+from .embedding import EmbeddingService
+from ..utils.index_generation import bump_index_generation
+
+LOGGER = logging.getLogger("django")
+
+FUSION_TECHNIQUES = ("normalization", "rrf")
+# names of region/language indices, {region_slug}_{language_slug}
+INDEX_NAME_PATTERN = r"[a-z0-9-]+_[a-z0-9-]+"
+# title match, content match, title knn and content knn
+HYBRID_SUB_QUERIES = 4
+
+class OpenSearchError(Exception):
+    """
+    OpenSearch failed to answer a search
+    """
+
+
 class OpenSearch:
     """
     Class for searching and updating documents in OpenSearch
@@ -14,23 +39,42 @@ class OpenSearch:
 
     ingest_pipeline_name = "nlp-ingest-pipeline"
     search_pipeline_name = "nlp-search-pipeline"
+    # fields of search hits used by reduce_search_result
+    source_fields = ["url", "title", "chunk_text"]
 
     def __init__(
             self,
-            base_url: str = "https://localhost:9200",
+            base_url: str | None = None,
             user: str = "admin",
             password: str = "changeme",
+            index_profile: str | None = None,
+            fusion: str | None = None,
+            highlight: bool = False,
+            collapse: bool = False,
         ) -> None:
         """
         OpenSearch service
 
-        param base_url: URL to OpenSearch server
+        param base_url: URL to OpenSearch server, defaults to OPENSEARCH_URL
         param user: user to log in on OpenSearch server
         parm password: password to log in on OpenSearch server
+        param index_profile: name of the vector index profile in SEARCH_INDEX_PROFILES,
+                             defaults to SEARCH_INDEX_PROFILE
+        param fusion: combination of the hybrid sub-queries, defaults to SEARCH_FUSION
+        param highlight: return a snippet of the matched chunk instead of the whole chunk
+        param collapse: return only the best chunk per URL
         """
-        self.base_url = base_url
+        self.base_url = base_url or settings.OPENSEARCH_URL
         self.user = user
         self.password = password
+        self.index_profile = settings.SEARCH_INDEX_PROFILES[
+            index_profile or settings.SEARCH_INDEX_PROFILE
+        ]
+        self.fusion = fusion or settings.SEARCH_FUSION
+        if self.fusion not in FUSION_TECHNIQUES:
+            raise ValueError(f"Unknown fusion technique {self.fusion}")
+        self.highlight = highlight
+        self.collapse = collapse
         self.model_id = settings.SEARCH_OPENSEARCH_MODEL_ID
         self.model_group_id = settings.SEARCH_OPENSEARCH_MODEL_GROUP_ID
 
@@ -42,48 +86,113 @@ class OpenSearch:
         param payload: a OpenSearch request payload
         param method: a HTTP method
         """
-        response = None
+        http_response = None
         headers = {'Content-type': 'application/json'}
-        if method == "GET":
-            response = requests.get(
-                f'{self.base_url}{path}',
-                auth=(self.user, self.password),
-                json=payload,
-                timeout=30,
-                verify=False,
-                headers=headers,
-            ).json()
-        if method == "PUT":
-            response = requests.put(
-                f'{self.base_url}{path}',
-                auth=(self.user, self.password),
-                json=payload,
-                timeout=30,
-                verify=False,
-                headers=headers,
-            ).json()
-        if method == "POST":
-            response = requests.post(
-                f'{self.base_url}{path}',
-                auth=(self.user, self.password),
-                json=payload,
-                timeout=30,
-                verify=False,
-                headers=headers,
-            ).json()
-        if method == "DELETE":
-            response = requests.delete(
-                f'{self.base_url}{path}',
-                auth=(self.user, self.password),
-                json=payload,
-                timeout=30,
-                verify=False,
-                headers=headers,
-            ).json()
-        if response:
+        endpoint = self.get_endpoint(path)
+        with span(OPENSEARCH_REQUEST_DURATION, f"opensearch:{endpoint}", endpoint=endpoint):
+            if method == "GET":
+                http_response = requests.get(
+                    f'{self.base_url}{path}',
+                    auth=(self.user, self.password),
+                    json=payload,
+                    timeout=30,
+                    verify=False,
+                    headers=headers,
+                )
+            if method == "PUT":
+                http_response = requests.put(
+                    f'{self.base_url}{path}',
+                    auth=(self.user, self.password),
+                    json=payload,
+                    timeout=30,
+                    verify=False,
+                    headers=headers,
+                )
+            if method == "POST":
+                http_response = requests.post(
+                    f'{self.base_url}{path}',
+                    auth=(self.user, self.password),
+                    json=payload,
+                    timeout=30,
+                    verify=False,
+                    headers=headers,
+                )
+            if method == "DELETE":
+                http_response = requests.delete(
+                    f'{self.base_url}{path}',
+                    auth=(self.user, self.password),
+                    json=payload,
+                    timeout=30,
+                    verify=False,
+                    headers=headers,
+                )
+        if http_response is None:
+            raise NotImplementedError("HTTP Method not implemented")
+        OPENSEARCH_RESPONSE_SIZE.labels(endpoint=endpoint).observe(len(http_response.content))
+        if response := http_response.json():
             return response
         raise NotImplementedError("HTTP Method not implemented")
 
+    async def arequest(self, path: str, payload: dict, method: str = "GET") -> dict:
+        """
+        Wrapper around async requests to OpenSearch server
+
+        param path: path appended to the OpenSearch base_url
+        param payload: a OpenSearch request payload
+        param method: a HTTP method
+        """
+        if method not in ("GET", "PUT", "POST", "DELETE"):
+            raise NotImplementedError("HTTP Method not implemented")
+        endpoint = self.get_endpoint(path)
+        with span(OPENSEARCH_REQUEST_DURATION, f"opensearch:{endpoint}", endpoint=endpoint):
+            async with aiohttp.ClientSession() as session:
+                async with session.request(
+                    method,
+                    f'{self.base_url}{path}',
+                    auth=aiohttp.BasicAuth(self.user, self.password),
+                    json=payload,
+                    timeout=aiohttp.ClientTimeout(total=30),
+                    ssl=False,
+                    headers={'Content-type': 'application/json'},
+                ) as response:
+                    body = await response.read()
+        OPENSEARCH_RESPONSE_SIZE.labels(endpoint=endpoint).observe(len(body))
+        return json.loads(body) if body else None
+
+    @staticmethod
+    def get_endpoint(path: str) -> str:
+        """
+        API endpoint of a request path for metrics, e.g. _search or _doc
+
+        param path: path appended to the OpenSearch base_url
+        """
+        for segment in path.split("?")[0].split("/"):
+            if segment.startswith("_"):
+                return segment
+        return "index"
+
+    def normalize_score(self, score: float) -> float:
+        """
+        Scale RRF scores to 0..1, a hit that all sub-queries rank first scores 1.
+        Normalized scores are returned unchanged.
+
+        param score: score of a hit
+        """
+        if self.fusion == "rrf":
+            return score * (settings.SEARCH_RRF_RANK_CONSTANT + 1) / HYBRID_SUB_QUERIES
+        return score
+
+    @staticmethod
+    def get_chunk_text(hit: dict) -> str:
+        """
+        Highlighted snippet of a hit or its whole chunk
+
+        param hit: search hit
+        """
+        if snippets := hit.get("highlight", {}).get("chunk_text"):
+            return snippets[0]
+        return hit["_source"].get("chunk_text", "")
+
     def reduce_search_result(
             self,
             response: dict,
@@ -101,36 +210,254 @@ class OpenSearch:
         param min_score: Minimum required score for a hit to be included in the result
         """
         result = []
-        found_urls = []
+        found_urls = set()
         if "hits" not in response["hits"]:
             raise ValueError("Missing hits in result")
         for document in response["hits"]["hits"]:
+            score = self.normalize_score(document["_score"])
             if (
                 (deduplicate and document["_source"]["url"] in found_urls)
-                or document["_score"] < min_score
+                or score < min_score
             ):
                 continue
             result.append({
                 "url": document["_source"]["url"],
                 "title": document["_source"]["title"],
-                "score": document["_score"],
-                "chunk_text": document["_source"]["chunk_text"],
+                "score": score,
+                "chunk_text": self.get_chunk_text(document),
+                "index": document.get("_index"),
             })
-            found_urls.append(document["_source"]["url"])
+            found_urls.add(document["_source"]["url"])
         return result[:max_results]
 
-    def search(self, region_slug: str, language_slug: str, message: str) -> dict:
+    def search(
+            self,
+            region_slug: str,
+            language_slug: str,
+            message: str,
+            embedding: list[float] | None = None,
+            size: int | None = None,
+            k: int | None = None,
+        ) -> dict:
         """
         Search for message
 
         param region_slug: slug of an Integreat region
         param language_slug: slug of a language of a region
         param message: search string / message
+        param embedding: embedding of the message, OpenSearch embeds the message if not set
+        param size: number of hits, defaults to the OpenSearch default of 10
+        param k: number of nearest neighbors of the vector sub-queries
+        """
+        return self.request(
+            f"/{region_slug}_{language_slug}/_search?"
+            f"search_pipeline={self.search_pipeline_name}",
+            self.build_search_payload(message, embedding, k, size),
+            "GET"
+        )
+
+    async def asearch(
+            self,
+            region_slug: str,
+            language_slug: str,
+            message: str,
+            embedding: list[float] | None = None,
+            size: int | None = None,
+            k: int | None = None,
+        ) -> dict:
+        """
+        Search for message without blocking the event loop
+
+        param region_slug: slug of an Integreat region
+        param language_slug: slug of a language of a region
+        param message: search string / message
+        param embedding: embedding of the message, OpenSearch embeds the message if not set
+        param size: number of hits, defaults to the OpenSearch default of 10
+        param k: number of nearest neighbors of the vector sub-queries
+        """
+        return await self.arequest(
+            f"/{region_slug}_{language_slug}/_search?"
+            f"search_pipeline={self.search_pipeline_name}",
+            self.build_search_payload(message, embedding, k, size),
+            "GET"
+        )
+
+    def build_msearch_body(
+            self,
+            queries: list[tuple[str, str, list[float] | None]],
+            size: int | None = None,
+            k: int | None = None,
+        ) -> str:
+        """
+        NDJSON body for _msearch. Every header names the search pipeline, so
+        indices without a default search pipeline are normalized as well.
+
+        param queries: index, message and optional embedding per query
+        param size: number of hits per query
+        param k: number of nearest neighbors of the vector sub-queries
+        """
+        return "".join(
+            f"{json.dumps({'index': index, 'search_pipeline': self.search_pipeline_name})}\n"
+            f"{json.dumps(self.build_search_payload(message, embedding, k, size))}\n"
+            for index, message, embedding in queries
+        )
+
+    def search_many(
+            self,
+            queries: list[tuple[str, str, list[float] | None]],
+            size: int | None = None,
+            k: int | None = None,
+        ) -> list[dict]:
+        """
+        Send several hybrid searches in one round trip
+
+        param queries: index, message and optional embedding per query
+        param size: number of hits per query
+        param k: number of nearest neighbors of the vector sub-queries
+        return: a search response per query
+        """
+        with span(OPENSEARCH_REQUEST_DURATION, "opensearch:_msearch", endpoint="_msearch"):
+            response = requests.post(
+                f"{self.base_url}/_msearch",
+                auth=(self.user, self.password),
+                data=self.build_msearch_body(queries, size, k).encode("utf-8"),
+                timeout=30,
+                verify=False,
+                headers={"Content-type": "application/x-ndjson"},
+            )
+        OPENSEARCH_RESPONSE_SIZE.labels(endpoint="_msearch").observe(len(response.content))
+        response.raise_for_status()
+        return self.get_responses(response.json())
+
+    async def asearch_many(
+            self,
+            queries: list[tuple[str, str, list[float] | None]],
+            size: int | None = None,
+            k: int | None = None,
+        ) -> list[dict]:
+        """
+        Send several hybrid searches in one round trip without blocking the event loop
+
+        param queries: index, message and optional embedding per query
+        param size: number of hits per query
+        param k: number of nearest neighbors of the vector sub-queries
+        return: a search response per query
+        """
+        with span(OPENSEARCH_REQUEST_DURATION, "opensearch:_msearch", endpoint="_msearch"):
+            async with aiohttp.ClientSession() as session:
+                async with session.post(
+                    f"{self.base_url}/_msearch",
+                    auth=aiohttp.BasicAuth(self.user, self.password),
+                    data=self.build_msearch_body(queries, size, k).encode("utf-8"),
+                    timeout=aiohttp.ClientTimeout(total=30),
+                    ssl=False,
+                    headers={"Content-type": "application/x-ndjson"},
+                ) as response:
+                    body = await response.read()
+                    OPENSEARCH_RESPONSE_SIZE.labels(endpoint="_msearch").observe(len(body))
+                    response.raise_for_status()
+        return self.get_responses(json.loads(body))
+
+    @staticmethod
+    def get_responses(body: dict) -> list[dict]:
+        """
+        Search responses of a _msearch response
+
+        param body: _msearch response
+        """
+        if "responses" not in body:
+            raise OpenSearchError(f"Multi search failed: {body.get('error', body)}")
+        return body["responses"]
+
+    def fuse_responses(
+            self,
+            responses: list[dict],
+            indices: list[str],
+            optional_indices: tuple[str, ...] | list[str] = (),
+        ) -> dict:
+        """
+        Merge the hits of several searches. Hits of the same chunk are fused
+        with their maximum score, which keeps the scores on the scale of a single
+        search, so score thresholds still apply. As every search is normalized by
+        the search pipeline on its own, hits of different indices are comparable.
+
+        param responses: search responses, e.g. of search_many()
+        param indices: searched index per response
+        param optional_indices: indices that are skipped if they do not exist
+        return: a search response with the fused hits
+        """
+        hits = {}
+        failures = 0
+        for response, index in zip(responses, indices):
+            if "error" in response:
+                error = response["error"]
+                if (
+                    index not in optional_indices
+                    or not isinstance(error, dict)
+                    or error.get("type") != "index_not_found_exception"
+                ):
+                    raise OpenSearchError(f"Search in {index} failed: {error}")
+                LOGGER.warning("Skipping missing index %s", index)
+                failures += 1
+                continue
+            for hit in response["hits"]["hits"]:
+                key = (hit["_source"]["url"], self.get_chunk_text(hit))
+                if key not in hits or hit["_score"] > hits[key]["_score"]:
+                    hits[key] = hit
+        if responses and failures == len(responses):
+            raise OpenSearchError(f"All searches failed: {', '.join(dict.fromkeys(indices))}")
+        fused_hits = sorted(hits.values(), key=lambda hit: hit["_score"], reverse=True)
+        return {"hits": {"hits": fused_hits}}
+
+    def build_vector_query(
+            self, field: str, message: str, embedding: list[float] | None, k: int | None = None
+        ) -> dict:
+        """
+        Vector sub-query for an embedding field. Send the embedding as knn query
+        if available, let the ML node embed the message otherwise.
+
+        param field: embedding field of the index
+        param message: search string / message
+        param embedding: embedding of the message
+        param k: number of nearest neighbors, defaults to SEARCH_VECTOR_K
+        """
+        if embedding is not None:
+            query_type, parameters = "knn", {
+                "vector": embedding,
+                "k": k or settings.SEARCH_VECTOR_K
+            }
+        else:
+            query_type, parameters = "neural", {
+                "query_text": message,
+                "model_id": self.model_id,
+                "k": k or settings.SEARCH_VECTOR_K
+            }
+        if "ef_search" in self.index_profile:
+            parameters["method_parameters"] = {"ef_search": self.index_profile["ef_search"]}
+        return {query_type: {field: parameters}}
+
+    def build_search_payload(
+            self,
+            message: str,
+            embedding: list[float] | None = None,
+            k: int | None = None,
+            size: int | None = None,
+        ) -> dict:
+        """
+        Hybrid search query for message. Every sub-query contributes up to size
+        candidates, so a small size also reduces the work of the fusion. Hits only
+        contain the fields used by reduce_search_result, in particular no embeddings.
+
+        param message: search string / message
+        param embedding: embedding of the message
+        param k: number of nearest neighbors of the vector sub-queries
+        param size: number of hits, defaults to the OpenSearch default of 10
         """
         payload = {
             "_source": {
-                "exclude": [
-                    "chunk_embedding"
+                "includes": [
+                    field for field in self.source_fields
+                    if not (self.highlight and field == "chunk_text")
                 ]
             },
             "query": {
@@ -150,32 +477,71 @@ class OpenSearch:
                             }
                         }
                         },
-                        {
-                        "neural": {
-                            "title_embedding": {
-                                "query_text": message,
-                                "model_id": self.model_id,
-                                "k": 5
+                        self.build_vector_query("title_embedding", message, embedding, k),
+                        self.build_vector_query("chunk_embedding", message, embedding, k),
+                    ]
+                }
+            }
+        }
+        if size is not None:
+            payload["size"] = size
+        if self.collapse:
+            payload["collapse"] = {"field": "url"}
+        if self.highlight:
+            payload["highlight"] = {
+                "pre_tags": [""],
+                "post_tags": [""],
+                "fields": {
+                    "chunk_text": {
+                        "fragment_size": settings.SEARCH_HIGHLIGHT_FRAGMENT_SIZE,
+                        "number_of_fragments": 1,
+                        # chunks that only match the vector sub-queries
+                        "no_match_size": settings.SEARCH_HIGHLIGHT_FRAGMENT_SIZE,
+                    }
+                }
+            }
+        return payload
+
+    def build_search_pipeline(self, weights: list[float] | None = None) -> dict:
+        """
+        Hybrid search pipeline for the fusion technique. The pipeline can be stored
+        with create_search_pipeline() or sent as temporary pipeline with a search request.
+
+        param weights: weights of the hybrid sub-queries, defaults to SEARCH_HYBRID_WEIGHTS,
+                       not used by reciprocal rank fusion
+        """
+        if self.fusion == "rrf":
+            return {
+                "description": "Reciprocal rank fusion for hybrid search",
+                "phase_results_processors": [
+                    {
+                        "score-ranker-processor": {
+                            "combination": {
+                                "technique": "rrf",
+                                "rank_constant": settings.SEARCH_RRF_RANK_CONSTANT
                             }
                         }
+                    }
+                ]
+            }
+        return {
+            "description": "Post processor for hybrid search",
+            "phase_results_processors": [
+                {
+                    "normalization-processor": {
+                        "normalization": {
+                            "technique": "min_max"
                         },
-                        {
-                        "neural": {
-                            "chunk_embedding": {
-                                "query_text": message,
-                                "model_id": self.model_id,
-                                "k": 5
+                        "combination": {
+                            "technique": "arithmetic_mean",
+                            "parameters": {
+                                "weights": weights or settings.SEARCH_HYBRID_WEIGHTS
                             }
                         }
-                        }
-                    ]
+                    }
                 }
-            }
+            ]
         }
-        return self.request(
-            f"/{region_slug}_{language_slug}/_search?"
-            f"search_pipeline={self.search_pipeline_name}", payload, "GET"
-        )
 
     def search_api(self, index: str, payload: dict) -> dict:
         """
@@ -187,6 +553,16 @@ class OpenSearch:
             f"/{index}/_search?search_pipeline={self.search_pipeline_name}", payload, "GET"
         )
 
+    async def asearch_api(self, index: str, payload: dict) -> dict:
+        """
+        Async wrapper for full API search
+        """
+        if not index:
+            raise ValueError("No search index provided")
+        return await self.arequest(
+            f"/{index}/_search?search_pipeline={self.search_pipeline_name}", payload, "GET"
+        )
+
 class OpenSearchSetup(OpenSearch):
     """
     Setup for OpenSearch
@@ -313,34 +689,45 @@ class OpenSearchSetup(OpenSearch):
         }
         self.request(f"/_ingest/pipeline/{self.ingest_pipeline_name}", payload, "PUT")
 
-    def create_search_pipeline(self):
+    def create_search_pipeline(self, weights: list[float] | None = None):
         """
         Create index search pipeline
+
+        param weights: weights of the hybrid sub-queries, defaults to SEARCH_HYBRID_WEIGHTS
+        """
+        payload = self.build_search_pipeline(weights)
+        self.request(f"/_search/pipeline/{self.search_pipeline_name}", payload, "PUT")
+
+    def list_indices(self) -> list[str]:
+        """
+        Names of the region/language indices of the app. System and plugin
+        indices, e.g. .plugins-ml-config or security-auditlog-*, are excluded.
+        """
+        response = requests.get(
+            f"{self.base_url}/_cat/indices?format=json&h=index",
+            auth=(self.user, self.password),
+            timeout=30,
+            verify=False,
+        )
+        response.raise_for_status()
+        return sorted(
+            index["index"] for index in response.json()
+            if re.fullmatch(INDEX_NAME_PATTERN, index["index"])
+        )
+
+    def set_default_search_pipeline(self, indices: list[str] | None = None) -> None:
+        """
+        Use the hybrid search pipeline for all searches on the region/language
+        indices. _msearch does not take a search pipeline per search, so
+        searches of further indices are only normalized or fused with it.
+
+        param indices: index names, defaults to all region/language indices
         """
         payload = {
-            "description": "Post processor for hybrid search",
-            "phase_results_processors": [
-                {
-                    "normalization-processor": {
-                        "normalization": {
-                            "technique": "min_max"
-                        },
-                        "combination": {
-                            "technique": "arithmetic_mean",
-                            "parameters": {
-                                "weights": [
-                                    0.15,  # title match
-                                    0.2,   # content match
-                                    0.15,  # title embedding
-                                    0.5    # content embedding
-                                ]
-                            }
-                        }
-                    }
-                }
-            ]
+            "index.search.default_pipeline": self.search_pipeline_name,
         }
-        self.request(f"/_search/pipeline/{self.search_pipeline_name}", payload, "PUT")
+        for index in self.list_indices() if indices is None else indices:
+            self.request(f"/{index}/_settings", payload, "PUT")
 
     def set_default_index_model(self, model_id):
         """
@@ -373,6 +760,7 @@ class OpenSearchSetup(OpenSearch):
             "settings": {
                 "index.knn": True,
                 "default_pipeline": self.ingest_pipeline_name,
+                "index.search.default_pipeline": self.search_pipeline_name,
             },
             "mappings": {
                 "properties": {
@@ -380,30 +768,20 @@ class OpenSearchSetup(OpenSearch):
                     "type": "text"
                 },
                 "url": {
-                    "type": "text"
+                    "type": "keyword"
                 },
                 "title": {
                     "type": "text"
                 },
                 "chunk_embedding": {
                     "type": "knn_vector",
-                    "dimension": 384,
-                    "method": {
-                        "engine": "lucene",
-                        "space_type": "l2",
-                        "name": "hnsw",
-                        "parameters": {}
-                    }
+                    "dimension": settings.SEARCH_EMBEDDING_DIMENSION,
+                    "method": self.index_profile["method"],
                 },
                 "title_embedding": {
                     "type": "knn_vector",
-                    "dimension": 384,
-                    "method": {
-                    "engine": "lucene",
-                    "space_type": "l2",
-                    "name": "hnsw",
-                    "parameters": {}
-                }
+                    "dimension": settings.SEARCH_EMBEDDING_DIMENSION,
+                    "method": self.index_profile["method"],
                 },
                 "chunk_text": {
                     "type": "text"
@@ -413,25 +791,106 @@ class OpenSearchSetup(OpenSearch):
         }
         return self.request(f"/{index_slug}", payload, "PUT")
 
-    def index_pages(self, region_slug: str, language_slug: str):
+    def index_pages(
+            self,
+            region_slug: str,
+            language_slug: str,
+            local_embeddings: bool = settings.SEARCH_LOCAL_INDEX_EMBEDDING,
+        ):
         """
         Fill index with pages from region
+
+        param region_slug: slug of an Integreat region
+        param language_slug: slug of a language of a region
+        param local_embeddings: compute embeddings locally instead of in the ingest pipeline
+        """
+        index = f"{region_slug}_{language_slug}"
+        documents = self.get_chunk_documents(region_slug, language_slug)
+        if local_embeddings:
+            self.add_embeddings(documents)
+            for start in range(0, len(documents), settings.SEARCH_INDEX_BULK_SIZE):
+                self.bulk_index(index, documents[start:start + settings.SEARCH_INDEX_BULK_SIZE])
+        else:
+            for document in documents:
+                self.request(f"/{index}/_doc/{document['id']}", document, "PUT")
+        bump_index_generation(region_slug, language_slug)
+
+    def get_chunk_documents(self, region_slug: str, language_slug: str) -> list[dict]:
         """
-        known_hashes = []
+        Split the pages of a region into chunks, skip duplicate chunks. Every chunk
+        gets its own document ID of page ID, position in the page and chunk hash.
+
+        param region_slug: slug of an Integreat region
+        param language_slug: slug of a language of a region
+        """
+        known_hashes = set()
+        documents = []
         for page in self.fetch_pages_from_cms(region_slug, language_slug):
             texts, paths = self.split_page(page)  # pylint: disable=W0612
-            for chunk in texts:
-                chunk_hash = hashlib.md5(chunk.encode(encoding="utf-8")).digest()
+            for position, chunk in enumerate(texts):
+                chunk_hash = hashlib.md5(chunk.encode(encoding="utf-8")).hexdigest()
                 if chunk_hash in known_hashes:
                     continue
-                known_hashes.append(chunk_hash)
-                payload = {
+                known_hashes.add(chunk_hash)
+                documents.append({
                     "chunk_text": chunk,
-                    "id": page["id"],
+                    "id": f"{page['id']}_{position}_{chunk_hash[:8]}",
                     "title": page["title"],
                     "url": f"https://{settings.INTEGREAT_APP_DOMAIN}{page['path']}",
-                }
-                self.request(f"/{region_slug}_{language_slug}/_doc/{page['id']}", payload, "PUT")
+                })
+        return documents
+
+    def add_embeddings(self, documents: list[dict]) -> None:
+        """
+        Embed titles and chunks in batches. Every distinct text is embedded once,
+        as all chunks of a page share the title.
+
+        param documents: chunk documents, embeddings are added in place
+        """
+        texts = list(dict.fromkeys(
+            text for document in documents for text in (document["title"], document["chunk_text"])
+        ))
+        embedding_service = EmbeddingService()
+        embeddings = {}
+        batch_size = settings.SEARCH_INDEX_EMBEDDING_BATCH_SIZE
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            embeddings.update(zip(batch, embedding_service.encode(batch)))
+        LOGGER.info(
+            "Embedded %i distinct texts for %i documents", len(texts), len(documents)
+        )
+        for document in documents:
+            document["title_embedding"] = embeddings[document["title"]]
+            document["chunk_embedding"] = embeddings[document["chunk_text"]]
+
+    def bulk_index(self, index: str, documents: list[dict]) -> None:
+        """
+        Index documents with precomputed embeddings in one request, bypassing the
+        default ingest pipeline of the index
+
+        param index: name of the index
+        param documents: chunk documents with embeddings
+        """
+        body = "".join(
+            f"{json.dumps({'index': {'_index': index, '_id': document['id']}})}\n"
+            f"{json.dumps(document)}\n"
+            for document in documents
+        )
+        with span(OPENSEARCH_REQUEST_DURATION, "opensearch:_bulk", endpoint="_bulk"):
+            response = requests.post(
+                f"{self.base_url}/_bulk?pipeline=_none",
+                auth=(self.user, self.password),
+                data=body.encode("utf-8"),
+                timeout=120,
+                verify=False,
+                headers={"Content-type": "application/x-ndjson"},
+            ).json()
+        if response.get("errors"):
+            failed = [item for item in response["items"] if "error" in item["index"]]
+            LOGGER.error(
+                "Failed to index %i of %i documents in %s: %s",
+                len(failed), len(documents), index, failed[0]["index"]["error"]
+            )
 
     def split_page(self, page):
         """
@@ -459,6 +918,7 @@ class OpenSearchSetup(OpenSearch):
         get data from Integreat cms
         """
         pages_url = (
-            f"https://{settings.INTEGREAT_CMS_DOMAIN}/api/v3/{region_slug}/{language_slug}/pages"
+            f"{settings.INTEGREAT_CMS_URL}/api/v3/{region_slug}/{language_slug}/pages"
         )
-        return requests.get(pages_url, timeout=30).json()
+        with span(CMS_REQUEST_DURATION, "cms:pages", endpoint="pages"):
+            return requests.get(pages_url, timeout=30).json()
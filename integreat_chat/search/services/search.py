@@ -1,9 +1,19 @@
 """
 A service to search for documents
 """
+import asyncio
+
+import aiohttp
+from asgiref.sync import async_to_sync, sync_to_async
 from django.conf import settings
 
-from .opensearch import OpenSearch
+from integreat_chat.core.utils.metrics import stage
+from integreat_chat.core.utils.single_flight import SingleFlight
+
+from .embedding import EmbeddingService
+from .local_search import get_search_backend
+from .search_cache import SearchCache
+from ..utils.index_generation import aget_index_generation
 from ..utils.search_request import SearchRequest
 from ..utils.search_response import SearchResponse, Document
 
@@ -11,14 +21,54 @@ class SearchService:
     """
     Service class that enables searching for Integreat content
     """
-    def __init__(self, search_request: SearchRequest, deduplicate_results: bool) -> None:
+    def __init__(
+            self,
+            search_request: SearchRequest,
+            deduplicate_results: bool,
+            local_embedding: bool = settings.SEARCH_LOCAL_QUERY_EMBEDDING,
+            query_variants: list[str] | None = None,
+            highlight: bool = False,
+        ) -> None:
+        """
+        param search_request: the search request
+        param deduplicate_results: skip chunks of already found pages
+        param local_embedding: embed the query locally instead of on the OpenSearch ML node
+        param query_variants: further messages that are searched in addition to the
+                              request message, e.g. an optimized query
+        param highlight: return a snippet of the matched chunk instead of the whole chunk
+        """
         self.search_request = search_request
-        self.language = search_request.use_language
+        self.local_embedding = local_embedding
+        self.query_variants = query_variants or []
         self.original_language = search_request.gui_language
         self.region = search_request.region
-        self.os = OpenSearch(password=settings.OPENSEARCH_PASSWORD)
+        self.highlight = highlight
+        self.os = get_search_backend(
+            highlight=highlight,
+            collapse=deduplicate_results and settings.SEARCH_COLLAPSE,
+        )
         self.deduplicate_results = deduplicate_results
 
+    @property
+    def language(self) -> str:
+        """
+        Search language, detection is delayed until it is needed
+        """
+        return self.search_request.use_language
+
+    @property
+    def indices(self) -> dict[str, dict]:
+        """
+        Searched indices with their region and language, the index of the
+        request region first
+        """
+        return {
+            f"{region}_{language}": {"region": region, "language": language}
+            for region, language in [
+                (self.region, self.language), *self.search_request.indices
+            ]
+        }
+
     def search_documents(
             self,
             max_results: int = settings.SEARCH_MAX_DOCUMENTS,
@@ -26,29 +76,150 @@ class SearchService:
             min_score: int = settings.SEARCH_SCORE_THRESHOLD,
         ) -> SearchResponse:
         """
-        Create summary answer for question
+        Create summary answer for question. Sync wrapper for asearch_documents().
 
         param max_results: limit number of results to N documents
         param include_text: fetch full text of page from Integreat CMS
         param min_score: Minimum required score for a hit to be included in the result
         """
+        return async_to_sync(self.asearch_documents)(max_results, include_text, min_score)
+
+    async def asearch_documents(
+            self,
+            max_results: int = settings.SEARCH_MAX_DOCUMENTS,
+            include_text: bool = False,
+            min_score: int = settings.SEARCH_SCORE_THRESHOLD,
+        ) -> SearchResponse:
+        """
+        Create summary answer for question. Results are cached and identical
+        concurrent requests are searched only once.
+
+        param max_results: limit number of results to N documents
+        param include_text: fetch full text of page from Integreat CMS
+        param min_score: Minimum required score for a hit to be included in the result
+        """
+        key_parts = [
+            self.region,
+            self.search_request.gui_language,
+            self.search_request.original_message,
+            self.search_request.skip_language_detection,
+            self.deduplicate_results,
+            self.highlight,
+            *self.query_variants,
+            *[
+                f"{region}_{language}:{await aget_index_generation(region, language)}"
+                for region, language in self.search_request.indices
+            ],
+            max_results,
+            include_text,
+            min_score,
+        ]
+        search_cache = SearchCache(self.search_request, key_parts)
+        if settings.SEARCH_RESULT_CACHE and (
+            payload := await sync_to_async(search_cache.lookup, thread_sensitive=False)()
+        ) is not None:
+            return SearchResponse.from_payload(payload, self.search_request)
+
+        async def search():
+            with stage("prepare_request"):
+                await self.search_request.prepare()
+            # read before searching, so a rebuild during the search invalidates the result
+            generation = await aget_index_generation(
+                self.search_request.region, self.search_request.use_language
+            )
+            response = await self.run_search(max_results, include_text, min_score)
+            return {"payload": response.as_payload(), "generation": generation}
+
+        result = await SingleFlight("search", key_parts).run(search)
+        await self.search_request.prepare()
+        if settings.SEARCH_RESULT_CACHE:
+            await sync_to_async(search_cache.store, thread_sensitive=False)(
+                result["payload"], result["generation"]
+            )
+        return SearchResponse.from_payload(result["payload"], self.search_request)
+
+    async def run_search(
+            self,
+            max_results: int,
+            include_text: bool,
+            min_score: int,
+        ) -> SearchResponse:
+        """
+        Search OpenSearch and enrich the results with details from the Integreat CMS.
+        Documents of further indices of the request carry their origin.
+
+        param max_results: limit number of results to N documents
+        param include_text: fetch full text of page from Integreat CMS
+        param min_score: Minimum required score for a hit to be included in the result
+        """
+        await self.search_request.prepare()
         results = self.os.reduce_search_result(
-            response = self.os.search(
-                self.region,
-                self.language,
-                self.search_request.translated_message
-            ),
+            response = await self.search(self.get_candidate_count(max_results)),
             deduplicate = self.deduplicate_results,
             max_results = max_results,
             min_score = min_score,
         )
-        documents = []
-        for result in results:
-            documents.append(Document(
+        indices = self.indices
+        documents = [
+            Document(
                 result["url"],
                 result["chunk_text"],
                 result["score"],
-                include_text,
-                self.search_request.gui_language
-            ))
+                self.search_request.gui_language,
+                indices.get(result["index"]) if len(indices) > 1 else None,
+            )
+            for result in results
+        ]
+        with stage("enrichment"):
+            async with aiohttp.ClientSession() as session:
+                await asyncio.gather(*[
+                    document.enrich(session, include_text) for document in documents
+                ])
         return SearchResponse(self.search_request, documents)
+
+    def get_candidate_count(self, max_results: int) -> int:
+        """
+        Number of hits fetched per query. Deduplication skips further chunks of
+        found pages, so more candidates than results are needed, unless OpenSearch
+        already collapses the hits per page.
+
+        param max_results: limit number of results to N documents
+        """
+        if self.deduplicate_results and not self.os.collapse:
+            max_results *= settings.SEARCH_CANDIDATES_PER_RESULT
+        return min(max_results, settings.SEARCH_MAX_DOCUMENTS)
+
+    async def search(self, size: int | None = None) -> dict:
+        """
+        Search the request message and all query variants in all indices of
+        the request. Several queries are sent in one _msearch request and their
+        hits are fused.
+
+        param size: number of hits per query
+        return: OpenSearch response
+        """
+        messages = list(dict.fromkeys(
+            [self.search_request.translated_message, *self.query_variants]
+        ))
+        embeddings = [None] * len(messages)
+        if self.local_embedding:
+            with stage("query_embedding"):
+                embeddings = await sync_to_async(
+                    EmbeddingService().embed_queries, thread_sensitive=False
+                )(messages)
+        indices = list(self.indices)
+        if len(messages) == 1 and len(indices) == 1:
+            return await self.os.asearch(
+                self.region, self.language, messages[0], embeddings[0], size
+            )
+        queries = [
+            (index, message, embedding)
+            for index in indices
+            for message, embedding in zip(messages, embeddings)
+        ]
+        # indices of other regions may not exist, the request index has to
+        return self.os.fuse_responses(
+            await self.os.asearch_many(queries, size),
+            [index for index, _, _ in queries],
+            indices[1:],
+        )
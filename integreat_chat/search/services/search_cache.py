@@ -0,0 +1,97 @@
+"""
+Cache for search results
+"""
+
+import hashlib
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from integreat_chat.core.utils.metrics import CACHE_REQUESTS
+from integreat_chat.core.utils.single_flight import SingleFlight
+
+from ..utils.index_generation import get_index_generation
+from ..utils.search_request import SearchRequest
+
+LOGGER = logging.getLogger("django")
+
+
+class SearchCache:
+    """
+    Cache for reduced and enriched search results. Entries are keyed by the
+    normalized message before language detection, so hits skip detection and
+    translation as well. An entry is only valid for the index generation it
+    was created with.
+    """
+    statistics: dict[str, dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0})
+    statistics_lock = threading.Lock()
+
+    def __init__(self, search_request: SearchRequest, key_parts: list) -> None:
+        """
+        param search_request: the search request
+        param key_parts: values that identify identical searches, strings are normalized
+        """
+        self.search_request = search_request
+        digest = hashlib.sha256(
+            "\x1f".join(SingleFlight.normalize(str(part)) for part in key_parts).encode("utf-8")
+        ).hexdigest()
+        self.cache_key = f"search_result_{search_request.region}_{digest}"
+
+    @classmethod
+    def count_access(cls, region: str, hit: bool) -> None:
+        """
+        Count cache hits and misses per region
+        """
+        CACHE_REQUESTS.labels(cache="search_result", result="hit" if hit else "miss").inc()
+        with cls.statistics_lock:
+            cls.statistics[region]["hits" if hit else "misses"] += 1
+
+    @classmethod
+    def get_statistics(cls) -> dict:
+        """
+        Cache hits, misses and hit rate per region of this process
+        """
+        with cls.statistics_lock:
+            return {
+                region: {
+                    **counts,
+                    "hit_rate": counts["hits"] / (counts["hits"] + counts["misses"]),
+                }
+                for region, counts in cls.statistics.items()
+            }
+
+    def lookup(self) -> list[dict] | None:
+        """
+        Get cached search result. The detected language and translation of the
+        message are restored into the request.
+
+        return: payload created by SearchResponse.as_payload() or None
+        """
+        region = self.search_request.region
+        entry = cache.get(self.cache_key)
+        if entry is None or entry["generation"] != get_index_generation(region, entry["language"]):
+            self.count_access(region, False)
+            return None
+        self.count_access(region, True)
+        LOGGER.debug("Using cached search result for %s", self.search_request.original_message)
+        self.search_request.likely_message_language = entry["likely_message_language"]
+        self.search_request.translated_message = entry["translated_message"]
+        return entry["payload"]
+
+    def store(self, payload: list[dict], generation: int) -> None:
+        """
+        Store search result of a prepared request
+
+        param payload: payload created by SearchResponse.as_payload()
+        param generation: generation of the searched index, read before searching
+        """
+        cache.set(self.cache_key, {
+            "language": self.search_request.use_language,
+            "generation": generation,
+            "likely_message_language": self.search_request.likely_message_language,
+            "translated_message": self.search_request.translated_message,
+            "payload": payload,
+        }, settings.SEARCH_RESULT_CACHE_TTL)
@@ -1,3 +1,625 @@
-from django.test import TestCase
+"""
+Search backend tests
+"""
+import asyncio
+import io
+import json
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import numpy
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import AsyncClient, SimpleTestCase
+from django.test.utils import override_settings
+
+from integreat_chat.core.utils.fake_services import FakeCmsServer, FakeOpenSearchServer
+from integreat_chat.core.utils.inference_client import InferenceUnavailableError
+from integreat_chat.search.services.embedding import EmbeddingService
+
+from .management.commands import benchmark_index_profiles, evaluate_search
+from .services.local_search import LocalSearch
+from .services.opensearch import OpenSearch, OpenSearchError, OpenSearchSetup
+from .services.search import SearchService
+from .utils.index_generation import bump_index_generation
+from .utils.local_index import LocalIndex
+from .utils.search_request import SearchRequest
+from .utils.search_response import SearchResponse
+
+DOCUMENTS = [
+    {
+        "id": 1,
+        "title": "Deutschkurse",
+        "chunk_text": "Integrationskurse und Deutschkurse für Erwachsene in der Stadt.",
+        "url": "https://integreat.app/testumgebung/de/deutschkurse/",
+        "title_embedding": [1.0, 0.0, 0.0],
+        "chunk_embedding": [0.9, 0.1, 0.0],
+    },
+    {
+        "id": 2,
+        "title": "Wohnung anmelden",
+        "chunk_text": "Die Anmeldung der Wohnung erfolgt beim Bürgerbüro.",
+        "url": "https://integreat.app/testumgebung/de/wohnung/",
+        "title_embedding": [0.0, 1.0, 0.0],
+        "chunk_embedding": [0.1, 0.9, 0.0],
+    },
+    {
+        "id": 3,
+        "title": "Kita",
+        "chunk_text": "Betreuung für Kinder unter sechs Jahren.",
+        "url": "https://integreat.app/testumgebung/de/kita/",
+        "title_embedding": [0.0, 0.0, 1.0],
+        "chunk_embedding": [0.0, 0.1, 0.9],
+    },
+]
+
+
+class LocalSearchTest(SimpleTestCase):
+    """
+    The local backend ranks like the hybrid OpenSearch pipeline
+    """
+
+    def test_hybrid_ranking(self):
+        """
+        Keyword and vector matches of the same chunk rank it first
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            LocalIndex.save(f"{directory}/testumgebung_de", DOCUMENTS)
+            response = LocalSearch(index_dir=directory).search(
+                "testumgebung", "de", "Wo gibt es Deutschkurse?", [1.0, 0.0, 0.0]
+            )
+            missing = LocalSearch(index_dir=directory).search(
+                "testumgebung", "en", "Where are German classes?", [1.0, 0.0, 0.0]
+            )
+        hits = response["hits"]["hits"]
+        self.assertEqual(hits[0]["_source"]["url"], DOCUMENTS[0]["url"])
+        self.assertAlmostEqual(hits[0]["_score"], 1.0, places=5)
+        self.assertEqual([hit["_score"] for hit in hits], sorted(
+            [hit["_score"] for hit in hits], reverse=True
+        ))
+        self.assertNotIn("chunk_embedding", hits[0]["_source"])
+        self.assertEqual(missing["status"], 404)
+
+    def test_reciprocal_rank_fusion(self):
+        """
+        RRF scores are scaled, a chunk that all sub-queries rank first scores 1
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            LocalIndex.save(f"{directory}/testumgebung_de", DOCUMENTS)
+            backend = LocalSearch(index_dir=directory, fusion="rrf")
+            response = backend.search(
+                "testumgebung", "de", "Wo gibt es Deutschkurse?", [1.0, 0.0, 0.0], size=2, k=2
+            )
+        results = backend.reduce_search_result(response, min_score=0)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]["url"], DOCUMENTS[0]["url"])
+        self.assertAlmostEqual(results[0]["score"], 1.0, places=5)
+        self.assertLess(results[1]["score"], 0.5)
+
+    def test_collapse(self):
+        """
+        Only the best chunk of a page is returned
+        """
+        documents = DOCUMENTS + [{
+            **DOCUMENTS[0],
+            "id": 4,
+            "chunk_text": "Deutschkurse am Abend und am Wochenende.",
+            "chunk_embedding": [0.8, 0.2, 0.0],
+        }]
+        with tempfile.TemporaryDirectory() as directory:
+            LocalIndex.save(f"{directory}/testumgebung_de", documents)
+            response = LocalSearch(index_dir=directory, collapse=True).search(
+                "testumgebung", "de", "Wo gibt es Deutschkurse?", [1.0, 0.0, 0.0]
+            )
+        urls = [hit["_source"]["url"] for hit in response["hits"]["hits"]]
+        self.assertEqual(len(urls), len(set(urls)))
+        self.assertEqual(urls[0], DOCUMENTS[0]["url"])
+
+
+    def test_atomic_rebuild(self):
+        """
+        A rebuilt index replaces the previous version, deleting it removes all versions
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/testumgebung_de"
+            LocalIndex.save(path, DOCUMENTS)
+            self.assertEqual(len(LocalIndex.get(path).documents), 3)
+            LocalIndex.save(path, DOCUMENTS[:1])
+            self.assertTrue(os.path.islink(path))
+            self.assertEqual(len(LocalIndex.get(path).documents), 1)
+            self.assertEqual(len(os.listdir(directory)), 2)
+            LocalIndex.delete(path)
+            self.assertEqual(os.listdir(directory), [])
+            self.assertIsNone(LocalIndex.get(path))
+
+
+class OpenSearchPayloadTest(SimpleTestCase):
+    """
+    Search requests only fetch the fields used for results
+    """
+
+    def test_source_filtering(self):
+        """
+        Embeddings are never returned, highlighted snippets replace whole chunks
+        """
+        payload = OpenSearch().build_search_payload("Deutschkurse", [1.0, 0.0, 0.0])
+        self.assertEqual(payload["_source"]["includes"], ["url", "title", "chunk_text"])
+        self.assertNotIn("highlight", payload)
+        self.assertNotIn("collapse", payload)
+        self.assertEqual(
+            OpenSearch(collapse=True).build_search_payload("Deutschkurse")["collapse"],
+            {"field": "url"},
+        )
+        oss = OpenSearch(highlight=True)
+        payload = oss.build_search_payload("Deutschkurse", [1.0, 0.0, 0.0])
+        self.assertNotIn("chunk_text", payload["_source"]["includes"])
+        results = oss.reduce_search_result({"hits": {"hits": [{
+            "_score": 1.0,
+            "_source": {"url": DOCUMENTS[0]["url"], "title": DOCUMENTS[0]["title"]},
+            "highlight": {"chunk_text": ["Deutschkurse für Erwachsene"]},
+        }]}})
+        self.assertEqual(results[0]["chunk_text"], "Deutschkurse für Erwachsene")
+
+
+def hit(url: str, score: float) -> dict:
+    """
+    Search hit of a chunk
+    """
+    return {"_score": score, "_source": {"url": url, "title": "", "chunk_text": url}}
+
+
+class MultiIndexSearchTest(SimpleTestCase):
+    """
+    Further indices of a request are searched in the same round trip
+    """
+
+    def test_fan_out(self):
+        """
+        One _msearch request covers all indices and documents carry their origin
+        """
+        with FakeOpenSearchServer(hits=3) as opensearch, FakeCmsServer() as cms:
+            with override_settings(
+                OPENSEARCH_URL=opensearch.url,
+                INTEGREAT_CMS_URL=cms.url,
+                SEARCH_BACKEND="opensearch",
+                SEARCH_LOCAL_QUERY_EMBEDDING=False,
+                SEARCH_RESULT_CACHE=False,
+                CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+            ):
+                search_request = SearchRequest({
+                    "message": "Deutschkurs",
+                    "language": "de",
+                    "region": "testumgebung",
+                    "indices": [{"region": "augsburg", "language": "de"}],
+                }, skip_language_detection=True)
+                response = SearchService(search_request, False).search_documents(
+                    include_text=True, min_score=0
+                )
+            self.assertEqual(opensearch.requests, 1)
+        origins = [document.as_dict()["origin"] for document in response.documents]
+        self.assertEqual(len(origins), 6)
+        self.assertIn({"region": "testumgebung", "language": "de"}, origins)
+        self.assertIn({"region": "augsburg", "language": "de"}, origins)
+        with self.assertRaises(ValueError):
+            SearchRequest({
+                "message": "Deutschkurs", "language": "de", "region": "testumgebung",
+                "indices": [{"region": "augsburg"}],
+            })
+
+    def test_msearch_body(self):
+        """
+        Every search is a header line with its index and a payload line
+        """
+        oss = OpenSearch()
+        lines = oss.build_msearch_body([
+            ("testumgebung_de", "Deutschkurs", [1.0, 0.0]),
+            ("augsburg_de", "Deutschkurs", None),
+        ], size=5).splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(
+            json.loads(lines[0]),
+            {"index": "testumgebung_de", "search_pipeline": oss.search_pipeline_name},
+        )
+        self.assertEqual(
+            json.loads(lines[2]),
+            {"index": "augsburg_de", "search_pipeline": oss.search_pipeline_name},
+        )
+        self.assertEqual(
+            json.loads(lines[1]), oss.build_search_payload("Deutschkurs", [1.0, 0.0], None, 5)
+        )
+
+    def test_fuse_responses(self):
+        """
+        Hits of the same chunk keep their best score, missing further indices are skipped
+        """
+        oss = OpenSearch()
+        missing = {"error": {"type": "index_not_found_exception"}, "status": 404}
+        fused = oss.fuse_responses([
+            {"hits": {"hits": [hit("a", 0.9), hit("b", 0.5)]}},
+            {"hits": {"hits": [hit("b", 0.7), hit("c", 0.6)]}},
+            missing,
+        ], ["testumgebung_de", "testumgebung_de", "augsburg_de"], ["augsburg_de"])
+        self.assertEqual(
+            [(hit["_source"]["url"], hit["_score"]) for hit in fused["hits"]["hits"]],
+            [("a", 0.9), ("b", 0.7), ("c", 0.6)],
+        )
+        with self.assertRaises(OpenSearchError):
+            oss.fuse_responses(
+                [missing, {"hits": {"hits": []}}], ["testumgebung_de", "augsburg_de"],
+                ["augsburg_de"],
+            )
+        with self.assertRaises(OpenSearchError):
+            oss.fuse_responses(
+                [{"hits": {"hits": []}}, {"error": {"type": "search_phase_execution_exception"}}],
+                ["testumgebung_de", "augsburg_de"], ["augsburg_de"],
+            )
+        with self.assertRaises(OpenSearchError):
+            oss.fuse_responses([missing, missing], ["augsburg_de", "muenchen_de"],
+                               ["augsburg_de", "muenchen_de"])
+        with self.assertRaises(OpenSearchError):
+            oss.get_responses({"error": {"type": "security_exception"}, "status": 401})
+
+    def test_missing_index(self):
+        """
+        A missing further index is skipped, a missing request index fails the search
+        """
+        with FakeOpenSearchServer(hits=3, indices=["testumgebung_de"]) as opensearch:
+            with override_settings(OPENSEARCH_URL=opensearch.url):
+                oss = OpenSearch()
+                queries = [
+                    ("testumgebung_de", "Deutschkurs", None),
+                    ("augsburg_de", "Deutschkurs", None),
+                ]
+                fused = oss.fuse_responses(
+                    oss.search_many(queries), ["testumgebung_de", "augsburg_de"],
+                    ["augsburg_de"],
+                )
+                self.assertEqual(len(fused["hits"]["hits"]), 3)
+                with self.assertRaises(OpenSearchError):
+                    oss.fuse_responses(
+                        oss.search_many(queries[::-1]), ["augsburg_de", "testumgebung_de"],
+                        ["testumgebung_de"],
+                    )
+
+    def test_default_search_pipeline(self):
+        """
+        The default search pipeline is only set on region/language indices
+        """
+        indices = [
+            "testumgebung_de", "augsburg_en", ".plugins-ml-config", "security-auditlog-2025.01.01"
+        ]
+        with FakeOpenSearchServer(indices=indices) as opensearch:
+            with override_settings(OPENSEARCH_URL=opensearch.url):
+                OpenSearchSetup().set_default_search_pipeline()
+        self.assertEqual(set(opensearch.index_settings), {"testumgebung_de", "augsburg_en"})
+
+    @override_settings(SEARCH_FUSION="normalization")
+    def test_pipeline_fusion_matches_settings(self):
+        """
+        The stored pipeline never uses another fusion than SEARCH_FUSION, as scores are scaled by it
+        """
+        with FakeOpenSearchServer() as opensearch:
+            with override_settings(OPENSEARCH_URL=opensearch.url):
+                with self.assertRaises(CommandError):
+                    call_command("update_search_pipeline", fusion="rrf")
+        self.assertEqual(opensearch.requests, 0)
+
+        results = [
+            {"fusion": "rrf", "weights": [0.5, 0.5]},
+            {"fusion": "normalization", "weights": [0.3, 0.7]},
+        ]
+        command = evaluate_search.Command()
+        with mock.patch.object(evaluate_search, "call_command") as update:
+            command.write_best(results)
+        update.assert_called_once_with(
+            "update_search_pipeline", weights=[0.3, 0.7], fusion="normalization"
+        )
+        with self.assertRaises(CommandError):
+            command.write_best(results[:1])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    INFERENCE_WORKER_URL=None,
+)
+class EmbeddingServiceTest(SimpleTestCase):
+    """
+    Query embeddings are cached by normalized text
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_normalized_cache(self):
+        """
+        Duplicates and case or whitespace variants are embedded once, repeated queries are cached
+        """
+        with mock.patch.object(
+            EmbeddingService, "encode",
+            side_effect=lambda texts: [[float(len(text))] for text in texts],
+        ) as encode:
+            embeddings = EmbeddingService().embed_queries(
+                ["Deutschkurs", " deutschkurs ", "DEUTSCHKURS", "Kita  für Kinder"]
+            )
+            self.assertEqual(
+                encode.call_args_list, [mock.call(["deutschkurs", "kita für kinder"])]
+            )
+            self.assertEqual(embeddings, [[11.0], [11.0], [11.0], [15.0]])
+            self.assertEqual(EmbeddingService().embed_query("Kita für  Kinder"), [15.0])
+            self.assertEqual(encode.call_count, 1)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    SEARCH_BACKEND="opensearch",
+    SEARCH_INDEX_BULK_SIZE=4,
+)
+class IndexPagesTest(SimpleTestCase):
+    """
+    Indexing with precomputed embeddings
+    """
+
+    def index_pages(self, *args: str, failing_bulk_items: int = 0) -> FakeOpenSearchServer:
+        """
+        Index the pages of the fake CMS with a fake embedding model
+        """
+        with (
+            FakeOpenSearchServer(failing_bulk_items=failing_bulk_items) as opensearch,
+            FakeCmsServer(pages=3) as cms,
+            override_settings(OPENSEARCH_URL=opensearch.url, INTEGREAT_CMS_URL=cms.url),
+            mock.patch.object(
+                EmbeddingService, "encode",
+                side_effect=lambda texts: [[float(len(text))] for text in texts],
+            ),
+            mock.patch("builtins.print"),
+        ):
+            call_command("index_pages", "testumgebung", "de", *args)
+        return opensearch
+
+    def test_bulk_index(self):
+        """
+        Chunks are sent in bulk requests without ingest pipeline and keep their IDs
+        """
+        opensearch = self.index_pages("--local-embeddings")
+        self.assertEqual([len(lines) // 2 for _, lines in opensearch.bulk_requests], [4, 2])
+        for path, lines in opensearch.bulk_requests:
+            self.assertEqual(path, "/_bulk?pipeline=_none")
+            for header, document in zip(lines[::2], lines[1::2]):
+                self.assertEqual(
+                    header["index"], {"_index": "testumgebung_de", "_id": document["id"]}
+                )
+                self.assertEqual(document["title_embedding"], [float(len(document["title"]))])
+                self.assertEqual(
+                    document["chunk_embedding"], [float(len(document["chunk_text"]))]
+                )
+
+    def test_failed_items_reported(self):
+        """
+        Documents rejected by OpenSearch are logged
+        """
+        with self.assertLogs("django", "ERROR") as logs:
+            self.index_pages("--local-embeddings", failing_bulk_items=1)
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn("Failed to index 1 of 4 documents", logs.output[0])
+        self.assertIn("mapper_parsing_exception", logs.output[0])
+
+    @override_settings(SEARCH_LOCAL_INDEX_EMBEDDING=True)
+    def test_ingest_pipeline_option(self):
+        """
+        --no-local-embeddings uses the ingest pipeline even if local embeddings are the default
+        """
+        self.assertEqual(len(self.index_pages().bulk_requests), 2)
+        self.assertEqual(self.index_pages("--no-local-embeddings").bulk_requests, [])
+
+
+OPENSEARCH_MODULE = "integreat_chat.search.services.opensearch"
+
+
+def write_queries(directory: str, queries: list[dict]) -> str:
+    """
+    Write a labeled question set as JSONL
+    """
+    path = os.path.join(directory, "queries.jsonl")
+    with open(path, "w", encoding="utf-8") as queries_file:
+        queries_file.writelines(json.dumps(query) + "\n" for query in queries)
+    return path
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    SEARCH_FUSION="normalization",
+)
+class SearchEvaluationTest(SimpleTestCase):
+    """
+    Metrics of evaluate_search and benchmark_index_profiles on tiny labeled sets
+    """
+
+    def test_ndcg(self):
+        """
+        Relevant results are discounted by their rank
+        """
+        self.assertEqual(evaluate_search.ndcg(["a", "b"], {"a", "b"}, 2), 1.0)
+        self.assertAlmostEqual(evaluate_search.ndcg(["x", "a"], {"a"}, 2), 0.6309, places=4)
+        self.assertEqual(evaluate_search.ndcg(["x", "y", "a"], {"a"}, 2), 0.0)
+
+    def test_evaluate_search(self):
+        """
+        Recall, MRR and nDCG of the top results, the fake server ranks page-0, page-1, ...
+        """
+        def page(number: int) -> str:
+            return f"https://{settings.INTEGREAT_APP_DOMAIN}/testumgebung/de/page-{number}/"
+
+        output = io.StringIO()
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            FakeOpenSearchServer() as opensearch,
+            override_settings(OPENSEARCH_URL=opensearch.url),
+        ):
+            call_command(
+                "evaluate_search", "testumgebung", "de",
+                write_queries(directory, [
+                    {"message": "Deutschkurs", "relevant": [page(0), page(2)]},
+                    {"message": "Kita", "relevant": [page(4)]},
+                    {"message": "Wohnung", "relevant": [page(1)]},
+                ]),
+                "--top", "3", "--min-scores", "0", "--dedup", "true", "--no-local-embedding",
+                stdout=output,
+            )
+        # recall (1 + 0 + 1) / 3, MRR (1 + 0 + 1/2) / 3,
+        # nDCG ((1 + 1/log2(4)) / (1 + 1/log2(3)) + 0 + 1/log2(3)) / 3
+        self.assertIn(
+            "recall@3 0.667, MRR 0.500, nDCG@3 0.517, 3.0 results", output.getvalue()
+        )
+
+    def test_benchmark_index_profiles(self):
+        """
+        knn recall against the exact neighbors and hybrid recall against the labels per profile
+        """
+        documents = [
+            {"id": "a", "url": "/a/", "chunk_text": "a", "chunk_embedding": [1.0, 0.0]},
+            {"id": "b", "url": "/b/", "chunk_text": "b", "chunk_embedding": [0.8, 0.2]},
+            {"id": "c", "url": "/c/", "chunk_text": "c", "chunk_embedding": [0.0, 1.0]},
+        ]
+
+        def request(oss, path, payload, method="GET"):  # pylint: disable=unused-argument
+            if path.endswith("/_stats/store"):
+                return {"_all": {"primaries": {"store": {"size_in_bytes": 1024 * 1024}}}}
+            if path.endswith("/_search"):
+                # the exact neighbors are a and b, the index finds a and c
+                found = ["a", "c"] if "knn" in payload["query"] else ["a", "b"]
+                return {"hits": {"hits": [
+                    {"_id": name, "_source": {"url": f"/{name}/"}} for name in found
+                ]}}
+            return {"acknowledged": True}
+
+        output = io.StringIO()
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            mock.patch(f"{OPENSEARCH_MODULE}.OpenSearch.request", request),
+            mock.patch(f"{OPENSEARCH_MODULE}.OpenSearchSetup.bulk_index"),
+            mock.patch(
+                f"{OPENSEARCH_MODULE}.OpenSearchSetup.get_chunk_documents", return_value=documents
+            ),
+            mock.patch(f"{OPENSEARCH_MODULE}.OpenSearchSetup.add_embeddings"),
+            mock.patch.object(EmbeddingService, "embed_queries", return_value=[[1.0, 0.0]]),
+        ):
+            call_command(
+                "benchmark_index_profiles", "testumgebung", "de",
+                write_queries(directory, [{"message": "Deutschkurs", "relevant": ["/a/"]}]),
+                "--profiles", "default", "lucene_sq", "--k", "2", "--repeat", "1",
+                stdout=output,
+            )
+        for profile in ["default", "lucene_sq"]:
+            self.assertIn(
+                f"{profile}: 3 documents, 1.0 MB\n"
+                "  knn recall@2: 0.500\n"
+                "  hybrid recall@2: 1.000\n",
+                output.getvalue(),
+            )
+        self.assertEqual(
+            benchmark_index_profiles.exact_neighbors(
+                "l2", numpy.array([document["chunk_embedding"] for document in documents]),
+                numpy.array([0.0, 1.0]), 2,
+            ),
+            [2, 1],
+        )
+
+
+class SearchViewTest(SimpleTestCase):
+    """
+    Error responses of the search views
+    """
+
+    @override_settings(
+        ALLOWED_HOSTS=["testserver"],
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    )
+    def test_inference_unavailable(self):
+        """
+        An unavailable inference worker results in 503
+        """
+        with mock.patch(
+            "integreat_chat.search.services.search.SearchService.asearch_documents",
+            side_effect=InferenceUnavailableError("Inference worker overloaded"),
+        ):
+            response = asyncio.run(AsyncClient().post(
+                "/search/documents/",
+                {"message": "Deutschkurs", "language": "de", "region": "testumgebung"},
+                content_type="application/json",
+            ))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["status"], "error")
+
+    @override_settings(ALLOWED_HOSTS=["testserver"])
+    def test_invalid_index(self):
+        """
+        Wildcards, index lists and system indices are rejected with 400
+        """
+        for region, language in [("*", "de"), ("_all", "de"), ("augsburg", "de,muenchen_de"),
+                                 (".plugins-ml-config", "de"), ("augsburg_de", "de")]:
+            with self.assertRaises(ValueError):
+                SearchRequest({
+                    "message": "Deutschkurs", "language": "de", "region": "testumgebung",
+                    "indices": [{"region": region, "language": language}],
+                })
+        response = asyncio.run(AsyncClient().post(
+            "/search/documents/",
+            {
+                "message": "Deutschkurs", "language": "de", "region": "testumgebung",
+                "indices": [{"region": "*", "language": "*"}],
+            },
+            content_type="application/json",
+        ))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["status"], "error")
+
+    @override_settings(ALLOWED_HOSTS=["testserver"], SEARCH_BACKEND="local")
+    def test_search_api_not_supported(self):
+        """
+        The local backend rejects OpenSearch queries with an explicit error
+        """
+        response = asyncio.run(AsyncClient().generic(
+            "GET", "/search/opensearch/testumgebung/de/", '{"query": {"match_all": {}}}',
+            content_type="application/json",
+        ))
+        self.assertEqual(response.status_code, 501)
+        self.assertEqual(response.json()["error"]["type"], "unsupported_operation_exception")
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    SEARCH_RESULT_CACHE=True,
+    SINGLE_FLIGHT=False,
+)
+class SearchCacheTest(SimpleTestCase):
+    """
+    Cached search results are only valid for the index generation they were searched in
+    """
+
+    def test_rebuild_during_search(self):
+        """
+        A result is not used if the index is rebuilt while it is searched
+        """
+        searches = []
+
+        async def run_search(service, *args):  # pylint: disable=unused-argument
+            searches.append(service.search_request.original_message)
+            if len(searches) == 1:
+                bump_index_generation("testumgebung", "de")
+            return SearchResponse(service.search_request, [])
+
+        def search_documents():
+            search_request = SearchRequest({
+                "message": "Deutschkurs", "language": "de", "region": "testumgebung",
+            }, skip_language_detection=True)
+            asyncio.run(SearchService(search_request, False).asearch_documents())
+
+        with mock.patch.object(SearchService, "run_search", run_search):
+            search_documents()
+            search_documents()
+            self.assertEqual(len(searches), 2)
+            search_documents()
+            self.assertEqual(len(searches), 2)
@@ -4,7 +4,7 @@ from . import views
 urlpatterns = [
     path("documents/", views.search_documents, name="search_documents"),
     path(
-        "opensearch/<slug:region>/<slug:language>/",
+        "opensearch/<slug:region_slug>/<slug:language_slug>/",
         views.search_opensearch,
         name="search_opensearh"
     )
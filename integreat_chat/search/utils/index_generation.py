@@ -0,0 +1,58 @@
+"""
+Generation counter for region/language indices. The counter is increased
+every time an index is rebuilt, which invalidates all caches that include
+the generation in their keys.
+"""
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+
+def get_index_generation_key(region_slug: str, language_slug: str) -> str:
+    """
+    Cache key of the generation counter for an index
+
+    param region_slug: slug of an Integreat region
+    param language_slug: slug of a language of a region
+    """
+    return f"index_generation_{region_slug}_{language_slug}"
+
+
+def get_index_generation(region_slug: str, language_slug: str) -> int:
+    """
+    Get current generation of the index
+
+    param region_slug: slug of an Integreat region
+    param language_slug: slug of a language of a region
+    return: generation counter, 0 if the index has never been rebuilt
+    """
+    return cache.get(get_index_generation_key(region_slug, language_slug), 0)
+
+
+async def aget_index_generation(region_slug: str, language_slug: str) -> int:
+    """
+    Get current generation of the index without blocking the event loop
+
+    param region_slug: slug of an Integreat region
+    param language_slug: slug of a language of a region
+    return: generation counter, 0 if the index has never been rebuilt
+    """
+    return await sync_to_async(get_index_generation, thread_sensitive=False)(
+        region_slug, language_slug
+    )
+
+
+def bump_index_generation(region_slug: str, language_slug: str) -> int:
+    """
+    Increase the generation of the index after it has been rebuilt
+
+    param region_slug: slug of an Integreat region
+    param language_slug: slug of a language of a region
+    return: new generation counter
+    """
+    cache_key = get_index_generation_key(region_slug, language_slug)
+    try:
+        return cache.incr(cache_key)
+    except ValueError:
+        cache.set(cache_key, 1, timeout=None)
+        return 1
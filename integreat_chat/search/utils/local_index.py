@@ -0,0 +1,255 @@
+"""
+In-process hybrid search index for a region/language
+"""
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import Counter, defaultdict
+
+import numpy
+
+# Score of the lowest hit after min-max normalization, like in OpenSearch
+MIN_NORMALIZED_SCORE = 0.001
+
+
+class BM25Index:
+    """
+    BM25 index of a text field with Lucene's scoring (k1 = 1.2, b = 0.75).
+    Texts are tokenized like the standard analyzer: lowercase word characters.
+    """
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, texts: list[str]) -> None:
+        """
+        param texts: field value of every document
+        """
+        self.size = len(texts)
+        tokenized = [self.tokenize(text) for text in texts]
+        lengths = numpy.array([len(tokens) for tokens in tokenized], dtype=numpy.float32)
+        average_length = float(lengths.mean()) if self.size and lengths.mean() > 0 else 1.0
+        norms = self.k1 * (1 - self.b + self.b * lengths / average_length)
+        postings = defaultdict(lambda: ([], []))
+        for document, tokens in enumerate(tokenized):
+            for term, frequency in Counter(tokens).items():
+                postings[term][0].append(document)
+                postings[term][1].append(frequency / (frequency + norms[document]))
+        self.postings = {
+            term: (
+                numpy.array(documents, dtype=numpy.int32),
+                math.log(1 + (self.size - len(documents) + 0.5) / (len(documents) + 0.5))
+                * numpy.array(weights, dtype=numpy.float32),
+            )
+            for term, (documents, weights) in postings.items()
+        }
+
+    @staticmethod
+    def tokenize(text: str) -> list[str]:
+        """
+        Split text into lowercase terms
+        """
+        return re.findall(r"\w+", text.lower())
+
+    def score(self, query: str) -> numpy.ndarray:
+        """
+        BM25 score of every document for a match query, i.e. any of the terms
+        """
+        scores = numpy.zeros(self.size, dtype=numpy.float32)
+        for term in self.tokenize(query):
+            if term in self.postings:
+                documents, weights = self.postings[term]
+                scores[documents] += weights
+        return scores
+
+
+class LocalIndex:
+    """
+    Chunk documents with title and chunk embeddings. The embeddings are stored
+    as NumPy arrays and memory-mapped, so worker processes share them through
+    the page cache. Loaded indices are kept per process and reloaded when the
+    index on disk has been rebuilt.
+    """
+    loaded: dict[str, tuple[float, "LocalIndex"]] = {}
+    loaded_lock = threading.Lock()
+
+    def __init__(self, path: str) -> None:
+        """
+        param path: directory of the index
+        """
+        with open(os.path.join(path, "documents.json"), encoding="utf-8") as documents:
+            self.documents = json.load(documents)
+        self.title_embeddings = numpy.load(
+            os.path.join(path, "title_embeddings.npy"), mmap_mode="r"
+        )
+        self.chunk_embeddings = numpy.load(
+            os.path.join(path, "chunk_embeddings.npy"), mmap_mode="r"
+        )
+        self.title_norms = numpy.einsum("ij,ij->i", self.title_embeddings, self.title_embeddings)
+        self.chunk_norms = numpy.einsum("ij,ij->i", self.chunk_embeddings, self.chunk_embeddings)
+        self.title_bm25 = BM25Index([document["title"] for document in self.documents])
+        self.chunk_bm25 = BM25Index([document["chunk_text"] for document in self.documents])
+
+    @classmethod
+    def get(cls, path: str) -> "LocalIndex | None":
+        """
+        Get the index in a directory, load it if it is not loaded or outdated
+
+        param path: directory of the index
+        return: the index or None if it does not exist
+        """
+        version_path = os.path.realpath(path)
+        try:
+            modified = os.stat(os.path.join(version_path, "documents.json")).st_mtime
+        except FileNotFoundError:
+            return None
+        with cls.loaded_lock:
+            if path not in cls.loaded or cls.loaded[path][0] != (version_path, modified):
+                cls.loaded[path] = ((version_path, modified), cls(version_path))
+            return cls.loaded[path][1]
+
+    @staticmethod
+    def save(path: str, documents: list[dict]) -> None:
+        """
+        Write an index. The index is written to a new version directory and the
+        path is a symlink that is replaced atomically, so searches never see a
+        partially written or missing index.
+
+        param path: symlink of the index
+        param documents: chunk documents with title_embedding and chunk_embedding
+        """
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        version_path = tempfile.mkdtemp(dir=parent, prefix=f".{os.path.basename(path)}-")
+        for field in ("title_embedding", "chunk_embedding"):
+            numpy.save(
+                os.path.join(version_path, f"{field}s.npy"),
+                numpy.array([document[field] for document in documents], dtype=numpy.float32)
+                .reshape(len(documents), -1),
+            )
+        with open(os.path.join(version_path, "documents.json"), "w", encoding="utf-8") as output:
+            json.dump([
+                {key: value for key, value in document.items() if not key.endswith("_embedding")}
+                for document in documents
+            ], output, ensure_ascii=False)
+        old_path = os.path.realpath(path) if os.path.islink(path) else None
+        if os.path.isdir(path) and old_path is None:
+            # index directory of an older version, replaced by a symlink once
+            old_path = f"{version_path}-old"
+            os.rename(path, old_path)
+        link_path = f"{version_path}.link"
+        os.symlink(os.path.basename(version_path), link_path)
+        os.replace(link_path, path)
+        if old_path is not None:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    @staticmethod
+    def delete(path: str) -> None:
+        """
+        Delete an index with its version directory
+
+        param path: symlink of the index
+        """
+        if os.path.islink(path):
+            version_path = os.path.realpath(path)
+            os.unlink(path)
+            shutil.rmtree(version_path, ignore_errors=True)
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def normalize(scores: numpy.ndarray, candidates: numpy.ndarray) -> numpy.ndarray:
+        """
+        Min-max normalize the scores of the candidates of a sub-query, all other
+        documents score 0
+        """
+        normalized = numpy.zeros(len(scores), dtype=numpy.float32)
+        if not len(candidates):
+            return normalized
+        selected = scores[candidates]
+        low, high = selected.min(), selected.max()
+        if high == low:
+            normalized[candidates] = 1.0
+        else:
+            normalized[candidates] = numpy.maximum(
+                (selected - low) / (high - low), MIN_NORMALIZED_SCORE
+            )
+        return normalized
+
+    @staticmethod
+    def top(scores: numpy.ndarray, limit: int) -> numpy.ndarray:
+        """
+        Indices of the highest positive scores
+        """
+        positive = numpy.flatnonzero(scores > 0)
+        if len(positive) > limit:
+            positive = positive[numpy.argpartition(-scores[positive], limit)[:limit]]
+        return positive
+
+    def vector_scores(
+            self, embeddings: numpy.ndarray, norms: numpy.ndarray, query: numpy.ndarray
+        ) -> numpy.ndarray:
+        """
+        Lucene l2 scores 1 / (1 + squared distance) of all documents
+        """
+        distances = norms + float(query @ query) - 2 * (embeddings @ query)
+        return 1 / (1 + numpy.maximum(distances, 0))
+
+    def search(
+            self,
+            message: str,
+            embedding: list[float],
+            weights: list[float],
+            size: int = 10,
+            k: int = 5,
+            rank_constant: int | None = None,
+            collapse: bool = False,
+        ) -> list[tuple[int, float]]:
+        """
+        Hybrid search like the OpenSearch search pipeline: the top hits of the
+        title match, content match, title knn and content knn sub-queries are
+        min-max normalized and combined with a weighted arithmetic mean, or
+        combined with reciprocal rank fusion if a rank constant is given.
+
+        param message: search string / message
+        param embedding: embedding of the message
+        param weights: weights of the four sub-queries, not used by reciprocal rank fusion
+        param size: number of returned hits
+        param k: number of nearest neighbors per vector sub-query
+        param rank_constant: rank constant of reciprocal rank fusion
+        param collapse: return only the best chunk per URL
+        return: position of the document and score per hit, best hits first
+        """
+        if not self.documents:
+            return []
+        query = numpy.asarray(embedding, dtype=numpy.float32)
+        sub_queries = [
+            (self.title_bm25.score(message), size),
+            (self.chunk_bm25.score(message), size),
+            (self.vector_scores(self.title_embeddings, self.title_norms, query), k),
+            (self.vector_scores(self.chunk_embeddings, self.chunk_norms, query), k),
+        ]
+        combined = numpy.zeros(len(self.documents), dtype=numpy.float32)
+        matched = numpy.zeros(len(self.documents), dtype=bool)
+        for (scores, limit), weight in zip(sub_queries, weights):
+            candidates = self.top(scores, limit)
+            if rank_constant is None:
+                combined += weight * self.normalize(scores, candidates)
+            else:
+                ranked = candidates[numpy.argsort(-scores[candidates], kind="stable")]
+                combined[ranked] += 1 / (rank_constant + numpy.arange(1, len(ranked) + 1))
+            matched[candidates] = True
+        if rank_constant is None:
+            combined /= sum(weights)
+        hits = numpy.flatnonzero(matched)
+        hits = hits[numpy.argsort(-combined[hits], kind="stable")]
+        if collapse:
+            best = {}
+            for position in hits:
+                best.setdefault(self.documents[position]["url"], position)
+            hits = numpy.array(list(best.values()), dtype=hits.dtype)
+        hits = hits[:size]
+        return [(int(position), float(combined[position])) for position in hits]
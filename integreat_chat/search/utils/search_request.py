@@ -2,16 +2,42 @@
 Class for Search request messages
 """
 
+import re
+
 from django.conf import settings
 
 from integreat_chat.core.utils.integreat_request import IntegreatRequest
 
+from ..services.opensearch import INDEX_NAME_PATTERN
+
 
 class SearchRequest(IntegreatRequest):
     """
-    Representation for search request
+    Representation for search request. Besides the index of the region, further
+    region/language indices can be searched, e.g. of neighboring regions:
+    {"indices": [{"region": "...", "language": "..."}]}
     """
     def __init__(self, data: dict, skip_language_detection: bool = False):
         self.supported_languages = settings.SEARCH_EMBEDDING_MODEL_SUPPORTED_LANGUAGES
         self.fallback_language = settings.SEARCH_FALLBACK_LANGUAGE
         super().__init__(data, skip_language_detection)
+
+    def parse_arguments(self, data: dict) -> None:
+        """
+        Parse arguments from HTTP request body
+        """
+        super().parse_arguments(data)
+        indices = data.get("indices") or []
+        if len(indices) > settings.SEARCH_MAX_INDICES:
+            raise ValueError(f"At most {settings.SEARCH_MAX_INDICES} indices can be searched")
+        if not all(isinstance(index, dict) and "region" in index and "language" in index
+                   for index in indices):
+            raise ValueError("Missing language or region attribute of index")
+        self.indices = [(index["region"], index["language"]) for index in indices]
+        # only region/language indices, no wildcards, lists or system indices
+        for region, language in self.indices:
+            if not (
+                isinstance(region, str) and isinstance(language, str)
+                and re.fullmatch(INDEX_NAME_PATTERN, f"{region}_{language}")
+            ):
+                raise ValueError(f"Invalid index {region}_{language}")
@@ -4,8 +4,9 @@ responses to search request and document class
 import logging
 import urllib
 
+import aiohttp
 from django.conf import settings
-from integreat_chat.core.utils.integreat_cms import get_page
+from integreat_chat.core.utils.integreat_cms import aget_page, get_page
 
 from .search_request import SearchRequest
 
@@ -20,32 +21,53 @@ class Document:
             source_path: str,
             chunk: str,
             score: float,
-            include_details: bool,
-            gui_language: str
+            gui_language: str,
+            origin: dict | None = None,
         ):
+        """
+        Documents have to be enriched with enrich() before they are used
+
+        param source_path: URL of the page the chunk belongs to
+        param chunk: text of the matched chunk
+        param score: search score
+        param gui_language: language slug of the GUI
+        param origin: region and language of the index the chunk was found in
+        """
         self.chunk_source_path = source_path
         self.gui_language = gui_language
+        self.origin = origin
         self.score = score
         self.chunk = chunk
-        self.enrich(include_details)
+        self.gui_source_path = source_path
+        self.title = None
+        self.content = None
 
-    def enrich(self, include_details: bool):
+    @property
+    def source_language(self) -> str:
+        """
+        Language slug of the chunk source path
+        """
+        return (
+            self.chunk_source_path
+            .replace(f"https://{settings.INTEGREAT_APP_DOMAIN}", "")
+            .replace(settings.INTEGREAT_CMS_URL, "")
+            .split("/")[2]
+        )
+
+    async def enrich(self, session: aiohttp.ClientSession, include_details: bool):
         """
         Enrich document with GUI langauge URLs and titles
         """
         try:
-            if (
-                self.gui_language != self.chunk_source_path
-                .replace(f"https://{settings.INTEGREAT_APP_DOMAIN}", "")
-                .replace(f"https://{settings.INTEGREAT_CMS_DOMAIN}", "")
-                .split("/")[2]
-            ):
+            if self.gui_language != self.source_language:
                 LOGGER.debug("Fetching details from Integreat CMS for %s", self.chunk_source_path)
-                self.gui_source_path = self.get_source_for_language(self.gui_language)[0]
+                self.gui_source_path = (
+                    await self.aget_source_for_language(session, self.gui_language)
+                )[0]
             else:
                 self.gui_source_path = self.chunk_source_path
             LOGGER.debug("Fetching details from Integreat CMS for %s", self.gui_source_path)
-            page = get_page(self.gui_source_path)
+            page = await aget_page(session, self.gui_source_path)
         except urllib.error.HTTPError:
             LOGGER.warning("Could not find document for source path %s", self.chunk_source_path)
             self.title = None
@@ -60,16 +82,42 @@ class Document:
         param language: language slug
         return: URL and title in specified language
         """
-        translations = get_page(self.chunk_source_path)["available_languages"]
+        path = self.get_translation_path(get_page(self.chunk_source_path), language)
+        return (
+            f'https://{settings.INTEGREAT_APP_DOMAIN}{path}',
+            get_page(path)["title"]
+        )
+
+    async def aget_source_for_language(
+            self, session: aiohttp.ClientSession, language: str
+        ) -> tuple[str, str]:
+        """
+        Get source URL and title in specified language without blocking the event loop
+        param session: HTTP client session
+        param language: language slug
+        return: URL and title in specified language
+        """
+        path = self.get_translation_path(
+            await aget_page(session, self.chunk_source_path), language
+        )
+        return (
+            f'https://{settings.INTEGREAT_APP_DOMAIN}{path}',
+            (await aget_page(session, path))["title"]
+        )
+
+    def get_translation_path(self, page: dict, language: str) -> str:
+        """
+        Get path of the translation of a page
+        param page: page object of the chunk source
+        param language: language slug
+        """
+        translations = page["available_languages"]
         if language not in translations:
             raise ValueError(
                 f"Page {self.chunk_source_path} does not have a "
                 f"translation for given language {language}"
             )
-        return (
-            f'https://{settings.INTEGREAT_APP_DOMAIN}{translations[language]["path"]}',
-            get_page(translations[language]["path"])["title"]
-        )
+        return translations[language]["path"]
 
     def as_dict(self):
         """
@@ -85,8 +133,30 @@ class Document:
             result["title"] = self.title
         if self.content is not None:
             result["content"] = self.content
+        if self.origin is not None:
+            result["origin"] = self.origin
         return result
 
+    @classmethod
+    def from_dict(cls, data: dict, gui_language: str) -> "Document":
+        """
+        Restore a document from its dict representation without fetching
+        details from the Integreat CMS again
+
+        param data: dict created by as_dict()
+        param gui_language: language slug of the GUI
+        """
+        document = cls.__new__(cls)
+        document.chunk_source_path = data["chunk_path"]
+        document.gui_source_path = data["source"]
+        document.gui_language = gui_language
+        document.score = data["score"]
+        document.chunk = data["found_chunk"]
+        document.title = data.get("title")
+        document.content = data.get("content")
+        document.origin = data.get("origin")
+        return document
+
 class SearchResponse:
     """
     Response for a search
@@ -96,6 +166,25 @@ class SearchResponse:
         self.documents = [document for document in documents
                           if document.title is not None and document.content is not None]
 
+    def as_payload(self) -> list[dict]:
+        """
+        Serializable representation, independent of the request
+        """
+        return [document.as_dict() for document in self.documents]
+
+    @classmethod
+    def from_payload(cls, payload: list[dict], search_request: SearchRequest) -> "SearchResponse":
+        """
+        Restore response created by as_payload() for a request
+
+        param payload: list created by as_payload()
+        param search_request: the request that should be answered
+        """
+        return cls(
+            search_request,
+            [Document.from_dict(document, search_request.gui_language) for document in payload]
+        )
+
     def as_dict(self) -> dict:
         """
         dict representation of a search result
@@ -7,29 +7,55 @@ from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
+from integreat_chat.core.utils.inference_client import InferenceUnavailableError
+from integreat_chat.core.utils.metrics import collect_timings
+from integreat_chat.core.utils.traffic_capture import TrafficCapture
+
 from .services.search import SearchService
-from .services.opensearch import OpenSearch
+from .services.local_search import get_search_backend
 from .utils.search_request import SearchRequest
 
 @csrf_exempt
-def search_documents(request):
+async def search_documents(request):
     """
     Search for documents related to the question. If the message is in the wrong language,
     first translate it to the GUI language. As we are only searching for similar documents,
     this should be fine, even if the translation is not very good.
     """
+    status = 200
     result = {}
     if (
         request.method in ("POST")
         and request.META.get("CONTENT_TYPE").lower() == "application/json"
     ):
-        search_request = SearchRequest(json.loads(request.body))
-        search_service = SearchService(search_request, True)
-        result = search_service.search_documents(include_text=True).as_dict()
-    return JsonResponse(result)
+        data = json.loads(request.body)
+        with collect_timings() as timings:
+            async with TrafficCapture("search_documents", data, timings) as capture:
+                try:
+                    search_request = SearchRequest(data)
+                    search_service = SearchService(
+                        search_request, True, highlight=settings.SEARCH_HIGHLIGHT
+                    )
+                    result = (await search_service.asearch_documents(include_text=True)).as_dict()
+                except ValueError as exc:
+                    result = {
+                        "status": "error",
+                        "reason": str(exc)
+                    }
+                    status = 400
+                except InferenceUnavailableError as exc:
+                    result = {
+                        "status": "error",
+                        "reason": str(exc)
+                    }
+                    status = 503
+                capture.status = status
+        if settings.DEBUG and status == 200:
+            result["timings"] = timings
+    return JsonResponse(result, status=status)
 
 @csrf_exempt
-def search_opensearch(request, region_slug, language_slug):
+async def search_opensearch(request, region_slug, language_slug):
     """
     Search for documents related to the question. If the message is in the wrong language,
     first translate it to the GUI language. As we are only searching for similar documents,
@@ -40,6 +66,8 @@ def search_opensearch(request, region_slug, language_slug):
         request.method in ("GET")
         and request.META.get("CONTENT_TYPE").lower() == "application/json"
     ):
-        opensearch = OpenSearch(password=settings.OPENSEARCH_PASSWORD)
-        result = opensearch.search_api(f"{region_slug}_{language_slug}", json.loads(request.body))
-    return JsonResponse(result)
+        result = await get_search_backend().asearch_api(
+            f"{region_slug}_{language_slug}", json.loads(request.body)
+        )
+    # OpenSearch error responses contain the HTTP status
+    return JsonResponse(result, status=result.get("status", 200))
@@ -6,16 +6,17 @@ import logging
 import hashlib
 import re
 import asyncio
-import spacy
-
-# pylint: disable=no-name-in-module
-from transformers import pipeline
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.core.cache import cache
 from integreat_chat.chatanswers.services.llmapi import (
     LlmApiClient, LlmMessage, LlmPrompt, LlmResponse
 )
+from integreat_chat.chatanswers.services.model_router import ModelRouter
+from integreat_chat.core.utils.inference_client import InferenceClient
+from integreat_chat.core.utils.metrics import CACHE_REQUESTS, MODEL_INFERENCE_DURATION, span
+from integreat_chat.core.utils.model_registry import ModelRegistry
 
 from ..static.prompts import Prompts
 from ..static.language_code_map import LANGUAGE_MAP
@@ -44,6 +45,20 @@ class LanguageService:
         LOGGER.debug("Finished message language detection: %s", stripped_language)
         return stripped_language
 
+    def language_classification_prompt(self, message: str) -> LlmPrompt:
+        """
+        Prompt for detecting the language of a message
+        """
+        return LlmPrompt(
+            ModelRouter.get_model("LANGUAGE_CLASSIFICATION"),
+            [
+                LlmMessage(Prompts.LANGUAGE_CLASSIFICATION, role="system"),
+                LlmMessage(message, role="user")
+            ],
+            json_schema = Prompts.LANGUAGE_CLASSIFICATION_SCHEMA,
+            prompt_type = "LANGUAGE_CLASSIFICATION",
+        )
+
     def classify_language(self, message: str) -> str:
         """
         Check if a message fits the estimated language.
@@ -52,16 +67,19 @@ class LanguageService:
         param message: the message of which the language should be detected
         return: language slug of the detected language
         """
-        prompt = LlmPrompt(
-            settings.LANGUAGE_CLASSIFICATIONH_MODEL,
-            [
-                LlmMessage(Prompts.LANGUAGE_CLASSIFICATION, role="system"),
-                LlmMessage(message, role="user")
-            ],
-            json_schema = Prompts.LANGUAGE_CLASSIFICATION_SCHEMA
-        )
+        return asyncio.run(self.aclassify_language(message))
+
+    async def aclassify_language(self, message: str) -> str:
+        """
+        Detect the language of a message without blocking the event loop
+
+        param message: the message of which the language should be detected
+        return: language slug of the detected language
+        """
         LOGGER.debug("Detecting message language")
-        response = LlmResponse(asyncio.run(self.llm_api.chat_prompt_session_wrapper(prompt)))
+        response = LlmResponse(await self.llm_api.chat_prompt_session_wrapper(
+            self.language_classification_prompt(message)
+        ))
         return self.parse_language(response.as_dict())
 
     def is_numerical(self, message: str) -> bool:
@@ -83,7 +101,9 @@ class LanguageService:
             f"{source_language}-{target_language}-{message}".encode("utf-8")
         ).hexdigest()
         if translated_message := cache.get(cache_key):
+            CACHE_REQUESTS.labels(cache="translation", result="hit").inc()
             return cache_key, translated_message
+        CACHE_REQUESTS.labels(cache="translation", result="miss").inc()
         return cache_key, None
 
     def translation_required(
@@ -105,19 +125,39 @@ class LanguageService:
         self, source_language: str, target_language: str, message: str
     ) -> str:
         """
-        Translate text in chunks (required for NLLB)
-        """
-        pipe = pipeline("translation", model=settings.TRANSLATION_MODEL)
-        return " ".join(
-            [
-                result["translation_text"]
-                for result in pipe(
-                    self.split_text(message),
-                    tgt_lang=LANGUAGE_MAP[target_language],
-                    src_lang=LANGUAGE_MAP[source_language],
-                )
-            ]
-        )
+        Translate text in chunks (required for NLLB). Use the inference worker if configured.
+        """
+        backend = "worker" if settings.INFERENCE_WORKER_URL else "local"
+        with span(
+            MODEL_INFERENCE_DURATION, f"translation:{backend}", model="translation", backend=backend
+        ):
+            if settings.INFERENCE_WORKER_URL:
+                return InferenceClient().translate(source_language, target_language, message)
+            return self.local_translation_pipeline(source_language, target_language, [message])[0]
+
+    def local_translation_pipeline(
+        self, source_language: str, target_language: str, messages: list[str]
+    ) -> list[str]:
+        """
+        Translate messages with the local model. The chunks of all messages are
+        translated in one batch.
+        """
+        pipe = ModelRegistry.get("translation")
+        chunks = [self.split_text(message) for message in messages]
+        translations = [
+            result["translation_text"]
+            for result in pipe(
+                [chunk for message_chunks in chunks for chunk in message_chunks],
+                tgt_lang=LANGUAGE_MAP[target_language],
+                src_lang=LANGUAGE_MAP[source_language],
+                batch_size=settings.INFERENCE_WORKER_MAX_BATCH,
+            )
+        ]
+        results = []
+        for message_chunks in chunks:
+            results.append(" ".join(translations[:len(message_chunks)]))
+            translations = translations[len(message_chunks):]
+        return results
 
     def translate_message(
         self, source_language: str, target_language: str, message: str
@@ -150,6 +190,16 @@ class LanguageService:
         cache.set(cache_key, translated_message)
         return translated_message
 
+    async def atranslate_message(
+        self, source_language: str, target_language: str, message: str
+    ) -> str:
+        """
+        Translate a message in an executor, as the translation model is CPU-bound
+        """
+        return await sync_to_async(self.translate_message, thread_sensitive=False)(
+            source_language, target_language, message
+        )
+
     def opportunistic_translate(self, expected_language: str, message: str) -> str:
         """
         Translate if detected language does not fit the expected language
@@ -161,17 +211,13 @@ class LanguageService:
             else self.translate_message(classified_language, expected_language, message)
         )
 
-    def split_text(self, text, max_length=200, lang="xx"):
+    def split_text(self, text, max_length=200):
         """
         Chunk text into max_length char chunks while keeping complete sentences.
         Supports multi-lingual splitting using spacy's multi-lingual model,
         see - https://spacy.io/models/xx
         """
-        try:
-            nlp = spacy.load(lang)
-        except:
-            nlp = spacy.load("xx_sent_ud_sm")
-
+        nlp = ModelRegistry.get("sentence_splitter")
         doc = nlp(text)
         sentences = [sent.text for sent in doc.sents]
 
@@ -7,6 +7,11 @@ class Prompts:
     Static prompts
     """
 
+    # Task of each prompt, used for routing prompts to a model tier
+    TASKS = {
+        "LANGUAGE_CLASSIFICATION": "classification",
+    }
+
     SYSTEM_PROMPT = "You are an internal assistant in an application without user interaction."
 
     LANGUAGE_CLASSIFICATION = "Identify the BCP47 language tag of the provided message."
@@ -2,15 +2,19 @@
 import json
 import logging
 
+from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
+from integreat_chat.core.utils.inference_client import InferenceUnavailableError
+from integreat_chat.core.utils.metrics import collect_timings
+from integreat_chat.core.utils.traffic_capture import TrafficCapture
 from integreat_chat.translate.services.language import LanguageService
 
 LOGGER = logging.getLogger("django")
 
 @csrf_exempt
-def detect_language(request):
+async def detect_language(request):
     """
     Detect language of a provided message.
     """
@@ -25,13 +29,13 @@ def detect_language(request):
             result = {"status": "error"}
         else:
             result = {
-                "detected_language": language_service.classify_language(data["message"]),
+                "detected_language": await language_service.aclassify_language(data["message"]),
                 "status": "success",
             }
     return JsonResponse(data=result)
 
 @csrf_exempt
-def translate_message(request):
+async def translate_message(request):
     """
     Translate a message from a source into a target language
     """
@@ -51,21 +55,32 @@ def translate_message(request):
             result = {"status": "error"}
         else:
             force_src_lang = "force_source_language" in data and data["force_source_language"]
-            try:
-                result = {
-                    "translation": language_service.translate_message(
-                        data["source_language"] if force_src_lang
-                            else language_service.classify_language(data["message"]),
-                        data["target_language"],
-                        data["message"]
-                    ),
-                    "target_language": data["target_language"],
-                    "status": "success",
-                }
-            except KeyError as exc:
-                result = {
-                    "status": "error",
-                    "reason": str(exc)
-                }
-                status = 404
+            with collect_timings() as timings:
+                async with TrafficCapture("translate_message", data, timings) as capture:
+                    try:
+                        result = {
+                            "translation": await language_service.atranslate_message(
+                                data["source_language"] if force_src_lang
+                                    else await language_service.aclassify_language(data["message"]),
+                                data["target_language"],
+                                data["message"]
+                            ),
+                            "target_language": data["target_language"],
+                            "status": "success",
+                        }
+                    except KeyError as exc:
+                        result = {
+                            "status": "error",
+                            "reason": str(exc)
+                        }
+                        status = 404
+                    except InferenceUnavailableError as exc:
+                        result = {
+                            "status": "error",
+                            "reason": str(exc)
+                        }
+                        status = 503
+                    capture.status = status
+            if settings.DEBUG and status == 200:
+                result["timings"] = timings
     return JsonResponse(data=result, status=status)